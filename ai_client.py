@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import random
+from functools import lru_cache
+
+import anthropic
+import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CLAUDE_MAX_RETRIES = 2
+CLAUDE_TIMEOUT = 60.0
+# Hard per-attempt deadline: Claude latency has a long tail, and cutting slow
+# attempts off just above the typical response time and retrying beats waiting
+CLAUDE_REQUEST_TIMEOUT = float(os.getenv("CLAUDE_REQUEST_TIMEOUT", "30"))
+
+# One keep-alive pool per process: TLS sessions are reused across Claude calls
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0)
+HTTP_TIMEOUT = httpx.Timeout(CLAUDE_TIMEOUT, connect=5.0, write=10.0, pool=5.0)
+# The sync client (used from background analyzers) gets the cutoff as its read
+# timeout; the SDK retries timed-out requests up to max_retries times
+SYNC_HTTP_TIMEOUT = httpx.Timeout(CLAUDE_REQUEST_TIMEOUT, connect=5.0, write=10.0, pool=5.0)
+
+@lru_cache(maxsize=1)
+def get_anthropic_client():
+    """Shared Anthropic client (one connection pool for the whole process).
+
+    Returns None when ANTHROPIC_API_KEY is not configured.
+    """
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        return None
+    return anthropic.Anthropic(
+        api_key=api_key,
+        max_retries=CLAUDE_MAX_RETRIES,
+        http_client=httpx.Client(limits=HTTP_LIMITS, timeout=SYNC_HTTP_TIMEOUT)
+    )
+
+@lru_cache(maxsize=1)
+def _get_async_http_client():
+    return httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+@lru_cache(maxsize=1)
+def get_async_anthropic_client():
+    """Async counterpart of get_anthropic_client() for the async endpoints"""
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        return None
+    return anthropic.AsyncAnthropic(
+        api_key=api_key,
+        max_retries=CLAUDE_MAX_RETRIES,
+        http_client=_get_async_http_client()
+    )
+
+def new_async_anthropic_client():
+    """Standalone async client for code running its own event loop (asyncio.run
+    in a background thread): httpx async pools must not be shared across loops.
+    Use it as `async with new_async_anthropic_client() as client:`.
+    """
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        return None
+    return anthropic.AsyncAnthropic(
+        api_key=api_key,
+        max_retries=CLAUDE_MAX_RETRIES,
+        http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    )
+
+async def prewarm_async_anthropic_client():
+    """Open a pooled connection to the API so the first analysis skips the TLS handshake"""
+    client = get_async_anthropic_client()
+    if client is None:
+        return
+    try:
+        await _get_async_http_client().head(str(client.base_url))
+    except httpx.HTTPError as e:
+        logger.warning("Could not pre-warm Anthropic connection: %s", e)
+
+def parse_json_response(text: str):
+    """JSON object or array from a Claude answer, tolerating ```json fences or
+    prose around it. Raises ValueError (orjson.JSONDecodeError) otherwise."""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    if not starts:
+        raise ValueError("no JSON found in the response")
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    return orjson.loads(text[start:end + 1])
+
+async def create_message(client=None, **kwargs):
+    """messages.create on an async client with a hard deadline per attempt.
+
+    Slow attempts are abandoned after CLAUDE_REQUEST_TIMEOUT seconds and retried
+    with jittered backoff; asyncio.TimeoutError is raised once retries run out.
+    Uses the shared server client unless `client` is given.
+    """
+    client = client or get_async_anthropic_client()
+    for attempt in range(CLAUDE_MAX_RETRIES + 1):
+        try:
+            return await asyncio.wait_for(client.messages.create(**kwargs), timeout=CLAUDE_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            if attempt == CLAUDE_MAX_RETRIES:
+                raise
+            logger.warning("Claude call exceeded %ss (attempt %s), retrying", CLAUDE_REQUEST_TIMEOUT, attempt + 1)
+            await asyncio.sleep(random.uniform(0.5, 1.5) * (attempt + 1))
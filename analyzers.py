@@ -0,0 +1,54 @@
+from functools import lru_cache
+
+# Lazily built, process-wide AI analyzer singletons. Each analyzer (and its
+# module) is only loaded the first time a route or job needs it.
+
+@lru_cache(maxsize=1)
+def get_gem_detector():
+    from gem_detector import HiddenGemDetector
+    return HiddenGemDetector()
+
+@lru_cache(maxsize=1)
+def get_photo_analyzer():
+    from photo_analyzer import AIPhotoAnalyzer
+    return AIPhotoAnalyzer()
+
+@lru_cache(maxsize=1)
+def get_description_parser():
+    from description_parser import IntelligentDescriptionParser
+    return IntelligentDescriptionParser()
+
+@lru_cache(maxsize=1)
+def get_negotiation_assistant():
+    from negotiation_assistant import NegotiationAssistantPro
+    return NegotiationAssistantPro()
+
+@lru_cache(maxsize=1)
+def get_vin_decoder():
+    from vin_decoder import VINDecoderHistoryBuilder
+    return VINDecoderHistoryBuilder()
+
+@lru_cache(maxsize=1)
+def get_market_predictor():
+    from market_pulse_predictor import MarketPulsePredictor
+    return MarketPulsePredictor()
+
+@lru_cache(maxsize=1)
+def get_sentiment_analyzer():
+    from social_sentiment_analyzer import SocialSentimentAnalyzer
+    return SocialSentimentAnalyzer()
+
+@lru_cache(maxsize=1)
+def get_comparison_engine():
+    from smart_comparison_engine import SmartComparisonEngine
+    return SmartComparisonEngine()
+
+@lru_cache(maxsize=1)
+def get_maintenance_prophet():
+    from maintenance_cost_prophet import MaintenanceCostProphet
+    return MaintenanceCostProphet()
+
+@lru_cache(maxsize=1)
+def get_investment_scorer():
+    from investment_grade_scorer import InvestmentGradeScorer
+    return InvestmentGradeScorer()
@@ -0,0 +1,95 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# Makes seen on French listings, keyed by their normalized (lowercase, no
+# accents) spelling. Two-word makes are tried before single words.
+KNOWN_MAKES = {
+    "alfa romeo": "Alfa Romeo", "aston martin": "Aston Martin", "land rover": "Land Rover",
+    "mercedes benz": "Mercedes", "mercedes": "Mercedes", "alfa": "Alfa Romeo",
+    "renault": "Renault", "peugeot": "Peugeot", "citroen": "Citroën", "ds": "DS", "dacia": "Dacia",
+    "alpine": "Alpine", "volkswagen": "Volkswagen", "vw": "Volkswagen", "audi": "Audi", "bmw": "BMW",
+    "mini": "Mini", "porsche": "Porsche", "opel": "Opel", "ford": "Ford", "fiat": "Fiat",
+    "abarth": "Abarth", "lancia": "Lancia", "seat": "Seat", "cupra": "Cupra", "skoda": "Skoda",
+    "toyota": "Toyota", "lexus": "Lexus", "honda": "Honda", "nissan": "Nissan", "mazda": "Mazda",
+    "mitsubishi": "Mitsubishi", "suzuki": "Suzuki", "subaru": "Subaru", "hyundai": "Hyundai",
+    "kia": "Kia", "volvo": "Volvo", "jeep": "Jeep", "jaguar": "Jaguar", "tesla": "Tesla",
+    "smart": "Smart", "mg": "MG", "ferrari": "Ferrari", "lamborghini": "Lamborghini",
+    "maserati": "Maserati", "lotus": "Lotus", "chevrolet": "Chevrolet", "dodge": "Dodge",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _normalize(word: str) -> str:
+    """Lowercase, accents stripped, punctuation as spaces ("Mercedes-Benz" -> "mercedes benz")"""
+    word = unicodedata.normalize("NFKD", word).encode("ascii", "ignore").decode().lower()
+    return " ".join(_WORD.findall(word))
+
+def parse_make_model(title: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(make, model) from a listing title, or (None, None) when no known make appears.
+
+    "Tres belle Renault Clio 1.5 dCi" -> ("Renault", "Clio")
+    """
+    if not title:
+        return None, None
+
+    original_words = re.findall(r"[\w.+-]+", title)
+    words = [_normalize(word) for word in original_words]
+    for i in range(len(words)):
+        for length in (2, 1):
+            key = " ".join(words[i:i + length])
+            if i + length <= len(words) and key in KNOWN_MAKES:
+                rest = original_words[i + length:]
+                model = rest[0] if rest else None
+                if model and model.isalpha():
+                    model = model.capitalize()  # "CLIO" / "clio" -> "Clio"
+                return KNOWN_MAKES[key], model
+    return None, None
+
+def car_make_model(car) -> str:
+    """"Make Model" key used by the market and sentiment tables"""
+    if car.make:
+        return f"{car.make} {car.model}" if car.model else car.make
+    return " ".join(car.title.split()[0:2])  # no known make: approximate from the title
+
+def brand_key(make_model: str) -> str:
+    """Lowercase make of a "Make Model" key ("Alfa Romeo Giulia" -> "alfa romeo")"""
+    make, _ = parse_make_model(make_model)
+    return (make or make_model.split()[0]).lower()
+
+# Words that would only add useless LIKE clauses to a title search
+_STOPWORDS = frozenset({"de", "la", "le", "les", "du", "et"})
+
+@lru_cache(maxsize=2048)
+def _parse_key(make_model: str) -> Tuple[Optional[str], Optional[str]]:
+    """parse_make_model for "Make Model" keys, which recur across calls"""
+    return parse_make_model(make_model)
+
+@lru_cache(maxsize=2048)
+def _search_terms(make_model: str) -> tuple:
+    """Lowercase words of a key to find in titles, stopwords and single letters dropped"""
+    words = make_model.lower().split()
+    return tuple(word for word in words if word not in _STOPWORDS and len(word) > 1) or tuple(words)
+
+def make_model_filters(make_model: str) -> list:
+    """WHERE conditions selecting the cars of a "Make Model" key.
+
+    Keys with a known make compare the indexed make/model columns; anything
+    else falls back to matching every word in the lowercased title (trigram
+    indexed on Postgres).
+    """
+    from enhanced_database import Car
+
+    make, model = _parse_key(make_model)
+    if make:
+        return [Car.make == make, Car.model == model] if model else [Car.make == make]
+    return [Car.title_lower.like(f"%{term}%") for term in _search_terms(make_model)]
+
+def make_model_matcher(make_model: str):
+    """Python twin of make_model_filters: predicate(make, model, title_lower) -> bool"""
+    make, model = _parse_key(make_model)
+    if make:
+        return lambda car_make, car_model, _: car_make == make and (not model or car_model == model)
+    terms = _search_terms(make_model)
+    return lambda _, __, title_lower: bool(title_lower) and all(term in title_lower for term in terms)
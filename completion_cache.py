@@ -0,0 +1,64 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import orjson
+
+from response_cache import REDIS_URL, sync_redis
+
+logger = logging.getLogger(__name__)
+
+# Persistent cache of Claude completions keyed by a hash of the model and
+# prompt, so re-running an analysis on unchanged input skips the API call.
+# Redis when REDIS_URL is set (shared by the API and the worker), otherwise a
+# local SQLite file.
+COMPLETION_TTL = 30 * 86400  # seconds
+# Only completions that took at least this long are worth storing
+MIN_CACHED_ELAPSED = 0.2
+CACHE_PATH = os.getenv("AI_CACHE_PATH", ".cache/ai_completions.sqlite")
+KEY_PREFIX = "auto:completion:"
+
+def completion_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt.strip()}".encode()).hexdigest()
+
+def _connect():
+    os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=5)
+    conn.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+    return conn
+
+def get_completion(key: str):
+    """Cached result for a key, or None"""
+    try:
+        if REDIS_URL:
+            value = sync_redis().get(KEY_PREFIX + key)
+        else:
+            with closing(_connect()) as conn:
+                row = conn.execute(
+                    "SELECT value FROM completions WHERE key = ? AND expires > ?", (key, time.time())
+                ).fetchone()
+            value = row[0] if row else None
+    except Exception as e:
+        logger.warning("Completion cache read failed: %s", e)
+        return None
+    return orjson.loads(value) if value is not None else None
+
+def set_completion(key: str, result, elapsed: float):
+    """Store a result that took `elapsed` seconds to produce (cheap ones are skipped)"""
+    if elapsed < MIN_CACHED_ELAPSED:
+        return
+    value = orjson.dumps(result)
+    try:
+        if REDIS_URL:
+            sync_redis().setex(KEY_PREFIX + key, COMPLETION_TTL, value)
+        else:
+            with closing(_connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, expires) VALUES (?, ?, ?)",
+                    (key, value, time.time() + COMPLETION_TTL)
+                )
+    except Exception as e:
+        logger.warning("Completion cache write failed: %s", e)
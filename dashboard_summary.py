@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, or_
+from sqlalchemy.orm import Session
+from enhanced_database import Car, DashboardSummary, upsert
+from car_models import car_make_model
+from analyzers import get_market_predictor, get_sentiment_analyzer
+
+# Market and sentiment inputs are per make/model and refresh on their own
+# schedule, so a stored summary is only trusted for this long
+DASHBOARD_SUMMARY_TTL = timedelta(hours=6)
+
+# (input, condition, bucket, message) checked in order; a callable message
+# is formatted from the input. Inputs that are missing are skipped.
+SUMMARY_RULES = (
+    ("gem", lambda gem: gem.gem_score > 75, "key_insights",
+     lambda gem: f" Ppite dtecte - Score: {gem.gem_score}/100"),
+    ("gem", lambda gem: gem.gem_score < 40, "risk_factors", "Prix potentiellement lev pour le march"),
+    ("parsed", lambda parsed: parsed.seller_credibility and parsed.seller_credibility > 80, "key_insights",
+     " Vendeur crdible avec description dtaille"),
+    ("parsed", lambda parsed: parsed.seller_credibility and parsed.seller_credibility < 50, "risk_factors",
+     " Description peu crdible ou incomplte"),
+    ("parsed", lambda parsed: parsed.red_flags and len(parsed.red_flags) > 2, "risk_factors",
+     lambda parsed: f" {len(parsed.red_flags)} signaux d'alarme dtects"),
+    ("market", lambda market: market.get("current_trend") == "falling", "opportunities",
+     " March en baisse - Opportunit d'achat"),
+    ("market", lambda market: market.get("current_trend") == "rising", "risk_factors",
+     " March en hausse - Prix pourraient augmenter"),
+    ("sentiment", lambda sentiment: sentiment.get("overall_sentiment", 0) > 0.3, "key_insights",
+     " Modle trs apprci par les propritaires"),
+    ("sentiment", lambda sentiment: sentiment.get("overall_sentiment", 0) < -0.2, "risk_factors",
+     " Modle avec des avis mitigs"),
+)
+
+def generate_ai_summary(car, gem_analysis, parsed_desc, market_insights, sentiment_insights):
+    """Generate AI summary for the dashboard"""
+    summary = {
+        "overall_recommendation": "neutral",
+        "key_insights": [],
+        "risk_factors": [],
+        "opportunities": []
+    }
+    inputs = {
+        "gem": gem_analysis,
+        "parsed": parsed_desc,
+        "market": market_insights if market_insights and "message" not in market_insights else None,
+        "sentiment": sentiment_insights if sentiment_insights and "message" not in sentiment_insights else None,
+    }
+
+    risks = positives = 0
+    for name, condition, bucket, message in SUMMARY_RULES:
+        value = inputs[name]
+        if value and condition(value):
+            summary[bucket].append(message(value) if callable(message) else message)
+            if bucket == "risk_factors":
+                risks += 1
+            else:
+                positives += 1
+
+    # Overall recommendation logic (a gem score above 75 is a buy)
+    if gem_analysis and gem_analysis.gem_score > 75:
+        summary["overall_recommendation"] = "buy"
+    if risks > positives:
+        summary["overall_recommendation"] = "avoid"
+    elif positives > risks and summary["overall_recommendation"] != "buy":
+        summary["overall_recommendation"] = "consider"
+
+    return summary
+
+def is_summary_fresh(row):
+    return row is not None and row.updated_at and datetime.utcnow() - row.updated_at < DASHBOARD_SUMMARY_TTL
+
+def save_dashboard_summary(car_id: str, summary: dict, db: Session):
+    """Store the summary for a car (caller commits)"""
+    upsert(db, DashboardSummary, {
+        "car_id": car_id,
+        "summary": summary,
+        "updated_at": datetime.utcnow()
+    }, ["car_id"])
+
+def refresh_dashboard_summary(car, db: Session):
+    """Recompute and store a car's summary after one of its input analyses was written"""
+    db.expire(car, ["gem", "parsed"])
+    make_model = car_make_model(car)
+    summary = generate_ai_summary(
+        car, car.gem, car.parsed,
+        get_market_predictor().get_market_insights(make_model, db),
+        get_sentiment_analyzer().get_sentiment_insights(make_model, db)
+    )
+    save_dashboard_summary(car.id, summary, db)
+    db.commit()
+    return summary
+
+def invalidate_dashboard_summaries(db: Session, make_model: Optional[str] = None):
+    """Drop stored summaries (all, or those of one make/model); they are rebuilt on next read"""
+    stmt = DashboardSummary.__table__.delete()
+    if make_model:
+        stmt = stmt.where(DashboardSummary.car_id.in_(
+            select(Car.id).where(or_(
+                (Car.make + " " + Car.model).ilike(make_model),
+                Car.make.ilike(make_model),
+                Car.title.ilike(f"{make_model}%")  # cars without a parsed make
+            ))
+        ))
+    db.execute(stmt)
+    db.commit()
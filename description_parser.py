@@ -1,11 +1,17 @@
+import asyncio
 import re
-import json
 from datetime import datetime, timedelta
 import anthropic
 import os
 from sqlalchemy.orm import Session
 from enhanced_database import Car, ParsedListing
 import uuid
+from ai_client import create_message, new_async_anthropic_client, parse_json_response
+
+# Listings packed into one Claude call by the bulk parser: large enough to cut
+# round-trips ~8x, small enough to keep the answer well under the output limit
+DESCRIPTION_BATCH_SIZE = 8
+BATCH_MAX_TOKENS = 4096
 
 class IntelligentDescriptionParser:
     def __init__(self):
@@ -73,24 +79,9 @@ class IntelligentDescriptionParser:
         if not car.description:
             return {"error": "No description available"}
         
-        # Use Claude for intelligent parsing
+        # Use Claude for intelligent parsing, regex patterns as backup/supplement
         claude_analysis = self._claude_parse_description(car)
-        
-        # Use regex patterns as backup/supplement
-        pattern_analysis = self._pattern_parse_description(car)
-        
-        # Combine results
-        combined_analysis = self._combine_analyses(claude_analysis, pattern_analysis)
-        
-        # Calculate credibility score
-        credibility_score = self._calculate_seller_credibility(car, combined_analysis)
-        combined_analysis["seller_credibility"] = credibility_score
-        
-        # Identify missing information
-        missing_info = self._identify_missing_information(car, combined_analysis)
-        combined_analysis["missing_information"] = missing_info
-        
-        return combined_analysis
+        return self._finish_analysis(car, claude_analysis)
 
     def _claude_parse_description(self, car: Car) -> dict:
         """Use Claude to intelligently parse the description"""
@@ -98,7 +89,21 @@ class IntelligentDescriptionParser:
             return self._fallback_parsing(car)
         
         try:
-            prompt = f"""
+            message = self.anthropic_client.messages.create(
+                model="claude-3-sonnet-20240229",
+                max_tokens=1000,
+                messages=[{"role": "user", "content": self._build_description_prompt(car)}]
+            )
+            
+            analysis_text = message.content[0].text
+            return parse_json_response(analysis_text)
+            
+        except Exception as e:
+            print(f"Claude parsing error: {e}")
+            return self._fallback_parsing(car)
+
+    def _build_description_prompt(self, car: Car) -> str:
+        return f"""
             Analysez cette description de voiture française en détail et extrayez les informations structurées.
 
             Titre: {car.title}
@@ -122,19 +127,70 @@ class IntelligentDescriptionParser:
 
             Soyez précis et objectif. Répondez uniquement en JSON valide français.
             """
-            
-            message = self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            analysis_text = message.content[0].text
-            return json.loads(analysis_text)
-            
+
+    def _build_batch_prompt(self, cars: list) -> str:
+        listings = "\n\n".join(
+            f"""[{index}]
+            Titre: {car.title}
+            Description: {car.description}
+            Prix: {car.price}€
+            Année: {car.year}
+            Kilométrage: {car.mileage} km
+            Type vendeur: {car.seller_type}"""
+            for index, car in enumerate(cars, 1)
+        )
+        return f"""
+            Analysez ces {len(cars)} descriptions de voitures françaises et extrayez les informations structurées de chacune.
+
+            {listings}
+
+            Pour chaque annonce, extrayez en JSON:
+            1. service_history: Historique d'entretien avec dates et détails
+            2. detected_options: Liste complète des équipements mentionnés
+            3. red_flags: Signaux d'alarme ou problèmes mentionnés
+            4. positive_signals: Points positifs et assurances du vendeur
+            5. ownership_info: Informations sur la propriété (nb propriétaires, usage)
+            6. condition_assessment: Évaluation de l'état général
+            7. seller_motivation: Niveau de motivation du vendeur (1-10)
+            8. honesty_indicators: Indicateurs d'honnêteté dans la description
+            9. hidden_costs: Coûts cachés ou travaux à prévoir mentionnés
+            10. negotiation_leverage: Points qui donnent du pouvoir de négociation
+
+            Répondez uniquement par un tableau JSON valide de {len(cars)} objets, dans l'ordre des annonces.
+            """
+
+    def _read_batch_response(self, analysis_text: str, cars: list) -> list:
+        """Decode the JSON array answer; a malformed answer falls back to patterns for the whole batch"""
+        analyses = parse_json_response(analysis_text)
+        if not isinstance(analyses, list) or len(analyses) != len(cars):
+            raise ValueError(f"expected a JSON array of {len(cars)} analyses")
+        return [analysis if isinstance(analysis, dict) else self._fallback_parsing(car)
+                for car, analysis in zip(cars, analyses)]
+
+    async def _claude_parse_batch_async(self, cars: list, client, limiter: "_RequestLimiter") -> list:
+        """Parse several descriptions with a single Claude call; raw analyses in `cars` order"""
+        if not client:
+            return [self._fallback_parsing(car) for car in cars]
+        
+        try:
+            async with limiter:
+                message = await create_message(
+                    client,
+                    model="claude-3-sonnet-20240229",
+                    max_tokens=BATCH_MAX_TOKENS,
+                    messages=[{"role": "user", "content": self._build_batch_prompt(cars)}]
+                )
+            return self._read_batch_response(message.content[0].text, cars)
         except Exception as e:
-            print(f"Claude parsing error: {e}")
-            return self._fallback_parsing(car)
+            print(f"Claude batch parsing error for {len(cars)} cars: {e}")
+            return [self._fallback_parsing(car) for car in cars]
+
+    def _finish_analysis(self, car: Car, claude_analysis: dict) -> dict:
+        """Merge Claude output with pattern matching and add the derived scores"""
+        combined_analysis = self._combine_analyses(claude_analysis, self._pattern_parse_description(car))
+        combined_analysis["seller_credibility"] = self._calculate_seller_credibility(car, combined_analysis)
+        combined_analysis["missing_information"] = self._identify_missing_information(car, combined_analysis)
+        return combined_analysis
 
     def _pattern_parse_description(self, car: Car) -> dict:
         """Parse description using regex patterns"""
@@ -388,35 +444,99 @@ class IntelligentDescriptionParser:
         analysis = self.parse_description(car)
         
         if "error" not in analysis:
-            # Save or update
-            if existing:
-                existing.parsed_data = analysis
-                existing.service_history = analysis.get("service_history", [])
-                existing.detected_options = analysis.get("detected_options", [])
-                existing.red_flags = analysis.get("red_flags", [])
-                existing.positive_signals = analysis.get("positive_signals", [])
-                existing.seller_credibility = analysis.get("seller_credibility", 50)
-                existing.missing_information = analysis.get("missing_information", [])
-                existing.parsed_at = datetime.utcnow()
-            else:
-                parsed_listing = ParsedListing(
-                    car_id=car.id,
-                    raw_description=car.description,
-                    parsed_data=analysis,
-                    service_history=analysis.get("service_history", []),
-                    detected_options=analysis.get("detected_options", []),
-                    red_flags=analysis.get("red_flags", []),
-                    positive_signals=analysis.get("positive_signals", []),
-                    seller_credibility=analysis.get("seller_credibility", 50),
-                    missing_information=analysis.get("missing_information", []),
-                    parser_version="1.0"
-                )
-                db.add(parsed_listing)
-            
+            self._save_analysis(car, analysis, existing, db)
             db.commit()
         
         return analysis
 
+    async def parse_and_save_many(self, cars: list, db: Session, max_concurrency: int = 10,
+                                  rate_limit: float = None, batch_size: int = DESCRIPTION_BATCH_SIZE) -> dict:
+        """Parse many descriptions concurrently and save them in one commit.
+
+        Descriptions are packed `batch_size` per Claude call; at most
+        `max_concurrency` calls are in flight, and at most `rate_limit`
+        calls are started per second when set.
+        Returns {car_id: analysis} for the cars that had a description.
+        """
+        cars = [car for car in cars if car.description]
+        if not cars:
+            return {}
+        
+        limiter = _RequestLimiter(max_concurrency, rate_limit)
+        client = new_async_anthropic_client() if self.anthropic_client else None
+        try:
+            batches = [cars[i:i + batch_size] for i in range(0, len(cars), batch_size)]
+            batch_results = await asyncio.gather(
+                *(self._claude_parse_batch_async(batch, client, limiter) for batch in batches)
+            )
+            claude_analyses = [analysis for batch in batch_results for analysis in batch]
+        finally:
+            if client:
+                await client.close()
+        
+        existing_rows = {
+            row.car_id: row for row in db.query(ParsedListing).filter(
+                ParsedListing.car_id.in_([car.id for car in cars])
+            )
+        }
+        
+        results = {}
+        for car, claude_analysis in zip(cars, claude_analyses):
+            analysis = self._finish_analysis(car, claude_analysis)
+            self._save_analysis(car, analysis, existing_rows.get(car.id), db)
+            results[car.id] = analysis
+        
+        db.commit()
+        return results
+
+    def _save_analysis(self, car: Car, analysis: dict, existing: ParsedListing, db: Session):
+        """Insert or update the ParsedListing row (caller commits)"""
+        if existing:
+            existing.parsed_data = analysis
+            existing.service_history = analysis.get("service_history", [])
+            existing.detected_options = analysis.get("detected_options", [])
+            existing.red_flags = analysis.get("red_flags", [])
+            existing.positive_signals = analysis.get("positive_signals", [])
+            existing.seller_credibility = analysis.get("seller_credibility", 50)
+            existing.missing_information = analysis.get("missing_information", [])
+            existing.parsed_at = datetime.utcnow()
+        else:
+            parsed_listing = ParsedListing(
+                car_id=car.id,
+                raw_description=car.description,
+                parsed_data=analysis,
+                service_history=analysis.get("service_history", []),
+                detected_options=analysis.get("detected_options", []),
+                red_flags=analysis.get("red_flags", []),
+                positive_signals=analysis.get("positive_signals", []),
+                seller_credibility=analysis.get("seller_credibility", 50),
+                missing_information=analysis.get("missing_information", []),
+                parser_version="1.0"
+            )
+            db.add(parsed_listing)
+
+class _RequestLimiter:
+    """Caps concurrent Claude calls and, optionally, how many start per second"""
+    
+    def __init__(self, max_concurrency: int, rate_limit: float = None):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._interval = 1.0 / rate_limit if rate_limit else 0.0
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+    
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._interval:
+            async with self._lock:
+                loop = asyncio.get_running_loop()
+                delay = self._next_start - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._next_start = max(loop.time(), self._next_start) + self._interval
+    
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
 if __name__ == "__main__":
     from enhanced_database import SessionLocal
     
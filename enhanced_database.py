@@ -1,16 +1,75 @@
-from sqlalchemy import create_engine, Column, String, Integer, Boolean, DateTime, Text, Float
+from sqlalchemy import create_engine, bindparam, event, inspect, text, update, Column, String, Integer, Boolean, DateTime, Text, Float, JSON, Index
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship, deferred
 from datetime import datetime
+import logging
 import os
+import orjson
+
+from car_models import parse_make_model, brand_key
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cars.db")
 
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# pre_ping + recycle drop connections killed by Postgres or the Railway proxy.
+ENGINE_OPTIONS = {
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+    # JSON/JSONB columns are encoded and decoded with orjson
+    "json_serializer": lambda value: orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode(),
+    "json_deserializer": orjson.loads,
+}
+
+# Connection budget: every process (each uvicorn worker and the arq worker)
+# holds up to size + overflow connections per engine, 12 sync + 10 async by
+# default. Keep (WEB_CONCURRENCY + 1) x that under Postgres max_connections
+# (100 by default). The sync pool serves the analyzer threads (a full
+# analysis stage runs 7 steps at once), the async one the async endpoints.
+def _pool_options(prefix: str, size: int, overflow: int) -> dict:
+    """QueuePool sizing read from {prefix}_POOL_SIZE / {prefix}_MAX_OVERFLOW.
+
+    Only for server databases: SQLite keeps SQLAlchemy's default pools
+    (aiosqlite gets a NullPool, which rejects these arguments).
+    """
+    if DATABASE_URL.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv(f"{prefix}_POOL_SIZE", str(size))),
+        "max_overflow": int(os.getenv(f"{prefix}_MAX_OVERFLOW", str(overflow))),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "5")),
+        "pool_use_lifo": True,
+    }
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    **ENGINE_OPTIONS, **_pool_options("DB", 8, 4)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# For GET handlers that only read: nothing to flush, and loaded objects stay
+# usable after the request's session is closed
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+def _async_database_url(url):
+    """Same database, driven by the asyncio drivers (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+# Used by the async API endpoints; background jobs and analyzers keep SessionLocal
+async_engine = create_async_engine(
+    _async_database_url(DATABASE_URL), **ENGINE_OPTIONS, **_pool_options("DB_ASYNC", 5, 5)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -21,24 +80,57 @@ class Car(Base):
     id = Column(String, primary_key=True, index=True)
     source = Column(String, default="leboncoin")
     title = Column(String, nullable=False)
+    make = Column(String)  # parsed from the title on insert, see _set_make_model
+    model = Column(String)
+    title_lower = Column(String)  # lowercased title for the keyword LIKE filters, see _set_make_model
     price = Column(Integer)
     year = Column(Integer)
     mileage = Column(Integer)
     fuel_type = Column(String)
     description = Column(Text)
-    images = Column(Text)  # JSON array as string
+    images = Column(JSON().with_variant(JSONB, "postgresql"))  # list of image URLs
+    image_count = Column(Integer, default=0)  # len(images), see _set_make_model
     url = Column(String, unique=True)
     seller_type = Column(String)
     department = Column(String)
     first_seen = Column(DateTime, default=datetime.utcnow)
     last_seen = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    
+    # Per-car AI results, keyed by car_id (no FK constraints in this schema).
+    # Lazy by default; endpoints that need them ask for joinedload/selectinload.
+    gem = relationship("GemScore", primaryjoin="Car.id == foreign(GemScore.car_id)", uselist=False, viewonly=True)
+    parsed = relationship("ParsedListing", primaryjoin="Car.id == foreign(ParsedListing.car_id)", uselist=False, viewonly=True)
+    analysis = relationship("Analysis", primaryjoin="Car.id == foreign(Analysis.car_id)", uselist=False, viewonly=True)
+    photos = relationship("PhotoAnalysis", primaryjoin="Car.id == foreign(PhotoAnalysis.car_id)",
+                          order_by="PhotoAnalysis.analyzed_at", viewonly=True)
+    dashboard_summary = relationship("DashboardSummary", primaryjoin="Car.id == foreign(DashboardSummary.car_id)",
+                                     uselist=False, viewonly=True)
+    
+    __table_args__ = (
+        # Listing filters of /api/cars
+        Index("ix_cars_active_department_price", "is_active", "department", "price"),
+        Index("ix_cars_make_model", "make", "model"),
+        # MAX(first_seen) of scraper_status (and newest-first scans) read the index tail
+        Index("ix_cars_first_seen", "first_seen"),
+    )
+
+@event.listens_for(Car, "before_insert")
+@event.listens_for(Car, "before_update")
+def _set_make_model(mapper, connection, car):
+    """Every ingest path (scrapers, sample data) gets make/model parsed from the title,
+    and the derived title_lower / image_count columns"""
+    if car.title and not car.make:
+        car.make, car.model = parse_make_model(car.title)
+    if car.title:
+        car.title_lower = car.title.lower()
+    car.image_count = len(car.images or [])
 
 class Analysis(Base):
     __tablename__ = "analyses"
     
     id = Column(String, primary_key=True, index=True)
-    car_id = Column(String, nullable=False)
+    car_id = Column(String, nullable=False, unique=True, index=True)  # one cached analysis per car
     analysis_data = Column(Text)  # JSON string
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -48,9 +140,9 @@ class GemScore(Base):
     
     car_id = Column(String, primary_key=True)
     gem_score = Column(Integer)  # 0-100
-    reasons = Column(Text)  # JSON as text
+    reasons = Column(JSON().with_variant(JSONB, "postgresql"))
     profit_potential = Column(Integer)
-    risk_factors = Column(Text)  # JSON as text
+    risk_factors = Column(JSON().with_variant(JSONB, "postgresql"))
     market_position = Column(String)  # "undervalued", "fair", "overpriced"
     confidence_level = Column(Float)  # 0.0-1.0
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -69,6 +161,11 @@ class PhotoAnalysis(Base):
     honesty_score = Column(Float)  # How honest the photos are
     analyzed_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest result per car: WHERE car_id = ? ORDER BY analyzed_at DESC LIMIT 1
+        Index("ix_photo_analysis_car_analyzed", car_id, analyzed_at.desc()),
+    )
+
 # FEATURE 3: Intelligent Description Parser
 class ParsedListing(Base):
     __tablename__ = "parsed_listings"
@@ -99,6 +196,11 @@ class NegotiationStrategy(Base):
     cultural_approach = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest result per car: WHERE car_id = ? ORDER BY created_at DESC LIMIT 1
+        Index("ix_negotiation_strategies_car_created", car_id, created_at.desc()),
+    )
+
 class NegotiationOutcome(Base):
     __tablename__ = "negotiation_outcomes"
     
@@ -137,26 +239,36 @@ class VehicleHistory(Base):
     authenticity_score = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest result per car: WHERE car_id = ? ORDER BY created_at DESC LIMIT 1
+        Index("ix_vehicle_history_car_created", car_id, created_at.desc()),
+    )
+
 # FEATURE 6: Market Pulse Predictor
 class MarketPulse(Base):
     __tablename__ = "market_pulse"
     
     id = Column(String, primary_key=True)
-    make_model = Column(String, nullable=False)
+    make_model = Column(String, nullable=False)  # unique index below
     current_trend = Column(String)  # "rising", "stable", "falling"
-    price_prediction = Column(Text)  # JSON as text  # 3, 6, 12 month forecasts
-    seasonal_factors = Column(Text)  # JSON as text
+    price_prediction = Column(JSON().with_variant(JSONB, "postgresql"))  # 3, 6, 12 month forecasts
+    seasonal_factors = Column(JSON().with_variant(JSONB, "postgresql"))
     market_saturation = Column(Float)
     demand_score = Column(Integer)  # 0-100
     created_at = Column(DateTime, default=datetime.utcnow)
     valid_until = Column(DateTime)
+    
+    __table_args__ = (
+        # One current pulse per make/model, refreshed in place (upsert target)
+        Index("uq_market_pulse_make_model", "make_model", unique=True),
+    )
 
 # FEATURE 7: Social Sentiment Analyzer
 class SocialSentiment(Base):
     __tablename__ = "social_sentiment"
     
     id = Column(String, primary_key=True)
-    make_model = Column(String, nullable=False)
+    make_model = Column(String, nullable=False, index=True)
     platform = Column(String)  # "forums", "social", "reviews"
     sentiment_score = Column(Float)  # -1.0 to 1.0
     reputation_data = Column(Text)  # JSON as text
@@ -177,6 +289,11 @@ class CarComparison(Base):
     recommendation_reason = Column(Text)
     generated_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest result per car: WHERE base_car_id = ? ORDER BY generated_at DESC LIMIT 1
+        Index("ix_car_comparisons_car_generated", base_car_id, generated_at.desc()),
+    )
+
 # FEATURE 9: Maintenance Cost Prophet
 class MaintenancePrediction(Base):
     __tablename__ = "maintenance_predictions"
@@ -184,14 +301,21 @@ class MaintenancePrediction(Base):
     id = Column(String, primary_key=True)
     car_id = Column(String, nullable=False)
     make_model = Column(String, nullable=False)
-    predicted_costs = Column(Text)  # JSON as text  # 1-5 year projections
-    maintenance_schedule = Column(Text)  # JSON as text
-    common_repairs = Column(Text)  # JSON as text
+    brand = Column(String, index=True)  # brand_key(make_model), grouped on by the brand comparison
+    # Large JSON payloads, only loaded when read (or undefer()'d)
+    predicted_costs = deferred(Column(Text))  # JSON as text  # 1-5 year projections
+    maintenance_schedule = deferred(Column(Text))  # JSON as text
+    common_repairs = deferred(Column(Text))  # JSON as text
     parts_availability = Column(String)
     total_5year_cost = Column(Integer)
     reliability_grade = Column(String)  # A, B, C, D, F
     calculated_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest result per car: WHERE car_id = ? ORDER BY calculated_at DESC LIMIT 1
+        Index("ix_maintenance_predictions_car_calculated", car_id, calculated_at.desc()),
+    )
+
 # FEATURE 10: Investment Grade Scorer
 class InvestmentScore(Base):
     __tablename__ = "investment_scores"
@@ -208,6 +332,19 @@ class InvestmentScore(Base):
     hold_recommendation = Column(String)  # "short", "medium", "long"
     calculated_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Latest result per car: WHERE car_id = ? ORDER BY calculated_at DESC LIMIT 1
+        Index("ix_investment_scores_car_calculated", car_id, calculated_at.desc()),
+    )
+
+# AI Dashboard: precomputed summary, refreshed when its input analyses change
+class DashboardSummary(Base):
+    __tablename__ = "dashboard_summaries"
+    
+    car_id = Column(String, primary_key=True)
+    summary = Column(JSON().with_variant(JSONB, "postgresql"))
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 def get_database():
     db = SessionLocal()
     try:
@@ -215,9 +352,186 @@ def get_database():
     finally:
         db.close()
 
+def get_read_database():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_database():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def upsert_statement(dialect, model, values, index_elements, update_columns=None):
+    """INSERT ... ON CONFLICT DO UPDATE for Postgres and SQLite.
+
+    `values` is one row (dict) or a list of rows for a multi-row upsert.
+    `update_columns` defaults to every column in `values` except the conflict keys.
+    """
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(model).values(values)
+    if update_columns is None:
+        columns = values[0] if isinstance(values, list) else values
+        update_columns = [key for key in columns if key not in index_elements]
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+
+def upsert(db, model, values, index_elements, update_columns=None):
+    """Execute an upsert on a sync session"""
+    db.execute(upsert_statement(db.get_bind().dialect.name, model, values, index_elements, update_columns))
+
+# Tables whose unique index replaced a history of rows: (key column, timestamp)
+DEDUPE_BEFORE_UNIQUE_INDEX = {
+    "analyses": ("car_id", "created_at"),
+    "market_pulse": ("make_model", "created_at"),
+}
+
+def _dedupe_latest(conn, table_name):
+    """Keep only the latest row per key so the table's unique index can be built"""
+    key, timestamp = DEDUPE_BEFORE_UNIQUE_INDEX[table_name]
+    conn.execute(text(f"""
+        DELETE FROM {table_name} WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY {timestamp} DESC) AS rn
+                FROM {table_name}
+            ) ranked WHERE rn = 1
+        )
+    """))
+
+def _convert_json_columns(conn, inspector, table):
+    """Postgres keeps legacy TEXT columns as TEXT; cast them to the JSONB type now mapped"""
+    if conn.dialect.name != "postgresql":
+        return  # SQLite stores JSON as text, nothing to convert
+    
+    existing_columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if not isinstance(column.type, JSON) or column.name not in existing_columns:
+            continue
+        if isinstance(existing_columns[column.name]["type"], (JSON, JSONB)):
+            continue
+        conn.execute(text(
+            f'ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE JSONB '
+            f'USING NULLIF({column.name}, \'\')::jsonb'
+        ))
+
+def _add_missing_columns(conn, inspector, table):
+    """ALTER TABLE ... ADD COLUMN for model columns the existing table lacks; returns their names"""
+    existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        added.append(column.name)
+    return added
+
+def _backfill_make_model(conn):
+    """One-time parse of make/model for cars stored before those columns existed"""
+    cars = Car.__table__
+    rows = conn.execute(cars.select().with_only_columns(cars.c.id, cars.c.title)).all()
+    parsed = []
+    for row in rows:
+        make, model = parse_make_model(row.title)
+        if make:
+            parsed.append({"car_id": row.id, "parsed_make": make, "parsed_model": model})
+    if parsed:
+        conn.execute(
+            update(cars).where(cars.c.id == bindparam("car_id"))
+            .values(make=bindparam("parsed_make"), model=bindparam("parsed_model")),
+            parsed
+        )
+
+def _backfill_title_lower(conn):
+    """One-time lowercased title for cars stored before that column existed
+    (lowered in Python, like new rows: SQLite's lower() skips accented letters)"""
+    cars = Car.__table__
+    rows = conn.execute(cars.select().with_only_columns(cars.c.id, cars.c.title)).all()
+    lowered = [{"car_id": row.id, "lowered_title": row.title.lower()} for row in rows if row.title]
+    if lowered:
+        conn.execute(
+            update(cars).where(cars.c.id == bindparam("car_id")).values(title_lower=bindparam("lowered_title")),
+            lowered
+        )
+
+def _backfill_image_count(conn):
+    """One-time image count for cars stored before that column existed"""
+    cars = Car.__table__
+    rows = conn.execute(cars.select().with_only_columns(cars.c.id, cars.c.images)).all()
+    counts = [{"car_id": row.id, "counted_images": len(row.images or [])} for row in rows]
+    if counts:
+        conn.execute(
+            update(cars).where(cars.c.id == bindparam("car_id")).values(image_count=bindparam("counted_images")),
+            counts
+        )
+
+def _create_title_trigram_index():
+    """Postgres: GIN trigram index so unanchored title_lower LIKEs don't scan every car"""
+    if engine.dialect.name != "postgresql":
+        return
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_cars_title_lower_trgm ON cars USING gin (title_lower gin_trgm_ops)"
+            ))
+    except Exception as e:
+        logger.warning("Could not create the title trigram index: %s", e)
+
+def _backfill_prediction_brands(conn):
+    """One-time brand for maintenance predictions stored before that column existed"""
+    predictions = MaintenancePrediction.__table__
+    rows = conn.execute(
+        predictions.select().with_only_columns(predictions.c.id, predictions.c.make_model)
+    ).all()
+    brands = [
+        {"prediction_id": row.id, "prediction_brand": brand_key(row.make_model)}
+        for row in rows if row.make_model and row.make_model.strip()
+    ]
+    if brands:
+        conn.execute(
+            update(predictions).where(predictions.c.id == bindparam("prediction_id"))
+            .values(brand=bindparam("prediction_brand")),
+            brands
+        )
+
+def _upgrade_existing_tables():
+    """create_all() only creates missing tables; bring existing ones up to date"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            
+            _convert_json_columns(conn, inspector, table)
+            added_columns = _add_missing_columns(conn, inspector, table)
+            if table.name == "cars" and "make" in added_columns:
+                _backfill_make_model(conn)
+            if table.name == "cars" and "title_lower" in added_columns:
+                _backfill_title_lower(conn)
+            if table.name == "cars" and "image_count" in added_columns:
+                _backfill_image_count(conn)
+            if table.name == "maintenance_predictions" and "brand" in added_columns:
+                _backfill_prediction_brands(conn)
+            
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                if index.unique and table.name in DEDUPE_BEFORE_UNIQUE_INDEX:
+                    _dedupe_latest(conn, table.name)
+                index.create(bind=conn)
+
 def create_all_tables():
     """Create all tables including new AI features"""
+    _upgrade_existing_tables()
     Base.metadata.create_all(bind=engine)
+    _create_title_trigram_index()
     print("All AI feature tables created successfully!")
 
 if __name__ == "__main__":
@@ -1,11 +1,13 @@
 import re
-import json
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from enhanced_database import Car, GemScore
+from enhanced_database import Car, GemScore, upsert
 import anthropic
 import os
 
+# Rows per multi-row INSERT, keeps statements under SQLite's bound-parameter limit
+GEM_UPSERT_CHUNK = 100
+
 class HiddenGemDetector:
     def __init__(self):
         try:
@@ -173,7 +175,7 @@ class HiddenGemDetector:
             presentation_score -= 5  # Common French errors
         
         # Image quality (if we have images)
-        images = json.loads(car.images) if car.images else []
+        images = car.images or []
         if len(images) < 3:
             presentation_score -= 15  # Too few photos
         elif len(images) < 5:
@@ -351,7 +353,7 @@ class HiddenGemDetector:
         """Identify potential risks"""
         risks = []
         
-        if not car.images or len(json.loads(car.images)) < 3:
+        if not car.images or len(car.images) < 3:
             risks.append("Peu de photos disponibles")
         
         if car.seller_type == "professionnel" and scores["seller_motivation"] > 80:
@@ -393,7 +395,7 @@ class HiddenGemDetector:
         if car.description and len(car.description) > 100:
             confidence += 0.1
         
-        if car.images and len(json.loads(car.images)) > 3:
+        if car.images and len(car.images) > 3:
             confidence += 0.1
         
         # Consistent scores = higher confidence
@@ -405,41 +407,42 @@ class HiddenGemDetector:
 
     async def analyze_all_active_cars(self, db: Session):
         """Analyze all active cars for gems"""
+        # Skip cars already analyzed recently (one query instead of one per car)
+        recent_cutoff = datetime.utcnow() - timedelta(hours=6)
+        recently_scored = {
+            car_id for (car_id,) in db.query(GemScore.car_id).filter(GemScore.created_at > recent_cutoff)
+        }
         active_cars = db.query(Car).filter(Car.is_active == True).all()
         
+        rows = []
         for car in active_cars:
+            if car.id in recently_scored:
+                continue
+            
             try:
-                # Skip if already analyzed recently
-                existing = db.query(GemScore).filter(
-                    GemScore.car_id == car.id,
-                    GemScore.created_at > datetime.utcnow() - timedelta(hours=6)
-                ).first()
-                
-                if existing:
-                    continue
-                
                 # Calculate gem score
                 analysis = self.calculate_gem_score(car, db)
-                
-                # Save to database
-                gem_score = GemScore(
-                    car_id=car.id,
-                    gem_score=analysis["gem_score"],
-                    reasons=analysis["reasons"],
-                    profit_potential=analysis["profit_potential"],
-                    risk_factors=analysis["risk_factors"],
-                    market_position=analysis["market_position"],
-                    confidence_level=analysis["confidence_level"]
-                )
-                
-                db.add(gem_score)
-                db.commit()
-                
-                print(f"✅ Analyzed car {car.id}: Gem Score {analysis['gem_score']}")
-                
             except Exception as e:
                 print(f"❌ Error analyzing car {car.id}: {e}")
                 continue
+            
+            rows.append({
+                "car_id": car.id,
+                "gem_score": analysis["gem_score"],
+                "reasons": analysis["reasons"],
+                "profit_potential": analysis["profit_potential"],
+                "risk_factors": analysis["risk_factors"],
+                "market_position": analysis["market_position"],
+                "confidence_level": analysis["confidence_level"],
+                "created_at": datetime.utcnow()
+            })
+            print(f"✅ Analyzed car {car.id}: Gem Score {analysis['gem_score']}")
+        
+        # Save to database: multi-row upserts (re-scored cars replace their row), one commit
+        for start in range(0, len(rows), GEM_UPSERT_CHUNK):
+            upsert(db, GemScore, rows[start:start + GEM_UPSERT_CHUNK], index_elements=["car_id"])
+        if rows:
+            db.commit()
 
 if __name__ == "__main__":
     from enhanced_database import SessionLocal
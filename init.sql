@@ -1,5 +1,7 @@
 -- Initialize PostgreSQL database for production
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Trigram index on cars.title_lower (keyword LIKE filters)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Create automotive_assistant database if it doesn't exist
 -- (This file runs automatically in docker-entrypoint-initdb.d)
\ No newline at end of file
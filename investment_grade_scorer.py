@@ -1,11 +1,11 @@
-import json
 import re
 from datetime import datetime, timedelta
-from statistics import mean, median
 import anthropic
 import os
 from sqlalchemy.orm import Session
-from enhanced_database import Car, InvestmentScore, GemScore, MarketPulse, SocialSentiment
+from enhanced_database import Car, InvestmentScore, MarketPulse, SocialSentiment
+from car_models import car_make_model
+from ai_client import parse_json_response
 import uuid
 
 class InvestmentGradeScorer:
@@ -215,7 +215,7 @@ class InvestmentGradeScorer:
         
         # Adjust based on market sentiment
         sentiment_data = db.query(SocialSentiment).filter(
-            SocialSentiment.make_model.ilike(f"%{car.title.split()[0]}%")
+            SocialSentiment.make_model.ilike(f"%{car.make or car.title.split()[0]}%")
         ).first()
         
         if sentiment_data and sentiment_data.sentiment_score > 0.3:
@@ -237,7 +237,7 @@ class InvestmentGradeScorer:
                 base_potential += 10
         
         # Condition impact (if we have gem score)
-        gem_score = db.query(GemScore).filter(GemScore.car_id == car.id).first()
+        gem_score = car.gem
         if gem_score:
             if gem_score.gem_score > 80:
                 base_potential += 15  # Exceptional condition
@@ -289,7 +289,7 @@ class InvestmentGradeScorer:
         
         # Market saturation check
         market_pulse = db.query(MarketPulse).filter(
-            MarketPulse.make_model.ilike(f"%{car.title.split()[0]}%")
+            MarketPulse.make_model.ilike(f"%{car.make or car.title.split()[0]}%")
         ).first()
         
         if market_pulse and market_pulse.market_saturation > 70:
@@ -371,7 +371,7 @@ class InvestmentGradeScorer:
         """Get market context for investment assessment"""
         
         # Try to get market pulse data
-        make_model = " ".join(car.title.split()[:2])
+        make_model = car_make_model(car)
         market_pulse = db.query(MarketPulse).filter(
             MarketPulse.make_model.ilike(f"%{make_model}%")
         ).first()
@@ -423,7 +423,7 @@ class InvestmentGradeScorer:
             risks["risk_score"] += 20
         
         # Get gem score for condition risk
-        gem_score = db.query(GemScore).filter(GemScore.car_id == car.id).first()
+        gem_score = car.gem
         if gem_score and gem_score.gem_score < 50:
             risks["risk_factors"].append("Below-average condition affects investment potential")
             risks["risk_score"] += 15
@@ -560,7 +560,7 @@ class InvestmentGradeScorer:
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            return json.loads(message.content[0].text)
+            return parse_json_response(message.content[0].text)
             
         except Exception as e:
             return {"error": f"AI insights failed: {str(e)}"}
@@ -591,10 +591,10 @@ class InvestmentGradeScorer:
         
         return summary
 
-    def save_investment_score(self, car: Car, score_data: dict, db: Session) -> str:
-        """Save investment score to database"""
+    def build_investment_record(self, car: Car, score_data: dict):
+        """InvestmentScore row for a calculated grade (not added to a session)"""
         
-        investment_score = InvestmentScore(
+        return InvestmentScore(
             id=str(uuid.uuid4()),
             car_id=car.id,
             investment_grade=score_data["investment_grade"],
@@ -606,7 +606,10 @@ class InvestmentGradeScorer:
             risk_assessment=score_data["risk_assessment"],
             hold_recommendation=score_data["hold_recommendation"]
         )
-        
+
+    def save_investment_score(self, car: Car, score_data: dict, db: Session) -> str:
+        """Save investment score to database"""
+        investment_score = self.build_investment_record(car, score_data)
         db.add(investment_score)
         db.commit()
         
@@ -617,7 +620,7 @@ class InvestmentGradeScorer:
         
         investment = db.query(InvestmentScore).filter(
             InvestmentScore.car_id == car_id
-        ).first()
+        ).order_by(InvestmentScore.calculated_at.desc()).first()
         
         if not investment:
             return {"message": "No investment analysis available"}
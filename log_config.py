@@ -0,0 +1,26 @@
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+def setup_logging(level=logging.INFO) -> logging.handlers.QueueListener:
+    """Route the root logger through a queue so handlers write from their own thread.
+
+    Request and job threads only enqueue the record; the returned listener
+    formats and writes it to stderr. Stop the listener on shutdown to flush.
+    """
+    log_queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:  # e.g. scraper.py's basicConfig handler
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
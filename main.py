@@ -1,188 +1,313 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional
-import json
+import asyncio
+import orjson
+import hashlib
 import uuid
 from datetime import datetime, timedelta
 import os
-import anthropic
-import threading
-import time
 import logging
+import threading
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
-from enhanced_database import SessionLocal, Car, Analysis, create_all_tables
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from fastapi_cache.decorator import cache
+from log_config import setup_logging
+from scheduler_lock import acquire_scheduler_lock
+from response_cache import init_response_cache, request_key_builder, invalidate
+from ai_client import get_async_anthropic_client, prewarm_async_anthropic_client, create_message, parse_json_response
+from enhanced_database import SessionLocal, AsyncSessionLocal, get_database, get_read_database, Car, Analysis, create_all_tables, get_async_database, upsert_statement
 from scraper import LeBonCoinScraper
 from scrapfly_scraper import ScrapflyLeboncoinScraper
 from enhanced_database import GemScore, PhotoAnalysis, ParsedListing, NegotiationStrategy, VinData, VehicleHistory, MarketPulse, SocialSentiment, CarComparison, MaintenancePrediction, InvestmentScore
-from gem_detector import HiddenGemDetector
-from photo_analyzer import AIPhotoAnalyzer  
-from description_parser import IntelligentDescriptionParser
-from negotiation_assistant import NegotiationAssistantPro
-from vin_decoder import VINDecoderHistoryBuilder
-from market_pulse_predictor import MarketPulsePredictor
-from social_sentiment_analyzer import SocialSentimentAnalyzer
-from smart_comparison_engine import SmartComparisonEngine
-from maintenance_cost_prophet import MaintenanceCostProphet
-from investment_grade_scorer import InvestmentGradeScorer
-
-app = FastAPI(title="Automotive Assistant API")
+from dashboard_summary import (
+    generate_ai_summary, is_summary_fresh, save_dashboard_summary,
+    refresh_dashboard_summary
+)
+from tasks import JOBS
+from result_freshness import has_fresh_result_async, FULL_ANALYSIS_FEATURES
+from car_models import car_make_model
+from analyzers import (
+    get_gem_detector, get_photo_analyzer, get_negotiation_assistant,
+    get_vin_decoder, get_market_predictor, get_sentiment_analyzer, get_comparison_engine,
+    get_maintenance_prophet, get_investment_scorer
+)
+
+# orjson serializes the dict responses (insight lists, stats) much faster
+# than the stdlib json encoder
+app = FastAPI(title="Automotive Assistant API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "https://*.vercel.app", "*"],
+    # Explicit origins: a "*" wildcard is invalid together with credentials
+    allow_origin_regex=os.getenv(
+        "CORS_ORIGIN_REGEX",
+        r"^https://([a-z0-9-]+\.)*(vercel|netlify)\.app$|^http://localhost:3000$"
+    ),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
-def get_database():
-    """Database dependency"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 create_all_tables()
 
-@app.get("/api/cars")
-def get_cars(
-    max_price: Optional[int] = Query(None),
-    department: Optional[str] = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(20),
-    db: Session = Depends(get_database)
-):
-    query = db.query(Car).filter(Car.is_active == True)
-    
-    if max_price:
-        query = query.filter(Car.price <= max_price)
-    if department:
-        query = query.filter(Car.department == department)
-    
-    cars = query.offset(skip).limit(limit).all()
-    
-    result = []
-    for car in cars:
-        car_dict = {
-            "id": car.id,
-            "title": car.title,
-            "price": car.price,
-            "year": car.year,
-            "mileage": car.mileage,
-            "fuel_type": car.fuel_type,
-            "description": car.description,
-            "images": json.loads(car.images) if car.images else [],
-            "url": car.url,
-            "seller_type": car.seller_type,
-            "department": car.department,
-            "first_seen": car.first_seen.isoformat() if car.first_seen else None,
-            "last_seen": car.last_seen.isoformat() if car.last_seen else None
-        }
-        result.append(car_dict)
-    
-    return {"cars": result, "total": query.count()}
+# Columns sent by the listing endpoint; the (multi-KB) description is only
+# fetched for the detail endpoint
+CAR_LISTING_COLUMNS = (
+    Car.id, Car.title, Car.price, Car.year, Car.mileage, Car.fuel_type, Car.images,
+    Car.url, Car.seller_type, Car.department, Car.first_seen, Car.last_seen
+)
 
-@app.get("/api/cars/{car_id}")
-def get_car(car_id: str, db: Session = Depends(get_database)):
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
-    
-    return {
+def serialize_car(car, include_description=True):
+    """Public JSON shape of a Car (ORM object or row of CAR_LISTING_COLUMNS)"""
+    car_dict = {
         "id": car.id,
         "title": car.title,
         "price": car.price,
         "year": car.year,
         "mileage": car.mileage,
         "fuel_type": car.fuel_type,
-        "description": car.description,
-        "images": json.loads(car.images) if car.images else [],
+        "images": car.images or [],
         "url": car.url,
         "seller_type": car.seller_type,
         "department": car.department,
         "first_seen": car.first_seen.isoformat() if car.first_seen else None,
         "last_seen": car.last_seen.isoformat() if car.last_seen else None
     }
+    if include_description:
+        car_dict["description"] = car.description
+    return car_dict
 
-@app.post("/api/cars/{car_id}/analyze")
-def analyze_car(car_id: str, db: Session = Depends(get_database)):
-    car = db.query(Car).filter(Car.id == car_id).first()
+# Listings change at most once per scraper run (every 30 minutes)
+CARS_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+
+def current_hour():
+    """utcnow() truncated to the hour, for time filters that don't need to be exact"""
+    return datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+def _etag(*parts):
+    """ETag for a response built from the given values"""
+    return '"' + hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest() + '"'
+
+def _not_modified(request: Request, etag: str):
+    """304 response if the client already holds this version, else None"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CARS_CACHE_CONTROL})
+    return None
+
+# Rows fetched from the cursor per round trip while streaming a page
+CARS_STREAM_BATCH = 100
+
+@app.get("/api/cars")
+async def get_cars(
+    request: Request,
+    max_price: Optional[int] = Query(None),
+    department: Optional[str] = Query(None),
+    skip: int = Query(0),
+    limit: int = Query(20)
+):
+    """Page of active cars, streamed as it is read from the cursor.
+
+    The body keeps the {"cars": [...], "total": N} shape; clients sending
+    `Accept: application/x-ndjson` get one car per line instead, with the
+    total in the X-Total-Count header.
+    """
+    query = select(*CAR_LISTING_COLUMNS).where(Car.is_active == True)
+    
+    if max_price:
+        query = query.where(Car.price <= max_price)
+    if department:
+        query = query.where(Car.department == department)
+    
+    # The session outlives this function: it is closed once the body is sent
+    db = AsyncSessionLocal()
+    try:
+        # Count and freshness of the whole filtered set ride along with the
+        # page as window aggregates, so the WHERE clause runs once
+        result = await db.stream(query.add_columns(
+            func.count().over().label("total"),
+            func.max(Car.last_seen).over().label("latest_seen")
+        ).offset(skip).limit(limit).execution_options(yield_per=CARS_STREAM_BATCH))
+        batches = result.partitions()
+        first_batch = await anext(batches, [])
+        
+        if first_batch:
+            total, latest_seen = first_batch[0].total, first_batch[0].latest_seen
+        else:
+            # Page past the end: no row to carry the window values
+            await result.close()
+            total, latest_seen = (await db.execute(
+                query.with_only_columns(func.count(Car.id), func.max(Car.last_seen))
+            )).one()
+        
+        etag = _etag(total, latest_seen, max_price, department, skip, limit)
+        not_modified = _not_modified(request, etag)
+        if not_modified:
+            await db.close()
+            return not_modified
+    except BaseException:
+        await db.close()
+        raise
+    
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    
+    async def body():
+        try:
+            if not ndjson:
+                yield b'{"cars":['
+            batch, separator = first_batch, b""
+            while batch:
+                rows = [orjson.dumps(serialize_car(row, include_description=False)) for row in batch]
+                if ndjson:
+                    yield b"\n".join(rows) + b"\n"
+                else:
+                    yield separator + b",".join(rows)
+                    separator = b","
+                batch = await anext(batches, [])
+            if not ndjson:
+                yield b'],"total":' + str(total).encode() + b"}"
+        finally:
+            await db.close()
+    
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+        headers={"ETag": etag, "Cache-Control": CARS_CACHE_CONTROL, "X-Total-Count": str(total)}
+    )
+
+async def get_car_or_404(car_id: str, db: AsyncSession = Depends(get_async_database)) -> Car:
+    """Path car, or 404. FastAPI resolves a dependency once per request and the
+    session's identity map serves later db.get() calls, so the car is read once."""
+    car = await db.get(Car, car_id)
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
+    return car
+
+@app.get("/api/cars/{car_id}")
+async def get_car(request: Request, response: Response, car: Car = Depends(get_car_or_404)):
+    etag = _etag(car.id, car.last_seen, car.is_active)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CARS_CACHE_CONTROL
+    return serialize_car(car)
+
+# Haiku is enough for this short structured answer
+ANALYSIS_MODEL = os.getenv("CLAUDE_ANALYSIS_MODEL", "claude-3-5-haiku-20241022")
+
+ANALYSIS_SYSTEM_PROMPT = """Vous analysez des annonces de voitures franaises.
+
+Fournissez une analyse structure en JSON avec:
+1. price_assessment: valuation du prix (correct/lev/bas)
+2. red_flags: signaux d'alarme potentiels
+3. negotiation_tips: conseils de ngociation
+4. overall_score: note sur 10
+5. recommendation: recommandation d'achat
+
+Rpondez uniquement en JSON valide."""
+
+@lru_cache(maxsize=2048)
+def _build_user_prompt(title, price, year, mileage, fuel_type, description, seller_type, department):
+    """Build the per-car part of the analysis prompt (cached on the car fields)"""
+    return f"""Analysez cette annonce de voiture franaise:
+
+Titre: {title}
+Prix: {price}
+Anne: {year}
+Kilomtrage: {mileage} km
+Carburant: {fuel_type}
+Description: {description}
+Type de vendeur: {seller_type}
+Dpartement: {department}"""
+
+@app.post("/api/cars/{car_id}/analyze")
+async def analyze_car(car_id: str, car: Car = Depends(get_car_or_404), db: AsyncSession = Depends(get_async_database)):
+    # Check for cached analysis (within 7 days). One row per car: fetch it by
+    # key and check its age here, so the statement carries no time parameter
+    cached_analysis = (await db.execute(
+        select(Analysis).where(Analysis.car_id == car_id)
+    )).scalars().first()
     
-    # Check for cached analysis (within 7 days)
-    cached_analysis = db.query(Analysis).filter(
-        Analysis.car_id == car_id,
-        Analysis.created_at > datetime.utcnow() - timedelta(days=7)
-    ).first()
-    
-    if cached_analysis:
-        return json.loads(cached_analysis.analysis_data)
+    if cached_analysis and cached_analysis.created_at > datetime.utcnow() - timedelta(days=7):
+        return orjson.loads(cached_analysis.analysis_data)
     
     # Generate new analysis with Claude
-    anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not anthropic_api_key:
+    client = get_async_anthropic_client()
+    if client is None:
         raise HTTPException(status_code=500, detail="Anthropic API key not configured. Set ANTHROPIC_API_KEY environment variable.")
     
-    client = anthropic.Anthropic(api_key=anthropic_api_key)
-    
-    prompt = f"""
-    Analysez cette annonce de voiture franaise:
-    
-    Titre: {car.title}
-    Prix: {car.price}
-    Anne: {car.year}
-    Kilomtrage: {car.mileage} km
-    Carburant: {car.fuel_type}
-    Description: {car.description}
-    Type de vendeur: {car.seller_type}
-    Dpartement: {car.department}
-    
-    Fournissez une analyse structure en JSON avec:
-    1. price_assessment: valuation du prix (correct/lev/bas)
-    2. red_flags: signaux d'alarme potentiels
-    3. negotiation_tips: conseils de ngociation
-    4. overall_score: note sur 10
-    5. recommendation: recommandation d'achat
-    
-    Rpondez uniquement en JSON valide.
-    """
+    prompt = _build_user_prompt(
+        car.title, car.price, car.year, car.mileage, car.fuel_type,
+        car.description, car.seller_type, car.department
+    )
     
     try:
-        message = client.messages.create(
-            model="claude-3-sonnet-20240229",
+        message = await create_message(
+            model=ANALYSIS_MODEL,
             max_tokens=1000,
+            system=ANALYSIS_SYSTEM_PROMPT,
             messages=[{"role": "user", "content": prompt}]
         )
         
         analysis_text = message.content[0].text
-        analysis_data = json.loads(analysis_text)
+        analysis_data = parse_json_response(analysis_text)
         
-        # Cache the analysis
-        new_analysis = Analysis(
-            id=str(uuid.uuid4()),
-            car_id=car_id,
-            analysis_data=json.dumps(analysis_data)
-        )
-        db.add(new_analysis)
-        db.commit()
+        # Cache the analysis (one row per car, refreshed in place)
+        await db.execute(upsert_statement(db.bind.dialect.name, Analysis, {
+            "id": str(uuid.uuid4()),
+            "car_id": car_id,
+            "analysis_data": orjson.dumps(analysis_data).decode(),
+            "created_at": datetime.utcnow()
+        }, index_elements=["car_id"], update_columns=["analysis_data", "created_at"]))
+        await db.commit()
         
         return analysis_data
         
+    except asyncio.TimeoutError:
+        # Claude is too slow right now: serve the expired analysis if we have one
+        if cached_analysis:
+            return orjson.loads(cached_analysis.analysis_data)
+        raise HTTPException(status_code=503, detail="Analysis service timed out, please retry later")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+# One Scrapfly scraper for every run so its HTTP session (keep-alive
+# connections, TLS sessions, cookies) is reused. Runs within this process are
+# serialized: an overlapping trigger is skipped instead of hitting leboncoin
+# twice. Scheduled runs happen in one process only, see scheduler_lock.
+scrapfly_scraper = ScrapflyLeboncoinScraper(department="69", max_cars=100)
+scrape_lock = threading.Lock()
+
+def run_scrapfly(max_cars: int) -> bool:
+    """Run the shared Scrapfly scraper, False when a run is already in progress"""
+    if not scrape_lock.acquire(blocking=False):
+        logger.info("Scrapfly scraper already running, skipping this trigger")
+        return False
+    try:
+        scrapfly_scraper.run(max_cars=max_cars)
+        return True
+    finally:
+        scrape_lock.release()
+
 def run_scraper_background():
     """Run scraper in background with fallback strategy"""
     try:
         # Try Scrapfly-enhanced scraper first
         logger.info("Attempting Scrapfly-enhanced scraping...")
-        scrapfly_scraper = ScrapflyLeboncoinScraper(department="69", max_cars=100)
-        scrapfly_scraper.run()
+        if not run_scrapfly(max_cars=100):
+            return {"status": "skipped", "message": "A scraper run is already in progress"}
         return {"status": "success", "message": "Scrapfly scraper completed successfully"}
     except Exception as e:
         logger.warning(f"Scrapfly scraper failed: {e}")
@@ -205,10 +330,16 @@ def run_scraper_background():
                 logger.error(f"Sample data creation failed: {e3}")
                 return {"status": "error", "message": f"All fallback methods failed"}
 
+async def run_scraper_job():
+    """Run the blocking scrapers off the event loop, then expire the cached status"""
+    result = await asyncio.to_thread(run_scraper_background)
+    await invalidate("scraper_status")
+    return result
+
 @app.post("/api/scrape")
 def trigger_scraper(background_tasks: BackgroundTasks):
     """Manually trigger the scraper"""
-    background_tasks.add_task(run_scraper_background)
+    background_tasks.add_task(run_scraper_job)
     return {"status": "started", "message": "Scraper started in background"}
 
 @app.post("/api/scrape/create-sample-data")
@@ -241,8 +372,7 @@ def trigger_scrapfly_scraper(background_tasks: BackgroundTasks, db: Session = De
     def run_scrapfly_scraper():
         try:
             logger.info(" Testing Scrapfly scraper...")
-            scraper = ScrapflyLeboncoinScraper(department="69", max_cars=20)  # Smaller batch for testing
-            scraper.run()
+            run_scrapfly(max_cars=20)  # Smaller batch for testing
             logger.info(" Scrapfly scraper test completed")
         except Exception as e:
             logger.error(f" Scrapfly scraper test failed: {e}")
@@ -260,91 +390,118 @@ def trigger_scrapfly_scraper(background_tasks: BackgroundTasks, db: Session = De
     }
 
 @app.get("/api/scrape/status")
-def scraper_status(db: Session = Depends(get_database)):
+@cache(expire=30, namespace="scraper_status", key_builder=request_key_builder)
+async def scraper_status(db: AsyncSession = Depends(get_async_database)):
     """Get scraper status and car count"""
-    total_cars = db.query(Car).count()
-    active_cars = db.query(Car).filter(Car.is_active == True).count()
-    recent_cars = db.query(Car).filter(
-        Car.first_seen > datetime.utcnow() - timedelta(hours=24)
-    ).count()
-    latest_car = db.query(Car).order_by(Car.first_seen.desc()).first()
+    # Hour-aligned cutoff: the same parameter value for a whole hour
+    recent_cutoff = current_hour() - timedelta(hours=24)
+    stats = (await db.execute(
+        select(
+            func.count().label("total"),
+            # COUNT(CASE ...) rather than FILTER: portable to SQLite < 3.30, 0 on an empty table
+            func.count(case((Car.is_active == True, 1))).label("active"),
+            func.count(case((Car.first_seen > recent_cutoff, 1))).label("recent"),
+            func.max(Car.first_seen).label("latest"),
+        )
+    )).one()
     
     return {
-        "total_cars": total_cars,
-        "active_cars": active_cars,
-        "recent_cars_24h": recent_cars,
-        "last_scrape": latest_car.first_seen.isoformat() if latest_car else None,
-        "status": "healthy" if total_cars > 0 else "needs_data"
+        "total_cars": stats.total,
+        "active_cars": stats.active,
+        "recent_cars_24h": stats.recent,
+        "last_scrape": stats.latest.isoformat() if stats.latest else None,
+        "status": "healthy" if stats.total > 0 else "needs_data"
     }
 
-def automatic_scraper():
-    """Run scraper every 30 minutes with fallback strategy"""
-    while True:
-        try:
-            print("Running automatic scraper...")
-            
-            # Try Scrapfly scraper first
-            try:
-                print("Using Scrapfly-enhanced scraper...")
-                scraper = ScrapflyLeboncoinScraper(department="69", max_cars=100)
-                scraper.run()
-                print("Scrapfly automatic scraper completed")
-            except Exception as e:
-                print(f"Scrapfly scraper failed: {e}")
-                print("Falling back to original scraper...")
-                
-                # Fallback to original scraper
-                original_scraper = LeBonCoinScraper(department="69", max_cars=100)
-                original_scraper.run()
-                print("Original automatic scraper completed")
-                
-        except Exception as e:
-            print(f"All automatic scrapers failed: {e}")
-        
-        # Wait 30 minutes
-        time.sleep(1800)
+# Periodic jobs run as coroutines on the app's event loop
+scheduler = AsyncIOScheduler()
+arq_pool = None
+log_listener = None
+
+def _run_job_logged(job, *args):
+    try:
+        job(*args)
+    except Exception:
+        logger.exception(f"Background job {job.__name__} failed")
+
+async def enqueue_job(background_tasks: BackgroundTasks, job_name: str, *args, job_id: Optional[str] = None) -> bool:
+    """Queue a long AI job on the arq worker, or run it after the response when there is no Redis.
+
+    Returns False when arq declines the job: a job with the same `job_id`
+    is already queued or running.
+    """
+    if arq_pool is not None:
+        return await arq_pool.enqueue_job(job_name, *args, _job_id=job_id) is not None
+    background_tasks.add_task(_run_job_logged, JOBS[job_name], *args)
+    return True
+
+async def automatic_scraper():
+    """Scheduled scraper run (blocking scrape happens in a worker thread)"""
+    logger.info("Running automatic scraper...")
+    result = await run_scraper_job()
+    logger.info("Automatic scraper finished: %s", result.get("message"))
 
 @app.on_event("startup")
 async def startup_event():
     """Run on application startup"""
-    print("Starting Automotive Assistant API...")
+    global log_listener
+    log_listener = setup_logging()
+    logger.info("Starting Automotive Assistant API...")
     create_all_tables()
+    init_response_cache()
+    
+    # Durable job queue for the AI jobs; consumed by `arq worker.WorkerSettings`
+    if os.getenv("REDIS_URL"):
+        from arq import create_pool
+        from arq.connections import RedisSettings
+        global arq_pool
+        arq_pool = await create_pool(RedisSettings.from_dsn(os.getenv("REDIS_URL")))
+    
+    if get_async_anthropic_client() is None:
+        logger.warning("ANTHROPIC_API_KEY not set, Claude analysis endpoints will be unavailable")
+    else:
+        await prewarm_async_anthropic_client()
     
     # Ensure we have data on startup
     db = SessionLocal()
     try:
         car_count = db.query(Car).count()
         if car_count == 0:
-            print("No cars found, creating sample data...")
+            logger.info("No cars found, creating sample data...")
             from create_sample_data import create_sample_data
             create_sample_data()
-            print("Sample data created!")
+            logger.info("Sample data created!")
         else:
-            print(f"Found {car_count} cars in database")
-    except Exception as e:
-        print(f"Error checking/creating data: {e}")
+            logger.info("Found %d cars in database", car_count)
+    except Exception:
+        logger.exception("Error checking/creating data")
     finally:
         db.close()
     
-    # Run scraper immediately on startup
-    threading.Thread(target=run_scraper_background, daemon=True).start()
-    
-    # Start automatic scraper in background
-    threading.Thread(target=automatic_scraper, daemon=True).start()
-    
-    print("API started with automatic scraping enabled")
-
-# Initialize AI analyzers
-gem_detector = HiddenGemDetector()
-photo_analyzer = AIPhotoAnalyzer()
-description_parser = IntelligentDescriptionParser()
-negotiation_assistant = NegotiationAssistantPro()
-vin_decoder = VINDecoderHistoryBuilder()
-market_predictor = MarketPulsePredictor()
-sentiment_analyzer = SocialSentimentAnalyzer()
-comparison_engine = SmartComparisonEngine()
-maintenance_prophet = MaintenanceCostProphet()
-investment_scorer = InvestmentGradeScorer()
+    # Automatic scraper on the clock's :00 and :30, so a slow run does not
+    # push the schedule back. A run still going when the next one is due skips
+    # it, and runs missed while the loop was busy collapse into one. Only the
+    # API worker holding the scheduler lock schedules it.
+    if acquire_scheduler_lock():
+        scheduler.add_job(
+            automatic_scraper, CronTrigger(minute="*/30"),
+            id="automatic_scraper", coalesce=True, max_instances=1, misfire_grace_time=300,
+            replace_existing=True
+        )
+        scheduler.start()
+        logger.info("API started with all 10 AI features and automatic scraping enabled")
+    else:
+        logger.info("API started with all 10 AI features; another worker runs the automatic scraper")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the scheduler so the worker exits cleanly"""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    if arq_pool is not None:
+        await arq_pool.close()
+    if log_listener is not None:
+        log_listener.stop()  # flushes queued records
 
 # FEATURE 1: Hidden Gem Detector Endpoints
 @app.get("/api/cars/{car_id}/gem-analysis")
@@ -368,7 +525,7 @@ def get_gem_analysis(car_id: str, db: Session = Depends(get_database)):
         }
     
     # Generate new analysis
-    analysis = gem_detector.calculate_gem_score(car, db)
+    analysis = get_gem_detector().calculate_gem_score(car, db)
     
     # Save analysis
     gem_score = GemScore(
@@ -382,71 +539,68 @@ def get_gem_analysis(car_id: str, db: Session = Depends(get_database)):
     )
     db.add(gem_score)
     db.commit()
+    refresh_dashboard_summary(car, db)
     
     return analysis
 
 @app.get("/api/gems/top")
-def get_top_gems(limit: int = 20, db: Session = Depends(get_database)):
+@cache(expire=300, namespace="top_gems", key_builder=request_key_builder)
+async def get_top_gems(limit: int = 20, db: AsyncSession = Depends(get_async_database)):
     """Get top hidden gems with highest scores"""
-    top_gems = db.query(GemScore).join(Car).filter(
-        Car.is_active == True
-    ).order_by(GemScore.gem_score.desc()).limit(limit).all()
+    rows = (await db.execute(
+        select(
+            Car.id, Car.title, Car.price, Car.year, Car.mileage, Car.department, Car.images,
+            GemScore.gem_score, GemScore.reasons, GemScore.profit_potential, GemScore.market_position
+        ).join(GemScore, Car.id == GemScore.car_id).where(
+            Car.is_active == True
+        ).order_by(GemScore.gem_score.desc()).limit(limit)
+    )).all()
     
     result = []
-    for gem in top_gems:
-        car = db.query(Car).filter(Car.id == gem.car_id).first()
-        if car:
-            result.append({
-                "car": {
-                    "id": car.id,
-                    "title": car.title,
-                    "price": car.price,
-                    "year": car.year,
-                    "mileage": car.mileage,
-                    "department": car.department,
-                    "images": json.loads(car.images) if car.images else []
-                },
-                "gem_analysis": {
-                    "gem_score": gem.gem_score,
-                    "reasons": gem.reasons,
-                    "profit_potential": gem.profit_potential,
-                    "market_position": gem.market_position
-                }
-            })
+    for row in rows:
+        result.append({
+            "car": {
+                "id": row.id,
+                "title": row.title,
+                "price": row.price,
+                "year": row.year,
+                "mileage": row.mileage,
+                "department": row.department,
+                "images": row.images or []
+            },
+            "gem_analysis": {
+                "gem_score": row.gem_score,
+                "reasons": row.reasons,
+                "profit_potential": row.profit_potential,
+                "market_position": row.market_position
+            }
+        })
     
     return {"top_gems": result}
 
 # FEATURE 2: Photo Analyzer Endpoints
 @app.post("/api/cars/{car_id}/analyze-photos")
-def analyze_car_photos(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def analyze_car_photos(car_id: str, background_tasks: BackgroundTasks, car: Car = Depends(get_car_or_404)):
     """Analyze car photos with AI vision"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
-    
-    background_tasks.add_task(photo_analyzer.analyze_and_save, car, db)
+    await enqueue_job(background_tasks, "analyze_photos", car_id)
     return {"status": "started", "message": "Photo analysis started in background"}
 
 @app.get("/api/cars/{car_id}/photo-insights")
-def get_photo_insights(car_id: str, db: Session = Depends(get_database)):
+def get_photo_insights(car_id: str, db: Session = Depends(get_read_database)):
     """Get photo analysis insights for a car"""
-    return photo_analyzer.get_photo_insights(car_id, db)
+    return get_photo_analyzer().get_photo_insights(car_id, db)
 
 # FEATURE 3: Description Parser Endpoints
 @app.post("/api/cars/{car_id}/parse-description")
-def parse_car_description(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def parse_car_description(car_id: str, background_tasks: BackgroundTasks, car: Car = Depends(get_car_or_404)):
     """Parse car description with AI"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
-    
-    background_tasks.add_task(description_parser.parse_and_save, car, db) 
+    await enqueue_job(background_tasks, "parse_description", car_id)
     return {"status": "started", "message": "Description parsing started in background"}
 
 @app.get("/api/cars/{car_id}/parsed-description")
-def get_parsed_description(car_id: str, db: Session = Depends(get_database)):
+async def get_parsed_description(car_id: str, db: AsyncSession = Depends(get_async_database)):
     """Get parsed description data"""
-    parsed = db.query(ParsedListing).filter(ParsedListing.car_id == car_id).first()
+    parsed = await db.get(ParsedListing, car_id)
     if not parsed:
         return {"message": "Description not yet parsed. Use POST /parse-description first."}
     
@@ -462,17 +616,19 @@ def get_parsed_description(car_id: str, db: Session = Depends(get_database)):
 
 # COMPREHENSIVE CAR ANALYSIS ENDPOINT
 @app.get("/api/cars/{car_id}/full-analysis")
-def get_full_car_analysis(car_id: str, db: Session = Depends(get_database)):
+async def get_full_car_analysis(car_id: str, db: AsyncSession = Depends(get_async_database)):
     """Get comprehensive analysis combining all AI features"""
-    car = db.query(Car).filter(Car.id == car_id).first()
+    # Car and all of its analyses in one joined query (+ one for the photos)
+    car = (await db.execute(select(Car).options(
+        joinedload(Car.gem), joinedload(Car.parsed), joinedload(Car.analysis), selectinload(Car.photos)
+    ).where(Car.id == car_id))).unique().scalar_one_or_none()
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
     
-    # Get all analyses
-    gem_analysis = db.query(GemScore).filter(GemScore.car_id == car_id).first()
-    photo_insights = photo_analyzer.get_photo_insights(car_id, db)
-    parsed_desc = db.query(ParsedListing).filter(ParsedListing.car_id == car_id).first()
-    claude_analysis = db.query(Analysis).filter(Analysis.car_id == car_id).first()
+    gem_analysis = car.gem
+    photo_insights = get_photo_analyzer().summarize_photo_analyses(car.photos)
+    parsed_desc = car.parsed
+    claude_analysis = car.analysis
     
     return {
         "car_info": {
@@ -483,7 +639,7 @@ def get_full_car_analysis(car_id: str, db: Session = Depends(get_database)):
             "mileage": car.mileage,
             "fuel_type": car.fuel_type,
             "description": car.description,
-            "images": json.loads(car.images) if car.images else [],
+            "images": car.images or [],
             "seller_type": car.seller_type,
             "department": car.department
         },
@@ -501,53 +657,27 @@ def get_full_car_analysis(car_id: str, db: Session = Depends(get_database)):
             "positive_signals": parsed_desc.positive_signals if parsed_desc else [],
             "seller_credibility": parsed_desc.seller_credibility if parsed_desc else None
         } if parsed_desc else None,
-        "claude_analysis": json.loads(claude_analysis.analysis_data) if claude_analysis else None
+        "claude_analysis": orjson.loads(claude_analysis.analysis_data) if claude_analysis else None
     }
 
 # BATCH ANALYSIS ENDPOINTS
 @app.post("/api/analyze-all-active-cars")
-def analyze_all_active_cars(background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def analyze_all_active_cars(background_tasks: BackgroundTasks):
     """Trigger analysis of all active cars"""
-    def run_all_analyses():
-        # Run gem detection
-        import asyncio
-        asyncio.run(gem_detector.analyze_all_active_cars(db))
-        
-        # Run description parsing for cars without parsed data
-        cars_to_parse = db.query(Car).filter(
-            Car.is_active == True,
-            ~Car.id.in_(db.query(ParsedListing.car_id))
-        ).limit(50).all()
-        
-        for car in cars_to_parse:
-            try:
-                description_parser.parse_and_save(car, db)
-            except Exception as e:
-                print(f"Error parsing car {car.id}: {e}")
-    
-    background_tasks.add_task(run_all_analyses)
+    await enqueue_job(background_tasks, "analyze_all_active_cars")
     return {"status": "started", "message": "Batch analysis of all active cars started"}
 
 # FEATURE 4: Negotiation Assistant Endpoints
 @app.post("/api/cars/{car_id}/generate-negotiation-strategy")
-def generate_negotiation_strategy(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def generate_negotiation_strategy(car_id: str, background_tasks: BackgroundTasks, car: Car = Depends(get_car_or_404)):
     """Generate negotiation strategy for a car"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
-    
-    def generate_and_save_strategy():
-        strategy = negotiation_assistant.generate_negotiation_strategy(car, db)
-        strategy_id = negotiation_assistant.save_strategy(car, strategy, db)
-        print(f" Generated negotiation strategy {strategy_id} for car {car_id}")
-    
-    background_tasks.add_task(generate_and_save_strategy)
+    await enqueue_job(background_tasks, "generate_negotiation_strategy", car_id)
     return {"status": "started", "message": "Negotiation strategy generation started"}
 
 @app.get("/api/cars/{car_id}/negotiation-insights")
-def get_negotiation_insights(car_id: str, db: Session = Depends(get_database)):
+def get_negotiation_insights(car_id: str, db: Session = Depends(get_read_database)):
     """Get negotiation insights for a car"""
-    return negotiation_assistant.get_negotiation_insights(car_id, db)
+    return get_negotiation_assistant().get_negotiation_insights(car_id, db)
 
 @app.post("/api/negotiations/{strategy_id}/record-outcome")
 def record_negotiation_outcome(
@@ -562,33 +692,22 @@ def record_negotiation_outcome(
     if not strategy:
         raise HTTPException(status_code=404, detail="Strategy not found")
     
-    result = negotiation_assistant.record_outcome(
+    result = get_negotiation_assistant().record_outcome(
         strategy.car_id, strategy_id, outcome, final_price, approach_used, {}, db
     )
     return result
 
 # FEATURE 5: VIN Decoder & History Endpoints
 @app.post("/api/cars/{car_id}/build-vehicle-history")
-def build_vehicle_history(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def build_vehicle_history(car_id: str, background_tasks: BackgroundTasks, car: Car = Depends(get_car_or_404)):
     """Build comprehensive vehicle history from VIN"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
-    
-    def build_and_save_history():
-        try:
-            history = vin_decoder.build_vehicle_history(car, db)
-            print(f" Built vehicle history for car {car_id}")
-        except Exception as e:
-            print(f" Error building history for car {car_id}: {e}")
-    
-    background_tasks.add_task(build_and_save_history)
+    await enqueue_job(background_tasks, "build_vehicle_history", car_id)
     return {"status": "started", "message": "VIN analysis and history building started"}
 
 @app.get("/api/cars/{car_id}/vin-insights")
-def get_vin_insights(car_id: str, db: Session = Depends(get_database)):
+def get_vin_insights(car_id: str, db: Session = Depends(get_read_database)):
     """Get VIN insights and vehicle history"""
-    return vin_decoder.get_vin_insights(car_id, db)
+    return get_vin_decoder().get_vin_insights(car_id, db)
 
 @app.post("/api/vin/decode")
 def decode_vin_manual(vin: str):
@@ -596,9 +715,9 @@ def decode_vin_manual(vin: str):
     if len(vin) != 17:
         raise HTTPException(status_code=400, detail="VIN must be 17 characters")
     
-    decoded = vin_decoder.decode_vin(vin)
-    recall_status = vin_decoder.check_recall_status(vin, decoded.get("manufacturer", "Unknown"))
-    theft_check = vin_decoder.check_theft_status(vin)
+    decoded = get_vin_decoder().decode_vin(vin)
+    recall_status = get_vin_decoder().check_recall_status(vin, decoded.get("manufacturer", "Unknown"))
+    theft_check = get_vin_decoder().check_theft_status(vin)
     
     return {
         "vin": vin,
@@ -609,74 +728,75 @@ def decode_vin_manual(vin: str):
 
 # FEATURE 6: Market Pulse Predictor Endpoints
 @app.post("/api/market/analyze/{make_model}")
-def analyze_market_pulse(make_model: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def analyze_market_pulse(make_model: str, background_tasks: BackgroundTasks, force: bool = False, db: AsyncSession = Depends(get_async_database)):
     """Analyze market pulse for a make/model"""
-    def analyze_and_save():
-        try:
-            pulse = market_predictor.analyze_market_pulse(make_model, db)
-            if "error" not in pulse:
-                pulse_id = market_predictor.save_market_pulse(make_model, pulse, db)
-                print(f" Analyzed market pulse for {make_model}, saved as {pulse_id}")
-        except Exception as e:
-            print(f" Error analyzing market pulse for {make_model}: {e}")
-    
-    background_tasks.add_task(analyze_and_save)
+    if not force and await has_fresh_result_async(db, "market_pulse", make_model):
+        return {"status": "cached", "message": f"Market analysis for {make_model} is recent, use force=true to rerun it"}
+    await enqueue_job(background_tasks, "analyze_market_pulse", make_model)
     return {"status": "started", "message": f"Market analysis started for {make_model}"}
 
 @app.get("/api/market/insights/{make_model}")
-def get_market_insights(make_model: str, db: Session = Depends(get_database)):
+@cache(expire=60, namespace="market_insights", key_builder=request_key_builder)
+def get_market_insights(make_model: str, db: Session = Depends(get_read_database)):
     """Get market insights for a make/model"""
-    return market_predictor.get_market_insights(make_model, db)
+    return get_market_predictor().get_market_insights(make_model, db)
 
 @app.get("/api/market/trending")
-def get_trending_models(limit: int = 20, db: Session = Depends(get_database)):
+@cache(expire=600, namespace="trending_models", key_builder=request_key_builder)
+def get_trending_models(limit: int = 20, db: Session = Depends(get_read_database)):
     """Get currently trending car models"""
-    return {"trending_models": market_predictor.get_trending_models(db, limit)}
+    return {"trending_models": get_market_predictor().get_trending_models(db, limit)}
 
 # FEATURE 7: Social Sentiment Analyzer Endpoints
 @app.post("/api/sentiment/analyze/{make_model}")
-def analyze_social_sentiment(make_model: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def analyze_social_sentiment(make_model: str, background_tasks: BackgroundTasks, force: bool = False, db: AsyncSession = Depends(get_async_database)):
     """Analyze social sentiment for a make/model"""
-    def analyze_and_save():
-        try:
-            sentiment = sentiment_analyzer.analyze_social_sentiment(make_model, db)
-            print(f" Analyzed social sentiment for {make_model}")
-        except Exception as e:
-            print(f" Error analyzing sentiment for {make_model}: {e}")
-    
-    background_tasks.add_task(analyze_and_save)
+    if not force and await has_fresh_result_async(db, "sentiment", make_model):
+        return {"status": "cached", "message": f"Sentiment analysis for {make_model} is recent, use force=true to rerun it"}
+    await enqueue_job(background_tasks, "analyze_social_sentiment", make_model)
     return {"status": "started", "message": f"Sentiment analysis started for {make_model}"}
 
 @app.get("/api/sentiment/insights/{make_model}")
-def get_sentiment_insights(make_model: str, db: Session = Depends(get_database)):
+def get_sentiment_insights(make_model: str, db: Session = Depends(get_read_database)):
     """Get sentiment insights for a make/model"""
-    return sentiment_analyzer.get_sentiment_insights(make_model, db)
+    return get_sentiment_analyzer().get_sentiment_insights(make_model, db)
 
 @app.get("/api/sentiment/top-rated")
-def get_top_rated_models(limit: int = 10, db: Session = Depends(get_database)):
+@cache(expire=600, namespace="top_rated_models", key_builder=request_key_builder)
+def get_top_rated_models(limit: int = 10, db: Session = Depends(get_read_database)):
     """Get top-rated models by social sentiment"""
-    return {"top_rated_models": sentiment_analyzer.get_top_rated_models(db, limit)}
+    return {"top_rated_models": get_sentiment_analyzer().get_top_rated_models(db, limit)}
 
 # COMPREHENSIVE AI DASHBOARD ENDPOINT
 @app.get("/api/cars/{car_id}/ai-dashboard")
 def get_ai_dashboard(car_id: str, db: Session = Depends(get_database)):
     """Get comprehensive AI dashboard for a car"""
-    car = db.query(Car).filter(Car.id == car_id).first()
+    car = db.query(Car).options(
+        joinedload(Car.gem), joinedload(Car.parsed), joinedload(Car.dashboard_summary),
+        selectinload(Car.photos)
+    ).filter(Car.id == car_id).first()
     if not car:
         raise HTTPException(status_code=404, detail="Car not found")
     
     # Get all AI analyses
-    gem_analysis = db.query(GemScore).filter(GemScore.car_id == car_id).first()
-    photo_insights = photo_analyzer.get_photo_insights(car_id, db)
-    parsed_desc = db.query(ParsedListing).filter(ParsedListing.car_id == car_id).first()
-    negotiation_insights = negotiation_assistant.get_negotiation_insights(car_id, db)
-    vin_insights = vin_decoder.get_vin_insights(car_id, db)
+    gem_analysis = car.gem
+    photo_insights = get_photo_analyzer().summarize_photo_analyses(car.photos)
+    parsed_desc = car.parsed
+    negotiation_insights = get_negotiation_assistant().get_negotiation_insights(car_id, db)
+    vin_insights = get_vin_decoder().get_vin_insights(car_id, db)
     
     # Get market and sentiment data for the model
-    make_model = car.title.split()[0:2]  # Approximate make/model extraction
-    make_model_str = " ".join(make_model)
-    market_insights = market_predictor.get_market_insights(make_model_str, db)
-    sentiment_insights = sentiment_analyzer.get_sentiment_insights(make_model_str, db)
+    make_model_str = car_make_model(car)
+    market_insights = get_market_predictor().get_market_insights(make_model_str, db)
+    sentiment_insights = get_sentiment_analyzer().get_sentiment_insights(make_model_str, db)
+    
+    # Summaries are precomputed when their inputs change; rebuild only on a miss
+    if is_summary_fresh(car.dashboard_summary):
+        ai_summary = car.dashboard_summary.summary
+    else:
+        ai_summary = generate_ai_summary(car, gem_analysis, parsed_desc, market_insights, sentiment_insights)
+        save_dashboard_summary(car_id, ai_summary, db)
+        db.commit()
     
     return {
         "car_info": {
@@ -711,249 +831,95 @@ def get_ai_dashboard(car_id: str, db: Session = Depends(get_database)):
             "market_pulse": market_insights if "message" not in market_insights else None,
             "social_sentiment": sentiment_insights if "message" not in sentiment_insights else None
         },
-        "ai_summary": self._generate_ai_summary(car, gem_analysis, parsed_desc, market_insights, sentiment_insights)
-    }
-
-def _generate_ai_summary(car, gem_analysis, parsed_desc, market_insights, sentiment_insights):
-    """Generate AI summary for the dashboard"""
-    summary = {
-        "overall_recommendation": "neutral",
-        "key_insights": [],
-        "risk_factors": [],
-        "opportunities": []
+        "ai_summary": ai_summary
     }
-    
-    # Gem analysis insights
-    if gem_analysis:
-        if gem_analysis.gem_score > 75:
-            summary["key_insights"].append(f" Ppite dtecte - Score: {gem_analysis.gem_score}/100")
-            summary["overall_recommendation"] = "buy"
-        elif gem_analysis.gem_score < 40:
-            summary["risk_factors"].append("Prix potentiellement lev pour le march")
-    
-    # Description analysis insights
-    if parsed_desc:
-        if parsed_desc.seller_credibility and parsed_desc.seller_credibility > 80:
-            summary["key_insights"].append(" Vendeur crdible avec description dtaille")
-        elif parsed_desc.seller_credibility and parsed_desc.seller_credibility < 50:
-            summary["risk_factors"].append(" Description peu crdible ou incomplte")
-        
-        if parsed_desc.red_flags and len(parsed_desc.red_flags) > 2:
-            summary["risk_factors"].append(f" {len(parsed_desc.red_flags)} signaux d'alarme dtects")
-    
-    # Market insights
-    if market_insights and "message" not in market_insights:
-        if market_insights.get("current_trend") == "falling":
-            summary["opportunities"].append(" March en baisse - Opportunit d'achat")
-        elif market_insights.get("current_trend") == "rising":
-            summary["risk_factors"].append(" March en hausse - Prix pourraient augmenter")
-    
-    # Sentiment insights
-    if sentiment_insights and "message" not in sentiment_insights:
-        if sentiment_insights.get("overall_sentiment", 0) > 0.3:
-            summary["key_insights"].append(" Modle trs apprci par les propritaires")
-        elif sentiment_insights.get("overall_sentiment", 0) < -0.2:
-            summary["risk_factors"].append(" Modle avec des avis mitigs")
-    
-    # Overall recommendation logic
-    if len(summary["risk_factors"]) > len(summary["key_insights"]) + len(summary["opportunities"]):
-        summary["overall_recommendation"] = "avoid"
-    elif len(summary["key_insights"]) + len(summary["opportunities"]) > len(summary["risk_factors"]):
-        summary["overall_recommendation"] = "consider" if summary["overall_recommendation"] != "buy" else "buy"
-    
-    return summary
-
-@app.on_event("startup")
-async def startup_event():
-    """Run on application startup"""
-    print("Starting Automotive Assistant API...")
-    create_all_tables()  # Create AI feature tables
-    
-    # Run scraper immediately on startup
-    threading.Thread(target=run_scraper_background, daemon=True).start()
-    
-    # Start automatic scraper in background
-    threading.Thread(target=automatic_scraper, daemon=True).start()
-    
-    print("API started with all 10 AI features enabled")
 
 # FEATURE 8: Smart Comparison Engine Endpoints
 @app.post("/api/cars/{car_id}/generate-comparison")
-def generate_car_comparison(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def generate_car_comparison(car_id: str, background_tasks: BackgroundTasks, force: bool = False, car: Car = Depends(get_car_or_404), db: AsyncSession = Depends(get_async_database)):
     """Generate smart comparison report for a car"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
+    if not force and await has_fresh_result_async(db, "comparison", car_id):
+        return {"status": "cached", "message": "A recent comparison exists, use force=true to regenerate it"}
     
-    def generate_and_save_comparison():
-        try:
-            comparison = comparison_engine.generate_comparison_report(car, db)
-            if "error" not in comparison:
-                comparison_id = comparison_engine.save_comparison(car, comparison, db)
-                print(f" Generated comparison {comparison_id} for car {car_id}")
-        except Exception as e:
-            print(f" Error generating comparison for car {car_id}: {e}")
-    
-    background_tasks.add_task(generate_and_save_comparison)
+    await enqueue_job(background_tasks, "generate_comparison", car_id)
     return {"status": "started", "message": "Smart comparison generation started"}
 
 @app.get("/api/cars/{car_id}/comparison-insights")
-def get_comparison_insights(car_id: str, db: Session = Depends(get_database)):
+@cache(expire=60, namespace="comparison_insights", key_builder=request_key_builder)
+def get_comparison_insights(car_id: str, db: Session = Depends(get_read_database)):
     """Get smart comparison insights for a car"""
-    return comparison_engine.get_comparison_insights(car_id, db)
+    return get_comparison_engine().get_comparison_insights(car_id, db)
 
 # FEATURE 9: Maintenance Cost Prophet Endpoints
 @app.post("/api/cars/{car_id}/predict-maintenance")
-def predict_maintenance_costs(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def predict_maintenance_costs(car_id: str, background_tasks: BackgroundTasks, force: bool = False, car: Car = Depends(get_car_or_404), db: AsyncSession = Depends(get_async_database)):
     """Predict maintenance costs for a car"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
+    if not force and await has_fresh_result_async(db, "maintenance", car_id):
+        return {"status": "cached", "message": "A recent maintenance prediction exists, use force=true to recompute it"}
     
-    def predict_and_save():
-        try:
-            prediction = maintenance_prophet.predict_maintenance_costs(car, db)
-            prediction_id = maintenance_prophet.save_maintenance_prediction(car, prediction, db)
-            print(f" Generated maintenance prediction {prediction_id} for car {car_id}")
-        except Exception as e:
-            print(f" Error predicting maintenance for car {car_id}: {e}")
-    
-    background_tasks.add_task(predict_and_save)
+    await enqueue_job(background_tasks, "predict_maintenance", car_id)
     return {"status": "started", "message": "Maintenance cost prediction started"}
 
 @app.get("/api/cars/{car_id}/maintenance-insights")
-def get_maintenance_insights(car_id: str, db: Session = Depends(get_database)):
-    """Get maintenance cost insights for a car"""
-    return maintenance_prophet.get_maintenance_insights(car_id, db)
+@cache(expire=60, namespace="maintenance_insights", key_builder=request_key_builder)
+def get_maintenance_insights(car_id: str, details: bool = False, db: Session = Depends(get_read_database)):
+    """Get maintenance cost insights for a car (details=true adds the yearly costs, schedule and repairs)"""
+    if details:
+        return get_maintenance_prophet().get_maintenance_insights_full(car_id, db)
+    return get_maintenance_prophet().get_maintenance_insights(car_id, db)
 
 @app.get("/api/maintenance/brand-comparison")
-def get_maintenance_brand_comparison(db: Session = Depends(get_database)):
+def get_maintenance_brand_comparison(db: Session = Depends(get_read_database)):
     """Get maintenance cost comparison by brand"""
-    return maintenance_prophet.get_cost_comparison_by_brand(db)
+    return get_maintenance_prophet().get_cost_comparison_by_brand(db)
 
 # FEATURE 10: Investment Grade Scorer Endpoints
 @app.post("/api/cars/{car_id}/calculate-investment-grade")
-def calculate_investment_grade(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
+async def calculate_investment_grade(car_id: str, background_tasks: BackgroundTasks, force: bool = False, car: Car = Depends(get_car_or_404), db: AsyncSession = Depends(get_async_database)):
     """Calculate investment grade for a car"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
+    if not force and await has_fresh_result_async(db, "investment", car_id):
+        return {"status": "cached", "message": "A recent investment grade exists, use force=true to recompute it"}
     
-    def calculate_and_save():
-        try:
-            investment_analysis = investment_scorer.calculate_investment_grade(car, db)
-            score_id = investment_scorer.save_investment_score(car, investment_analysis, db)
-            print(f" Generated investment score {score_id} for car {car_id}")
-        except Exception as e:
-            print(f" Error calculating investment grade for car {car_id}: {e}")
-    
-    background_tasks.add_task(calculate_and_save)
+    await enqueue_job(background_tasks, "calculate_investment_grade", car_id)
     return {"status": "started", "message": "Investment grade calculation started"}
 
 @app.get("/api/cars/{car_id}/investment-insights")
-def get_investment_insights(car_id: str, db: Session = Depends(get_database)):
+@cache(expire=60, namespace="investment_insights", key_builder=request_key_builder)
+def get_investment_insights(car_id: str, db: Session = Depends(get_read_database)):
     """Get investment insights for a car"""
-    return investment_scorer.get_investment_insights(car_id, db)
+    return get_investment_scorer().get_investment_insights(car_id, db)
 
 @app.get("/api/investment/top-opportunities")
-def get_top_investment_opportunities(limit: int = 10, db: Session = Depends(get_database)):
+def get_top_investment_opportunities(limit: int = 10, db: Session = Depends(get_read_database)):
     """Get top investment opportunities"""
-    return {"top_opportunities": investment_scorer.get_top_investment_opportunities(db, limit)}
+    return {"top_opportunities": get_investment_scorer().get_top_investment_opportunities(db, limit)}
 
 # COMPREHENSIVE AI ANALYSIS TRIGGER
 @app.post("/api/cars/{car_id}/full-ai-analysis")
-def trigger_full_ai_analysis(car_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_database)):
-    """Trigger all AI analyses for a car"""
-    car = db.query(Car).filter(Car.id == car_id).first()
-    if not car:
-        raise HTTPException(status_code=404, detail="Car not found")
-    
-    def run_full_analysis():
-        """Run all AI analyses in sequence"""
-        try:
-            print(f" Starting full AI analysis for car {car_id}")
-            
-            # 1. Gem Detection
-            gem_analysis = gem_detector.calculate_gem_score(car, db)
-            gem_score = GemScore(
-                car_id=car_id,
-                gem_score=gem_analysis["gem_score"],
-                reasons=gem_analysis["reasons"],
-                profit_potential=gem_analysis["profit_potential"],
-                risk_factors=gem_analysis["risk_factors"],
-                market_position=gem_analysis["market_position"],
-                confidence_level=gem_analysis["confidence_level"]
-            )
-            db.add(gem_score)
-            
-            # 2. Description Parsing
-            description_parser.parse_and_save(car, db)
-            
-            # 3. Photo Analysis (if images available)
-            if car.images:
-                photo_analyzer.analyze_and_save(car, db)
-            
-            # 4. Negotiation Strategy
-            strategy = negotiation_assistant.generate_negotiation_strategy(car, db)
-            negotiation_assistant.save_strategy(car, strategy, db)
-            
-            # 5. VIN Analysis (if VIN found)
-            vin_decoder.build_vehicle_history(car, db)
-            
-            # 6. Market Analysis
-            make_model = " ".join(car.title.split()[:2])
-            market_pulse = market_predictor.analyze_market_pulse(make_model, db)
-            if "error" not in market_pulse:
-                market_predictor.save_market_pulse(make_model, market_pulse, db)
-            
-            # 7. Sentiment Analysis
-            sentiment_analyzer.analyze_social_sentiment(make_model, db)
-            
-            # 8. Smart Comparison
-            comparison = comparison_engine.generate_comparison_report(car, db)
-            if "error" not in comparison:
-                comparison_engine.save_comparison(car, comparison, db)
-            
-            # 9. Maintenance Prediction
-            maintenance_prediction = maintenance_prophet.predict_maintenance_costs(car, db)
-            maintenance_prophet.save_maintenance_prediction(car, maintenance_prediction, db)
-            
-            # 10. Investment Score
-            investment_analysis = investment_scorer.calculate_investment_grade(car, db)
-            investment_scorer.save_investment_score(car, investment_analysis, db)
-            
-            db.commit()
-            print(f" Completed full AI analysis for car {car_id}")
-            
-        except Exception as e:
-            print(f" Error in full AI analysis for car {car_id}: {e}")
-            db.rollback()
+async def trigger_full_ai_analysis(car_id: str, background_tasks: BackgroundTasks, force: bool = False, car: Car = Depends(get_car_or_404), db: AsyncSession = Depends(get_async_database)):
+    """Trigger all AI analyses for a car (steps with a recent result are skipped unless force)"""
+    if not force:
+        for feature in FULL_ANALYSIS_FEATURES:
+            if not await has_fresh_result_async(db, feature, car_id):
+                break
+        else:
+            return {"status": "cached", "message": "All AI analyses for this car are recent, use force=true to rerun them"}
     
-    background_tasks.add_task(run_full_analysis)
+    job_id = f"full_ai_analysis:{car_id}"
+    if not await enqueue_job(background_tasks, "full_ai_analysis", car_id, force, job_id=job_id):
+        return {
+            "status": "already_queued",
+            "job_id": job_id,
+            "message": "A full AI analysis of this car is already queued or running"
+        }
     return {
-        "status": "started", 
+        "status": "started",
+        "job_id": job_id,
         "message": "Full AI analysis started - all 10 features will be processed",
         "estimated_time": "2-5 minutes"
     }
 
 # SCRAPER ENDPOINTS
-@app.get("/api/scrape/status")
-def get_scraper_status(db: Session = Depends(get_database)):
-    """Get scraper status and car count"""
-    total_cars = db.query(Car).count()
-    active_cars = db.query(Car).filter(Car.is_active == True).count()
-    recent_cars = db.query(Car).filter(
-        Car.first_seen > datetime.utcnow() - timedelta(hours=24)
-    ).count()
-    
-    return {
-        "total_cars": total_cars,
-        "active_cars": active_cars,
-        "recent_cars_24h": recent_cars,
-        "last_scrape": "auto-running",
-        "status": "healthy" if total_cars > 0 else "needs_data"
-    }
-
 @app.post("/api/scrape/run")
 def run_scraper_manual(background_tasks: BackgroundTasks):
     """Manually trigger scraper run"""
@@ -961,8 +927,8 @@ def run_scraper_manual(background_tasks: BackgroundTasks):
         """Run scraper in background with fallback strategy"""
         try:
             logger.info(" Attempting Scrapfly-enhanced scraping...")
-            scrapfly_scraper = ScrapflyLeboncoinScraper(department="69", max_cars=100)
-            scrapfly_scraper.run()
+            if not run_scrapfly(max_cars=100):
+                return {"status": "skipped", "message": "A scraper run is already in progress"}
             logger.info(" Scrapfly scraper completed successfully")
             return {"status": "success", "message": "Scrapfly scraper completed successfully"}
         except Exception as e:
@@ -1000,8 +966,7 @@ def test_scrapfly_scraper(background_tasks: BackgroundTasks):
     def run_scrapfly_test():
         try:
             logger.info(" Testing Scrapfly scraper...")
-            scrapfly_scraper = ScrapflyLeboncoinScraper(department="69", max_cars=10)
-            scrapfly_scraper.run()
+            run_scrapfly(max_cars=10)
             logger.info(" Scrapfly test completed")
         except Exception as e:
             logger.error(f" Scrapfly test failed: {e}")
@@ -1009,42 +974,6 @@ def test_scrapfly_scraper(background_tasks: BackgroundTasks):
     background_tasks.add_task(run_scrapfly_test)
     return {"status": "started", "message": "Scrapfly test started"}
 
-# AUTO-SCRAPER BACKGROUND TASK
-def start_background_scraper():
-    """Start background scraper that runs every 30 minutes"""
-    def scraper_loop():
-        while True:
-            try:
-                logger.info(" Auto-scraper starting...")
-                # Try Scrapfly first
-                try:
-                    scrapfly_scraper = ScrapflyLeboncoinScraper(department="69", max_cars=50)
-                    scrapfly_scraper.run()
-                    logger.info(" Auto-scraper (Scrapfly) completed")
-                except Exception as e:
-                    logger.warning(f"Auto-scraper Scrapfly failed: {e}, trying fallback...")
-                    # Fallback to original
-                    scraper = LeBonCoinScraper(department="69", max_cars=30)
-                    cars = scraper.scrape_cars()
-                    if cars:
-                        scraper.save_to_database(cars)
-                        logger.info(f" Auto-scraper (fallback) saved {len(cars)} cars")
-                
-                # Wait 30 minutes before next run
-                time.sleep(1800)  # 30 minutes
-                
-            except Exception as e:
-                logger.error(f" Auto-scraper error: {e}")
-                time.sleep(300)  # Wait 5 minutes on error before retry
-    
-    # Start scraper thread
-    scraper_thread = threading.Thread(target=scraper_loop, daemon=True)
-    scraper_thread.start()
-    logger.info(" Background auto-scraper started")
-
-# Start background scraper on app startup
-start_background_scraper()
-
 @app.get("/health")
 def health_check():
     return {
@@ -1,135 +1,324 @@
-import json
+import asyncio
+import logging
+import orjson
+import os
 import re
+import time
 from datetime import datetime, timedelta
-from statistics import mean, median
+from statistics import median
 import anthropic
-import os
-from sqlalchemy.orm import Session
+from sqlalchemy import case, func, insert
+from sqlalchemy.orm import Session, undefer
 from enhanced_database import Car, MaintenancePrediction
+from car_models import car_make_model, brand_key
+from ai_client import create_message, get_anthropic_client, new_async_anthropic_client
+from completion_cache import completion_key, get_completion, set_completion
 import uuid
+import bisect
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+INSIGHTS_MODEL = os.getenv("CLAUDE_MAINTENANCE_MODEL", "claude-3-sonnet-20240229")
+# Static instructions go in the system prompt; the user message only
+# carries the car's figures.
+INSIGHTS_SYSTEM_PROMPT = """Vous analysez les coûts de maintenance prévus d'une voiture française.
+Entrée: JSON {voiture, annee, km, fiabilite, total_5ans, moyenne_annuelle, couts_par_annee}.
+Répondez uniquement par un objet JSON compact en français, une phrase courte par clé:
+{"cost_assessment": "abordable|élevé|très élevé", "peak_years": "...", "cost_optimization": "...",
+"reliability_outlook": "...", "budget_planning": "...", "resale_impact": "..."}"""
+INSIGHTS_MAX_TOKENS = 300
+# Anything longer is a rambling answer, not the requested JSON object
+INSIGHTS_MAX_BYTES = 2000
+AI_INSIGHTS_CACHE_SIZE = 4096
+# Insights are shared by cars whose mileage rounds to the same step
+INSIGHTS_MILEAGE_STEP = 25000
+PRIORITY_RANK = {"high": 1, "medium": 2, "low": 3}
+# Reliability grades best first (as strings "A" would sort before "A+")
+RELIABILITY_GRADE_RANK = {
+    grade: rank for rank, grade in enumerate(("A+", "A", "A-", "B+", "B", "B-", "C+", "C", "C-", "D"))
+}
+# Returned (and not cached) when Claude stays too slow through the retries:
+# the cost prediction itself is still returned
+AI_INSIGHTS_TIMED_OUT = {"error": "AI insights timed out", "timed_out": True}
+
+# Prediction entries. Slotted dataclasses instead of per-entry dicts; orjson
+# serializes them natively, in field order, to the same JSON as before.
+
+@dataclass(slots=True)
+class YearlyPrediction:
+    year: int
+    vehicle_age: int
+    expected_mileage: int
+    routine_maintenance: int
+    wear_items: int
+    potential_repairs: int
+    total_cost: int
+    cumulative_cost: int
+    major_services: list
+
+@dataclass(slots=True)
+class MileageScheduleItem:
+    item: str
+    current_mileage: int
+    next_service_km: int
+    km_until_service: int
+    estimated_years: float
+    cost: int
+    priority: str
+
+@dataclass(slots=True)
+class TimedScheduleItem:
+    item: str
+    interval_years: int
+    years_until_service: int
+    cost: int
+    priority: str
+
+def _load_json(value):
+    return orjson.loads(value) if value else None
+
+def _index_major_services(schedule: dict) -> tuple:
+    """Major service lookup tables: km-based items over 200 sorted by interval
+    (searched by window), and time-based items by their year"""
+    major_km_items = sorted(
+        (item for item in schedule.values() if "interval_km" in item and item["cost"] > 200),
+        key=lambda item: item["interval_km"]
+    )
+    intervals = [item["interval_km"] for item in major_km_items]
+    km_services = [
+        {"service": item["description"], "cost": item["cost"], "mileage": item["interval_km"]}
+        for item in major_km_items
+    ]
+    timed_services = {}
+    for item in schedule.values():
+        if "interval_years" in item:
+            timed_services.setdefault(item["interval_years"], []).append({
+                "service": item["description"],
+                "cost": item["cost"],
+                "reason": f"Every {item['interval_years']} years"
+            })
+    return intervals, km_services, timed_services
+
+@lru_cache(maxsize=4096)  # titles recur across predictions and batch runs
+def _match_brand(brand_pattern, title: str) -> str:
+    """Leftmost brand of brand_pattern in the title, or generic"""
+    match = brand_pattern.search(title.lower())
+    return match.group(0) if match else "generic"
+
+def _sort_issues_by_probability(common_issues: dict) -> dict:
+    """common_issues with each age range's issues sorted most likely first"""
+    return {
+        brand: {
+            age_category: sorted(issues, key=lambda issue: issue["probability"], reverse=True)
+            for age_category, issues in ranges.items()
+        }
+        for brand, ranges in common_issues.items()
+    }
 
 class MaintenanceCostProphet:
+    # Maintenance cost data by brand (average annual costs in euros)
+    brand_maintenance_costs = {
+        "renault": {"base": 800, "multiplier": 1.0, "reliability": "B"},
+        "peugeot": {"base": 850, "multiplier": 1.1, "reliability": "B"},
+        "citroën": {"base": 900, "multiplier": 1.2, "reliability": "B-"},
+        "bmw": {"base": 1400, "multiplier": 1.8, "reliability": "C+"},
+        "mercedes": {"base": 1600, "multiplier": 2.0, "reliability": "C+"},
+        "audi": {"base": 1350, "multiplier": 1.7, "reliability": "C+"},
+        "volkswagen": {"base": 1100, "multiplier": 1.4, "reliability": "B"},
+        "toyota": {"base": 700, "multiplier": 0.8, "reliability": "A"},
+        "honda": {"base": 750, "multiplier": 0.9, "reliability": "A-"},
+        "nissan": {"base": 900, "multiplier": 1.1, "reliability": "B"},
+        "fiat": {"base": 950, "multiplier": 1.3, "reliability": "C"},
+        "ford": {"base": 900, "multiplier": 1.2, "reliability": "B-"},
+        "opel": {"base": 850, "multiplier": 1.1, "reliability": "B"},
+        "volvo": {"base": 1200, "multiplier": 1.5, "reliability": "B+"},
+        "alfa romeo": {"base": 1300, "multiplier": 1.7, "reliability": "C"}
+    }
+    
+    # Common maintenance schedules by component
+    maintenance_schedule = {
+        "oil_change": {"interval_km": 15000, "cost": 80, "description": "Vidange moteur"},
+        "oil_filter": {"interval_km": 15000, "cost": 25, "description": "Filtre à huile"},
+        "air_filter": {"interval_km": 30000, "cost": 40, "description": "Filtre à air"},
+        "spark_plugs": {"interval_km": 60000, "cost": 120, "description": "Bougies d'allumage"},
+        "brake_pads_front": {"interval_km": 40000, "cost": 180, "description": "Plaquettes frein avant"},
+        "brake_pads_rear": {"interval_km": 60000, "cost": 150, "description": "Plaquettes frein arrière"},
+        "brake_discs": {"interval_km": 80000, "cost": 350, "description": "Disques de frein"},
+        "timing_belt": {"interval_km": 120000, "cost": 600, "description": "Courroie de distribution"},
+        "shock_absorbers": {"interval_km": 100000, "cost": 400, "description": "Amortisseurs"},
+        "clutch": {"interval_km": 150000, "cost": 800, "description": "Embrayage"},
+        "battery": {"interval_years": 4, "cost": 120, "description": "Batterie"},
+        "tires": {"interval_km": 45000, "cost": 400, "description": "Pneumatiques"}
+    }
+    
+    # Age-based deterioration factors
+    age_deterioration = {
+        0: 1.0,   # New car
+        3: 1.1,   # 3 years
+        5: 1.3,   # 5 years
+        8: 1.6,   # 8 years
+        10: 2.0,  # 10 years
+        15: 2.8,  # 15+ years
+    }
+    
+    # Mileage-based wear factors
+    mileage_factors = {
+        50000: 1.0,
+        100000: 1.3,
+        150000: 1.7,
+        200000: 2.2,
+        250000: 3.0
+    }
+    
+    # Common issues by brand and age
+    common_issues = {
+        "bmw": {
+            "3-7_years": [
+                {"issue": "Système de refroidissement", "probability": 0.3, "cost": 800},
+                {"issue": "Capteurs électroniques", "probability": 0.4, "cost": 400},
+                {"issue": "Système d'injection", "probability": 0.2, "cost": 1200}
+            ],
+            "8-15_years": [
+                {"issue": "Suspension pneumatique", "probability": 0.5, "cost": 1500},
+                {"issue": "Boîte automatique", "probability": 0.3, "cost": 3000},
+                {"issue": "Turbocompresseur", "probability": 0.4, "cost": 2000}
+            ]
+        },
+        "mercedes": {
+            "3-7_years": [
+                {"issue": "Système électronique", "probability": 0.4, "cost": 600},
+                {"issue": "Climatisation", "probability": 0.3, "cost": 500}
+            ],
+            "8-15_years": [
+                {"issue": "Suspension Airmatic", "probability": 0.6, "cost": 2000},
+                {"issue": "Électronique complexe", "probability": 0.5, "cost": 1200}
+            ]
+        },
+        "audi": {
+            "3-7_years": [
+                {"issue": "Système Quattro", "probability": 0.25, "cost": 1000},
+                {"issue": "Électronique", "probability": 0.35, "cost": 500}
+            ],
+            "8-15_years": [
+                {"issue": "DSG/S-Tronic", "probability": 0.4, "cost": 2500},
+                {"issue": "Turbo", "probability": 0.3, "cost": 1800}
+            ]
+        },
+        "renault": {
+            "3-7_years": [
+                {"issue": "Électronique", "probability": 0.3, "cost": 300},
+                {"issue": "Injection diesel", "probability": 0.2, "cost": 800}
+            ],
+            "8-15_years": [
+                {"issue": "Boîte de vitesses", "probability": 0.3, "cost": 1500},
+                {"issue": "Moteur (joints)", "probability": 0.25, "cost": 1200}
+            ]
+        },
+        "peugeot": {
+            "3-7_years": [
+                {"issue": "FAP (filtre à particules)", "probability": 0.4, "cost": 600},
+                {"issue": "Électronique", "probability": 0.3, "cost": 350}
+            ],
+            "8-15_years": [
+                {"issue": "Distribution", "probability": 0.35, "cost": 800},
+                {"issue": "Suspension arrière", "probability": 0.3, "cost": 600}
+            ]
+        }
+    }
+
+    # Parts availability by brand tier (premium, French, other mainstream,
+    # other) and age bucket (<5, <10, <15, 15+ years)
+    _parts_availability = (
+        ("excellent", "very_good", "fair", "limited"),
+        ("excellent", "good", "good", "fair"),
+        ("excellent", "good", "good", "limited"),
+        ("excellent", "fair", "limited", "limited"),
+    )
+    _parts_tier = {
+        "bmw": 0, "mercedes": 0, "audi": 0, "volvo": 0,
+        "renault": 1, "peugeot": 1, "citroën": 1,
+        "volkswagen": 2, "toyota": 2, "honda": 2,
+    }
+
+    # Lookup tables derived once from the data above
+    _brand_pattern = re.compile("|".join(map(re.escape, brand_maintenance_costs)))
+    # Sorted thresholds for bisect lookups in _calculate_yearly_cost
+    _age_thresholds = sorted(age_deterioration)
+    _age_factors = list(map(age_deterioration.get, _age_thresholds))
+    _mileage_thresholds = sorted(mileage_factors)
+    _mileage_wear = list(map(mileage_factors.get, _mileage_thresholds))
+    _major_km_intervals, _major_km_services, _timed_services = _index_major_services(maintenance_schedule)
+    _issues_by_probability = _sort_issues_by_probability(common_issues)
+
     def __init__(self):
         try:
-            self.anthropic_client = anthropic.Anthropic(
-                api_key=os.getenv("ANTHROPIC_API_KEY")
-            ) if os.getenv("ANTHROPIC_API_KEY") else None
+            # Shared client: pooled connections, per-attempt timeout and retries
+            self.anthropic_client = get_anthropic_client()
         except Exception as e:
             print(f"Warning: Anthropic client initialization failed in maintenance_cost_prophet: {e}")
             self.anthropic_client = None
         
-        # Maintenance cost data by brand (average annual costs in euros)
-        self.brand_maintenance_costs = {
-            "renault": {"base": 800, "multiplier": 1.0, "reliability": "B"},
-            "peugeot": {"base": 850, "multiplier": 1.1, "reliability": "B"},
-            "citroën": {"base": 900, "multiplier": 1.2, "reliability": "B-"},
-            "bmw": {"base": 1400, "multiplier": 1.8, "reliability": "C+"},
-            "mercedes": {"base": 1600, "multiplier": 2.0, "reliability": "C+"},
-            "audi": {"base": 1350, "multiplier": 1.7, "reliability": "C+"},
-            "volkswagen": {"base": 1100, "multiplier": 1.4, "reliability": "B"},
-            "toyota": {"base": 700, "multiplier": 0.8, "reliability": "A"},
-            "honda": {"base": 750, "multiplier": 0.9, "reliability": "A-"},
-            "nissan": {"base": 900, "multiplier": 1.1, "reliability": "B"},
-            "fiat": {"base": 950, "multiplier": 1.3, "reliability": "C"},
-            "ford": {"base": 900, "multiplier": 1.2, "reliability": "B-"},
-            "opel": {"base": 850, "multiplier": 1.1, "reliability": "B"},
-            "volvo": {"base": 1200, "multiplier": 1.5, "reliability": "B+"},
-            "alfa romeo": {"base": 1300, "multiplier": 1.7, "reliability": "C"}
-        }
-        
-        # Common maintenance schedules by component
-        self.maintenance_schedule = {
-            "oil_change": {"interval_km": 15000, "cost": 80, "description": "Vidange moteur"},
-            "oil_filter": {"interval_km": 15000, "cost": 25, "description": "Filtre à huile"},
-            "air_filter": {"interval_km": 30000, "cost": 40, "description": "Filtre à air"},
-            "spark_plugs": {"interval_km": 60000, "cost": 120, "description": "Bougies d'allumage"},
-            "brake_pads_front": {"interval_km": 40000, "cost": 180, "description": "Plaquettes frein avant"},
-            "brake_pads_rear": {"interval_km": 60000, "cost": 150, "description": "Plaquettes frein arrière"},
-            "brake_discs": {"interval_km": 80000, "cost": 350, "description": "Disques de frein"},
-            "timing_belt": {"interval_km": 120000, "cost": 600, "description": "Courroie de distribution"},
-            "shock_absorbers": {"interval_km": 100000, "cost": 400, "description": "Amortisseurs"},
-            "clutch": {"interval_km": 150000, "cost": 800, "description": "Embrayage"},
-            "battery": {"interval_years": 4, "cost": 120, "description": "Batterie"},
-            "tires": {"interval_km": 45000, "cost": 400, "description": "Pneumatiques"}
-        }
-        
-        # Age-based deterioration factors
-        self.age_deterioration = {
-            0: 1.0,   # New car
-            3: 1.1,   # 3 years
-            5: 1.3,   # 5 years
-            8: 1.6,   # 8 years
-            10: 2.0,  # 10 years
-            15: 2.8,  # 15+ years
-        }
-        
-        # Mileage-based wear factors
-        self.mileage_factors = {
-            50000: 1.0,
-            100000: 1.3,
-            150000: 1.7,
-            200000: 2.2,
-            250000: 3.0
-        }
-        
-        # Common issues by brand and age
-        self.common_issues = {
-            "bmw": {
-                "3-7_years": [
-                    {"issue": "Système de refroidissement", "probability": 0.3, "cost": 800},
-                    {"issue": "Capteurs électroniques", "probability": 0.4, "cost": 400},
-                    {"issue": "Système d'injection", "probability": 0.2, "cost": 1200}
-                ],
-                "8-15_years": [
-                    {"issue": "Suspension pneumatique", "probability": 0.5, "cost": 1500},
-                    {"issue": "Boîte automatique", "probability": 0.3, "cost": 3000},
-                    {"issue": "Turbocompresseur", "probability": 0.4, "cost": 2000}
-                ]
-            },
-            "mercedes": {
-                "3-7_years": [
-                    {"issue": "Système électronique", "probability": 0.4, "cost": 600},
-                    {"issue": "Climatisation", "probability": 0.3, "cost": 500}
-                ],
-                "8-15_years": [
-                    {"issue": "Suspension Airmatic", "probability": 0.6, "cost": 2000},
-                    {"issue": "Électronique complexe", "probability": 0.5, "cost": 1200}
-                ]
-            },
-            "audi": {
-                "3-7_years": [
-                    {"issue": "Système Quattro", "probability": 0.25, "cost": 1000},
-                    {"issue": "Électronique", "probability": 0.35, "cost": 500}
-                ],
-                "8-15_years": [
-                    {"issue": "DSG/S-Tronic", "probability": 0.4, "cost": 2500},
-                    {"issue": "Turbo", "probability": 0.3, "cost": 1800}
-                ]
-            },
-            "renault": {
-                "3-7_years": [
-                    {"issue": "Électronique", "probability": 0.3, "cost": 300},
-                    {"issue": "Injection diesel", "probability": 0.2, "cost": 800}
-                ],
-                "8-15_years": [
-                    {"issue": "Boîte de vitesses", "probability": 0.3, "cost": 1500},
-                    {"issue": "Moteur (joints)", "probability": 0.25, "cost": 1200}
-                ]
-            },
-            "peugeot": {
-                "3-7_years": [
-                    {"issue": "FAP (filtre à particules)", "probability": 0.4, "cost": 600},
-                    {"issue": "Électronique", "probability": 0.3, "cost": 350}
-                ],
-                "8-15_years": [
-                    {"issue": "Distribution", "probability": 0.35, "cost": 800},
-                    {"issue": "Suspension arrière", "probability": 0.3, "cost": 600}
-                ]
-            }
-        }
+        # Claude insights by _insights_key, least recently used first: similar
+        # cars reuse a completion
+        self._ai_cache = OrderedDict()
 
-    def predict_maintenance_costs(self, car: Car, db: Session) -> dict:
+    def predict_maintenance_costs(self, car: Car, db: Session, now_year: int = None) -> dict:
         """Predict maintenance costs for the next 5 years"""
+        prediction, brand_profile = self._predict_costs(car, now_year or datetime.now().year)
+        prediction["ai_insights"] = self._generate_ai_maintenance_insights(
+            car, prediction["predicted_costs"], brand_profile
+        )
+        return prediction
+
+    async def predict_many(self, cars: list, max_concurrency: int = 8) -> dict:
+        """Predict maintenance costs for many cars, Claude calls run concurrently.
+
+        At most `max_concurrency` calls are in flight. Returns {car_id: prediction}.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        client = new_async_anthropic_client() if self.anthropic_client else None
+        costs = self.predict_all(cars)
+        
+        async def predict_one(car, prediction, brand_profile):
+            async with semaphore:
+                prediction["ai_insights"] = await self._generate_ai_maintenance_insights_async(
+                    car, prediction["predicted_costs"], brand_profile, client
+                )
+            return prediction
+        
+        try:
+            predictions = await asyncio.gather(
+                *(predict_one(car, *car_costs) for car, car_costs in zip(cars, costs)), return_exceptions=True
+            )
+        finally:
+            if client:
+                await client.close()
+        
+        results = {}
+        for car, prediction in zip(cars, predictions):
+            if isinstance(prediction, Exception):
+                logger.warning("Maintenance prediction failed for car %s: %s", car.id, prediction, extra={"car_id": car.id})
+            else:
+                results[car.id] = prediction
+        return results
+
+    def predict_all(self, cars: list, now_year: int = None) -> list:
+        """Cost predictions without AI insights, as (prediction, brand_profile) in car order"""
+        now_year = now_year or datetime.now().year  # once for the whole batch
+        return [self._predict_costs(car, now_year) for car in cars]
+
+    async def predict_and_save_many(self, cars: list, db: Session, max_concurrency: int = 8) -> dict:
+        """predict_many, then save all predictions in one commit"""
+        predictions = await self.predict_many(cars, max_concurrency)
+        cars_by_id = {car.id: car for car in cars}
+        self.save_many([(cars_by_id[car_id], prediction) for car_id, prediction in predictions.items()], db)
+        return predictions
+
+    def _predict_costs(self, car: Car, now_year: int) -> tuple:
+        """Cost prediction without the AI insights: (prediction, brand_profile)"""
         
         # Extract brand from title
         brand = self._extract_brand(car.title)
@@ -140,34 +329,37 @@ class MaintenanceCostProphet:
         })
         
         # Calculate current vehicle profile
-        current_age = datetime.now().year - (car.year or 2010)
+        current_age = now_year - (car.year or 2010)
         current_mileage = car.mileage or 100000
         
         # Generate yearly predictions
         yearly_predictions = []
         cumulative_cost = 0
         
+        # Brand cost components, constant over the 5 years
+        cost_bases = self._cost_bases(brand_profile)
+        
         for year in range(1, 6):  # Next 5 years
             future_age = current_age + year
             future_mileage = current_mileage + (15000 * year)  # Assume 15k km/year
             
             yearly_cost = self._calculate_yearly_cost(
-                brand_profile, future_age, future_mileage, year
+                cost_bases, future_age, future_mileage, year
             )
             
             cumulative_cost += yearly_cost["total_cost"]
             
-            yearly_predictions.append({
-                "year": year,
-                "vehicle_age": future_age,
-                "expected_mileage": future_mileage,
-                "routine_maintenance": yearly_cost["routine"],
-                "wear_items": yearly_cost["wear_items"],
-                "potential_repairs": yearly_cost["repairs"],
-                "total_cost": yearly_cost["total_cost"],
-                "cumulative_cost": cumulative_cost,
-                "major_services": yearly_cost["major_services"]
-            })
+            yearly_predictions.append(YearlyPrediction(
+                year=year,
+                vehicle_age=future_age,
+                expected_mileage=future_mileage,
+                routine_maintenance=yearly_cost["routine"],
+                wear_items=yearly_cost["wear_items"],
+                potential_repairs=yearly_cost["repairs"],
+                total_cost=yearly_cost["total_cost"],
+                cumulative_cost=cumulative_cost,
+                major_services=yearly_cost["major_services"]
+            ))
         
         # Generate maintenance schedule
         maintenance_schedule = self._generate_maintenance_schedule(
@@ -180,9 +372,6 @@ class MaintenanceCostProphet:
         # Calculate parts availability
         parts_availability = self._assess_parts_availability(brand, current_age)
         
-        # Generate AI insights
-        ai_insights = self._generate_ai_maintenance_insights(car, yearly_predictions, brand_profile)
-        
         return {
             "car_info": {
                 "id": car.id,
@@ -198,48 +387,42 @@ class MaintenanceCostProphet:
             "parts_availability": parts_availability,
             "reliability_grade": brand_profile["reliability"],
             "cost_category": self._categorize_costs(cumulative_cost),
-            "ai_insights": ai_insights,
+            "ai_insights": None,  # filled in by the caller
             "recommendations": self._generate_maintenance_recommendations(
-                yearly_predictions, brand_profile, parts_availability
+                yearly_predictions, brand_profile, parts_availability, now_year
             )
-        }
+        }, brand_profile
 
     def _extract_brand(self, title: str) -> str:
-        """Extract car brand from title"""
-        title_lower = title.lower()
-        
-        # Check each brand
-        for brand in self.brand_maintenance_costs.keys():
-            if brand in title_lower:
-                return brand
-        
-        # Default to generic if not found
-        return "generic"
+        """Extract car brand from title (generic if none is found)"""
+        # One scan for all brands, leftmost brand in the title wins
+        return _match_brand(self._brand_pattern, title)
+
+    def _cost_bases(self, brand_profile: dict) -> tuple:
+        """(routine, wear items base, repairs base) yearly costs of a brand"""
+        base_cost = brand_profile["base"]
+        return (
+            base_cost * 0.4,  # 40% routine maintenance
+            base_cost * 0.3,  # 30% wear items, adjusted by age
+            base_cost * 0.3 * brand_profile["multiplier"]  # 30% repairs, adjusted by brand & mileage
+        )
 
-    def _calculate_yearly_cost(self, brand_profile: dict, age: int, mileage: int, year: int) -> dict:
+    def _calculate_yearly_cost(self, cost_bases: tuple, age: int, mileage: int, year: int) -> dict:
         """Calculate maintenance cost for a specific year"""
         
-        base_cost = brand_profile["base"]
-        multiplier = brand_profile["multiplier"]
+        routine_cost, wear_items_base, repair_base = cost_bases
         
-        # Age deterioration factor
-        age_factor = 1.0
-        for age_threshold in sorted(self.age_deterioration.keys(), reverse=True):
-            if age >= age_threshold:
-                age_factor = self.age_deterioration[age_threshold]
-                break
+        # Age deterioration factor: highest threshold <= age
+        i = bisect.bisect_right(self._age_thresholds, age) - 1
+        age_factor = self._age_factors[i] if i >= 0 else 1.0
         
         # Mileage wear factor
-        mileage_factor = 1.0
-        for mileage_threshold in sorted(self.mileage_factors.keys(), reverse=True):
-            if mileage >= mileage_threshold:
-                mileage_factor = self.mileage_factors[mileage_threshold]
-                break
+        i = bisect.bisect_right(self._mileage_thresholds, mileage) - 1
+        mileage_factor = self._mileage_wear[i] if i >= 0 else 1.0
         
         # Calculate component costs
-        routine_cost = base_cost * 0.4  # 40% routine maintenance
-        wear_items_cost = base_cost * 0.3 * age_factor  # 30% wear items, age adjusted
-        repair_cost = base_cost * 0.3 * multiplier * mileage_factor  # 30% repairs, brand & mileage adjusted
+        wear_items_cost = wear_items_base * age_factor
+        repair_cost = repair_base * mileage_factor
         
         # Major services (timing belt, clutch, etc.)
         major_services = self._get_major_services_for_year(mileage, year)
@@ -257,79 +440,65 @@ class MaintenanceCostProphet:
 
     def _get_major_services_for_year(self, mileage: int, year: int) -> list:
         """Get major services needed in a specific year"""
-        services = []
+        # Km-based services due this year (within 15k km range)
+        start = bisect.bisect_left(self._major_km_intervals, mileage - 7500)
+        end = bisect.bisect_right(self._major_km_intervals, mileage + 7500)
+        services = [dict(service) for service in self._major_km_services[start:end]]
         
-        # Check each maintenance item
-        for item_name, item_data in self.maintenance_schedule.items():
-            if "interval_km" in item_data:
-                # Check if service is due this year (within 15k km range)
-                if (mileage - 7500) <= item_data["interval_km"] <= (mileage + 7500):
-                    # Check if it's a major service (cost > 200)
-                    if item_data["cost"] > 200:
-                        services.append({
-                            "service": item_data["description"],
-                            "cost": item_data["cost"],
-                            "mileage": item_data["interval_km"]
-                        })
-            elif "interval_years" in item_data:
-                # Time-based service
-                if year == item_data["interval_years"]:
-                    services.append({
-                        "service": item_data["description"],
-                        "cost": item_data["cost"],
-                        "reason": f"Every {item_data['interval_years']} years"
-                    })
+        # Time-based services
+        services.extend(dict(service) for service in self._timed_services.get(year, ()))
         
         return services
 
     def _generate_maintenance_schedule(self, car: Car, current_mileage: int, current_age: int) -> list:
         """Generate detailed maintenance schedule"""
-        schedule = []
+        # (priority rank, years until service, position, entry): sorting these
+        # tuples orders by priority then time, stable on ties, with no key function
+        keyed = []
         
-        for item_name, item_data in self.maintenance_schedule.items():
+        for item_data in self.maintenance_schedule.values():
             if "interval_km" in item_data:
                 # Calculate when next service is due
                 next_service_km = ((current_mileage // item_data["interval_km"]) + 1) * item_data["interval_km"]
                 km_until_service = next_service_km - current_mileage
                 
                 # Estimate when this will occur (assuming 15k km/year)
-                years_until_service = km_until_service / 15000
+                estimated_years = round(km_until_service / 15000, 1)
+                priority = "high" if km_until_service < 10000 else "medium" if km_until_service < 30000 else "low"
                 
-                schedule.append({
-                    "item": item_data["description"],
-                    "current_mileage": current_mileage,
-                    "next_service_km": next_service_km,
-                    "km_until_service": km_until_service,
-                    "estimated_years": round(years_until_service, 1),
-                    "cost": item_data["cost"],
-                    "priority": "high" if km_until_service < 10000 else "medium" if km_until_service < 30000 else "low"
-                })
+                keyed.append((PRIORITY_RANK[priority], estimated_years, len(keyed), MileageScheduleItem(
+                    item=item_data["description"],
+                    current_mileage=current_mileage,
+                    next_service_km=next_service_km,
+                    km_until_service=km_until_service,
+                    estimated_years=estimated_years,
+                    cost=item_data["cost"],
+                    priority=priority
+                )))
             elif "interval_years" in item_data:
                 # Time-based maintenance
                 years_until_service = item_data["interval_years"] - (current_age % item_data["interval_years"])
+                priority = "high" if years_until_service <= 1 else "medium"
                 
-                schedule.append({
-                    "item": item_data["description"],
-                    "interval_years": item_data["interval_years"],
-                    "years_until_service": years_until_service,
-                    "cost": item_data["cost"],
-                    "priority": "high" if years_until_service <= 1 else "medium"
-                })
+                keyed.append((PRIORITY_RANK[priority], years_until_service, len(keyed), TimedScheduleItem(
+                    item=item_data["description"],
+                    interval_years=item_data["interval_years"],
+                    years_until_service=years_until_service,
+                    cost=item_data["cost"],
+                    priority=priority
+                )))
         
         # Sort by priority and time until service
-        priority_order = {"high": 1, "medium": 2, "low": 3}
-        schedule.sort(key=lambda x: (priority_order.get(x["priority"], 3), 
-                                   x.get("years_until_service", x.get("estimated_years", 5))))
-        
-        return schedule
+        keyed.sort()
+        return [entry for _, _, _, entry in keyed]
 
     def _get_common_repairs(self, brand: str, avg_age: int) -> list:
         """Get common repairs for brand and age range"""
         
-        if brand not in self.common_issues:
+        if brand not in self._issues_by_probability:
             return []
         
-        brand_issues = self.common_issues[brand]
+        brand_issues = self._issues_by_probability[brand]
         
         # Determine age category
         if 3 <= avg_age <= 7:
@@ -342,39 +511,14 @@ class MaintenanceCostProphet:
         if age_category not in brand_issues:
             return []
         
-        issues = brand_issues[age_category]
-        
-        # Sort by probability (most likely first)
-        return sorted(issues, key=lambda x: x["probability"], reverse=True)
+        # Already sorted by probability (most likely first)
+        return list(brand_issues[age_category])
 
     def _assess_parts_availability(self, brand: str, age: int) -> str:
         """Assess parts availability based on brand and age"""
-        
-        # Premium brands generally have better parts availability
-        premium_brands = ["bmw", "mercedes", "audi", "volvo"]
-        mainstream_brands = ["renault", "peugeot", "citroën", "volkswagen", "toyota", "honda"]
-        
-        if age < 5:
-            return "excellent"
-        elif age < 10:
-            if brand in premium_brands:
-                return "very_good"
-            elif brand in mainstream_brands:
-                return "good"
-            else:
-                return "fair"
-        elif age < 15:
-            if brand in mainstream_brands:
-                return "good"
-            elif brand in premium_brands:
-                return "fair"
-            else:
-                return "limited"
-        else:
-            if brand in ["renault", "peugeot", "citroën"]:
-                return "fair"
-            else:
-                return "limited"
+        tier = self._parts_tier.get(brand, len(self._parts_availability) - 1)
+        age_bucket = (age >= 5) + (age >= 10) + (age >= 15)
+        return self._parts_availability[tier][age_bucket]
 
     def _categorize_costs(self, total_5year_cost: int) -> str:
         """Categorize maintenance costs"""
@@ -387,56 +531,131 @@ class MaintenanceCostProphet:
         else:
             return "very_high"
 
+    def _insights_key(self, car: Car, predictions: list) -> tuple:
+        """Cars of the same model and year with similar mileage and cost get the same insights.
+
+        Covers every car-specific field of _insights_prompt, so a cached text
+        never names another car.
+        """
+        return (
+            car_make_model(car), car.year, self._rounded_mileage(car), predictions[-1].cumulative_cost // 500
+        )
+
+    def _rounded_mileage(self, car: Car):
+        if car.mileage is None:
+            return None
+        return round(car.mileage / INSIGHTS_MILEAGE_STEP) * INSIGHTS_MILEAGE_STEP
+
+    def _insights_prompt(self, car: Car, predictions: list, brand_profile: dict) -> str:
+        total_cost = predictions[-1].cumulative_cost
+        return orjson.dumps({
+            "voiture": car_make_model(car),
+            "annee": car.year,
+            "km": self._rounded_mileage(car),
+            "fiabilite": brand_profile["reliability"],
+            "total_5ans": total_cost,
+            "moyenne_annuelle": round(total_cost / 5),
+            "couts_par_annee": {p.year: p.total_cost for p in predictions[:3]},
+        }, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def _insights_completion_key(self, prompt: str) -> str:
+        return completion_key(INSIGHTS_MODEL, f"{INSIGHTS_SYSTEM_PROMPT}\n{prompt}")
+
+    def _parse_insights(self, message) -> dict:
+        text = message.content[0].text
+        if message.stop_reason == "max_tokens" or len(text.encode()) > INSIGHTS_MAX_BYTES:
+            raise ValueError(f"response too long ({len(text)} chars)")
+        return orjson.loads(text)
+
+    def _cached_insights(self, key: tuple):
+        try:
+            self._ai_cache.move_to_end(key)
+            return self._ai_cache[key]
+        except KeyError:
+            return None
+
+    def _cache_insights(self, key: tuple, insights: dict) -> dict:
+        if len(self._ai_cache) >= AI_INSIGHTS_CACHE_SIZE:
+            self._ai_cache.popitem(last=False)
+        self._ai_cache[key] = insights
+        return insights
+
     def _generate_ai_maintenance_insights(self, car: Car, predictions: list, brand_profile: dict) -> dict:
         """Generate AI insights about maintenance costs"""
         
         if not self.anthropic_client:
             return {"error": "AI analysis not available"}
         
+        key = self._insights_key(car, predictions)
+        cached = self._cached_insights(key)
+        if cached is not None:
+            return cached
+        
+        prompt = self._insights_prompt(car, predictions, brand_profile)
+        stored_key = self._insights_completion_key(prompt)
+        stored = get_completion(stored_key)
+        if stored is not None:
+            return self._cache_insights(key, stored)
+        
         try:
-            total_cost = predictions[-1]["cumulative_cost"]
-            avg_annual_cost = total_cost / 5
-            
-            prompt = f"""
-            Analysez les coûts de maintenance prévus pour cette voiture française:
-            
-            Voiture: {car.title}
-            Année: {car.year}
-            Kilométrage: {car.mileage} km
-            Coût total 5 ans: {total_cost}€
-            Coût annuel moyen: {avg_annual_cost:.0f}€
-            Fiabilité marque: {brand_profile["reliability"]}
-            
-            Coûts par année:
-            {chr(10).join([f"Année {p['year']}: {p['total_cost']}€" for p in predictions[:3]])}
-            
-            Fournissez une analyse en JSON avec:
-            1. cost_assessment: évaluation des coûts (abordable/élevé/très élevé)
-            2. peak_years: années avec coûts les plus élevés et pourquoi
-            3. cost_optimization: conseils pour réduire les coûts
-            4. reliability_outlook: perspective de fiabilité
-            5. budget_planning: conseils de planification budgétaire
-            6. resale_impact: impact sur la valeur de revente
+            started = time.monotonic()
+            message = self.anthropic_client.messages.create(
+                model=INSIGHTS_MODEL,
+                max_tokens=INSIGHTS_MAX_TOKENS,
+                system=INSIGHTS_SYSTEM_PROMPT,
+                messages=[{"role": "user", "content": prompt}]
+            )
             
-            Répondez uniquement en JSON français.
-            """
+            insights = self._parse_insights(message)
+            set_completion(stored_key, insights, time.monotonic() - started)
+            return self._cache_insights(key, insights)
             
-            message = self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=700,
+        except anthropic.APITimeoutError:
+            return dict(AI_INSIGHTS_TIMED_OUT)
+        except Exception as e:
+            return {"error": f"AI insights failed: {str(e)}"}
+
+    async def _generate_ai_maintenance_insights_async(self, car: Car, predictions: list, brand_profile: dict, client) -> dict:
+        """Async variant of _generate_ai_maintenance_insights for bulk runs"""
+        
+        if not client:
+            return {"error": "AI analysis not available"}
+        
+        key = self._insights_key(car, predictions)
+        cached = self._cached_insights(key)
+        if cached is not None:
+            return cached
+        
+        prompt = self._insights_prompt(car, predictions, brand_profile)
+        stored_key = self._insights_completion_key(prompt)
+        stored = await asyncio.to_thread(get_completion, stored_key)
+        if stored is not None:
+            return self._cache_insights(key, stored)
+        
+        try:
+            started = time.monotonic()
+            message = await create_message(
+                client,
+                model=INSIGHTS_MODEL,
+                max_tokens=INSIGHTS_MAX_TOKENS,
+                system=INSIGHTS_SYSTEM_PROMPT,
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            return json.loads(message.content[0].text)
+            insights = self._parse_insights(message)
+            await asyncio.to_thread(set_completion, stored_key, insights, time.monotonic() - started)
+            return self._cache_insights(key, insights)
             
+        except (asyncio.TimeoutError, anthropic.APITimeoutError):
+            return dict(AI_INSIGHTS_TIMED_OUT)
         except Exception as e:
             return {"error": f"AI insights failed: {str(e)}"}
 
-    def _generate_maintenance_recommendations(self, predictions: list, brand_profile: dict, parts_availability: str) -> list:
+    def _generate_maintenance_recommendations(self, predictions: list, brand_profile: dict, parts_availability: str, now_year: int) -> list:
         """Generate maintenance recommendations"""
         
         recommendations = []
-        total_cost = predictions[-1]["cumulative_cost"]
+        total_cost = predictions[-1].cumulative_cost
         avg_annual = total_cost / 5
         
         # Cost-based recommendations
@@ -458,53 +677,89 @@ class MaintenanceCostProphet:
             recommendations.append("🔧 Pièces facilement disponibles")
         
         # Age-based recommendations
-        current_age = datetime.now().year - (predictions[0].get("vehicle_age", 10) - 1)
+        current_age = now_year - (predictions[0].vehicle_age - 1)
         if current_age > 10:
             recommendations.append("📅 Véhicule ancien - Inspectez état avant achat")
         
         # Peak cost years
-        peak_years = sorted(predictions, key=lambda x: x["total_cost"], reverse=True)[:2]
-        if peak_years[0]["total_cost"] > avg_annual * 1.5:
-            recommendations.append(f"📈 Année {peak_years[0]['year']}: coûts élevés prévus ({peak_years[0]['total_cost']}€)")
+        peak_years = sorted(predictions, key=lambda x: x.total_cost, reverse=True)[:2]
+        if peak_years[0].total_cost > avg_annual * 1.5:
+            recommendations.append(f"📈 Année {peak_years[0].year}: coûts élevés prévus ({peak_years[0].total_cost}€)")
         
         return recommendations
 
+    def _prediction_row(self, car: Car, prediction_data: dict) -> dict:
+        """maintenance_predictions column values for a prediction"""
+        
+        make_model = car_make_model(car) if car.title else "Unknown"
+        return {
+            "id": str(uuid.uuid4()),
+            "car_id": car.id,
+            "make_model": make_model,
+            "brand": brand_key(make_model) if make_model.strip() else None,
+            # Text columns: stored as JSON strings
+            "predicted_costs": orjson.dumps(prediction_data["predicted_costs"]).decode(),
+            "maintenance_schedule": orjson.dumps(prediction_data["maintenance_schedule"]).decode(),
+            "common_repairs": orjson.dumps(prediction_data["common_repairs"]).decode(),
+            "parts_availability": prediction_data["parts_availability"],
+            "total_5year_cost": prediction_data["total_5year_cost"],
+            "reliability_grade": prediction_data["reliability_grade"]
+        }
+
+    def build_prediction_record(self, car: Car, prediction_data: dict):
+        """MaintenancePrediction row for a prediction (not added to a session)"""
+        return MaintenancePrediction(**self._prediction_row(car, prediction_data))
+
+    def save_many(self, pairs: list, db: Session) -> list:
+        """Save (car, prediction) pairs with one executemany INSERT and one commit; returns the ids"""
+        rows = [self._prediction_row(car, prediction_data) for car, prediction_data in pairs]
+        if rows:
+            db.execute(insert(MaintenancePrediction), rows)
+            db.commit()
+        return [row["id"] for row in rows]
+
     def save_maintenance_prediction(self, car: Car, prediction_data: dict, db: Session) -> str:
         """Save maintenance prediction to database"""
-        
-        prediction = MaintenancePrediction(
-            id=str(uuid.uuid4()),
-            car_id=car.id,
-            make_model=car.title.split()[0:2] if car.title else ["Unknown"],
-            predicted_costs=prediction_data["predicted_costs"],
-            maintenance_schedule=prediction_data["maintenance_schedule"],
-            common_repairs=prediction_data["common_repairs"],
-            parts_availability=prediction_data["parts_availability"],
-            total_5year_cost=prediction_data["total_5year_cost"],
-            reliability_grade=prediction_data["reliability_grade"]
-        )
-        
-        db.add(prediction)
-        db.commit()
-        
-        return prediction.id
+        return self.save_many([(car, prediction_data)], db)[0]
 
     def get_maintenance_insights(self, car_id: str, db: Session) -> dict:
-        """Get maintenance insights for a specific car"""
+        """Get maintenance insights summary for a specific car (JSON details stay deferred)"""
         
         prediction = db.query(MaintenancePrediction).filter(
             MaintenancePrediction.car_id == car_id
-        ).first()
+        ).order_by(MaintenancePrediction.calculated_at.desc()).first()
+        
+        if not prediction:
+            return {"message": "No maintenance prediction available"}
+        
+        return {
+            "car_id": prediction.car_id,
+            "total_5year_cost": prediction.total_5year_cost,
+            "parts_availability": prediction.parts_availability,
+            "reliability_grade": prediction.reliability_grade,
+            "calculated_at": prediction.calculated_at.isoformat()
+        }
+
+    def get_maintenance_insights_full(self, car_id: str, db: Session) -> dict:
+        """Maintenance insights with the yearly costs, schedule and common repairs"""
+        
+        prediction = db.query(MaintenancePrediction).options(
+            undefer(MaintenancePrediction.predicted_costs),
+            undefer(MaintenancePrediction.maintenance_schedule),
+            undefer(MaintenancePrediction.common_repairs)
+        ).filter(
+            MaintenancePrediction.car_id == car_id
+        ).order_by(MaintenancePrediction.calculated_at.desc()).first()
         
         if not prediction:
             return {"message": "No maintenance prediction available"}
         
         return {
             "car_id": prediction.car_id,
-            "predicted_costs": prediction.predicted_costs,
+            "predicted_costs": _load_json(prediction.predicted_costs),
             "total_5year_cost": prediction.total_5year_cost,
-            "maintenance_schedule": prediction.maintenance_schedule,
-            "common_repairs": prediction.common_repairs,
+            "maintenance_schedule": _load_json(prediction.maintenance_schedule),
+            "common_repairs": _load_json(prediction.common_repairs),
             "parts_availability": prediction.parts_availability,
             "reliability_grade": prediction.reliability_grade,
             "calculated_at": prediction.calculated_at.isoformat()
@@ -513,35 +768,48 @@ class MaintenanceCostProphet:
     def get_cost_comparison_by_brand(self, db: Session) -> dict:
         """Get maintenance cost comparison by brand"""
         
-        predictions = db.query(MaintenancePrediction).all()
+        cost = MaintenancePrediction.total_5year_cost
+        brand = MaintenancePrediction.brand
+        has_cost = [brand.isnot(None), cost.isnot(None)]
+        postgres = db.get_bind().dialect.name == "postgresql"
         
-        brand_costs = {}
+        # Average and count per brand (and the median where the database has one)
+        columns = [brand, func.avg(cost), func.count(cost)]
+        if postgres:
+            columns.append(func.percentile_cont(0.5).within_group(cost))
+        stats = db.query(*columns).filter(*has_cost).group_by(brand).all()
         
-        for prediction in predictions:
-            if prediction.make_model and len(prediction.make_model) > 0:
-                brand = prediction.make_model[0].lower()
-                
-                if brand not in brand_costs:
-                    brand_costs[brand] = {
-                        "costs": [],
-                        "reliability_grades": [],
-                        "count": 0
-                    }
-                
-                brand_costs[brand]["costs"].append(prediction.total_5year_cost)
-                brand_costs[brand]["reliability_grades"].append(prediction.reliability_grade)
-                brand_costs[brand]["count"] += 1
-        
-        # Calculate averages
-        comparison = {}
-        for brand, data in brand_costs.items():
-            if data["count"] > 0:
-                comparison[brand] = {
-                    "average_5year_cost": int(mean(data["costs"])),
-                    "median_5year_cost": int(median(data["costs"])),
-                    "sample_count": data["count"],
-                    "common_reliability_grade": max(set(data["reliability_grades"]), key=data["reliability_grades"].count) if data["reliability_grades"] else "Unknown"
-                }
+        if postgres:
+            medians = {row[0]: row[3] for row in stats}
+        else:
+            # Costs only, grouped in Python for the median
+            costs_by_brand = {}
+            for row_brand, row_cost in db.query(brand, cost).filter(*has_cost):
+                costs_by_brand.setdefault(row_brand, []).append(row_cost)
+            medians = {row_brand: median(costs) for row_brand, costs in costs_by_brand.items()}
+        
+        # Most common reliability grade per brand: counted by the database and
+        # ordered most frequent first (best grade on ties), so the first row wins
+        grade = MaintenancePrediction.reliability_grade
+        common_grades = {}
+        grade_counts = db.query(brand, grade).filter(*has_cost, grade.isnot(None)).group_by(
+            brand, grade
+        ).order_by(
+            brand, func.count().desc(),
+            case(RELIABILITY_GRADE_RANK, value=grade, else_=len(RELIABILITY_GRADE_RANK))
+        )
+        for row_brand, row_grade in grade_counts:
+            common_grades.setdefault(row_brand, row_grade)
+        
+        comparison = {
+            row[0]: {
+                "average_5year_cost": int(row[1]),
+                "median_5year_cost": int(medians[row[0]]),
+                "sample_count": row[2],
+                "common_reliability_grade": common_grades.get(row[0], "Unknown")
+            }
+            for row in stats
+        }
         
         # Sort by average cost
         sorted_comparison = dict(sorted(comparison.items(), key=lambda x: x[1]["average_5year_cost"]))
@@ -569,9 +837,9 @@ if __name__ == "__main__":
         print(f"Parts availability: {prediction['parts_availability']}")
         
         # Show upcoming maintenance
-        upcoming = [item for item in prediction['maintenance_schedule'] if item['priority'] == 'high']
+        upcoming = [item for item in prediction['maintenance_schedule'] if item.priority == 'high']
         if upcoming:
-            print(f"Upcoming maintenance: {upcoming[0]['item']} - {upcoming[0]['cost']}€")
+            print(f"Upcoming maintenance: {upcoming[0].item} - {upcoming[0].cost}€")
         
         # Save prediction
         prediction_id = prophet.save_maintenance_prediction(car, prediction, db)
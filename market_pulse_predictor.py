@@ -1,20 +1,131 @@
-import json
+import bisect
+import os
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from statistics import median, mean, stdev
-import anthropic
-import os
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from enhanced_database import Car, MarketPulse
+from sqlalchemy import and_, case, func, or_, select
+from enhanced_database import Car, MarketPulse, upsert_statement
+from car_models import make_model_filters, make_model_matcher
 import uuid
+from ai_client import get_anthropic_client
+from functools import lru_cache
+import time
+
+# Short templated JSON: the fast model is plenty
+INSIGHTS_MODEL = os.getenv("CLAUDE_MARKET_MODEL", "claude-3-5-haiku-20241022")
+INSIGHTS_MAX_TOKENS = 400
+# Forced tool call: the answer comes back as parsed tool input, always a JSON object
+INSIGHTS_TOOL = {
+    "name": "market_insights",
+    "description": "Analyse du marché automobile français pour un modèle",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "market_health": {"type": "string", "enum": ["excellent", "bon", "moyen", "faible"]},
+            "key_factors": {"type": "array", "items": {"type": "string"}, "maxItems": 3},
+            "risks": {"type": "array", "items": {"type": "string"}},
+            "opportunities": {"type": "array", "items": {"type": "string"}},
+            "timing_advice": {"type": "string"},
+            "market_outlook": {"type": "string"},
+        },
+        "required": ["market_health", "key_factors", "risks", "opportunities", "timing_advice", "market_outlook"],
+    },
+}
+
+# Claude market insights are reused for similar trends of the same model
+AI_INSIGHTS_TTL = 6 * 3600  # seconds
+AI_INSIGHTS_CACHE_SIZE = 512
+
+# One scan for every car type keyword; group names (valid identifiers) map to
+# the types, listed by precedence when keywords of several types appear
+_CAR_TYPE_PATTERN = re.compile(
+    r"(?P<cabriolet>cabriolet|convertible|cabrio|roadster)"
+    r"|(?P<four_by_four>4x4|suv|crossover|x-drive|quattro|4matic)"
+    r"|(?P<utilitaire>utilitaire|van|fourgon|pickup)",
+    re.IGNORECASE
+)
+_CAR_TYPE_GROUPS = {"cabriolet": "cabriolet", "four_by_four": "4x4", "utilitaire": "utilitaire"}
+_CAR_TYPE_PRECEDENCE = ("cabriolet", "4x4", "utilitaire")
+
+@lru_cache(maxsize=4096)
+def _classify_car_type(make_model: str) -> str:
+    """Classify car type for seasonal analysis"""
+    found = {_CAR_TYPE_GROUPS[match.lastgroup] for match in _CAR_TYPE_PATTERN.finditer(make_model)}
+    for car_type in _CAR_TYPE_PRECEDENCE:
+        if car_type in found:
+            return car_type
+    return "berline"
+
+# Columns of the market history, kept as one list per column (see _get_historical_data)
+HISTORY_COLUMNS = ("date", "price", "mileage", "year", "seller_type", "is_active", "department")
+# Rows fetched per round-trip when streaming market history
+HISTORY_CHUNK_SIZE = 2048
+# Listings older than this are the "old" side of the monthly change rate
+RECENT_PRICE_DAYS = 60
+# Short-term momentum: EWMA of price (half-life in listings), compared with
+# its value MOMENTUM_WINDOW listings ago
+EWMA_HALFLIFE = 14
+EWMA_ALPHA = 1 - 0.5 ** (1 / EWMA_HALFLIFE)
+MOMENTUM_WINDOW = 30
+
+def _summarize_prices(history: dict, cutoff: datetime = None) -> dict:
+    """One pass over the listings: counts, price sums (active ones, and before /
+    from `cutoff`) and the sample variance via Welford's online algorithm.
+
+    Dates are in ascending order, so the `cutoff` split is a binary search.
+    """
+    prices = history["price"]
+    count = active_count = 0
+    active_sum = 0
+    mean_price = m2 = 0.0
+    for price, is_active in zip(prices, history["is_active"]):
+        count += 1
+        delta = price - mean_price
+        mean_price += delta / count
+        m2 += delta * (price - mean_price)
+        if is_active:
+            active_count += 1
+            active_sum += price
+    
+    old_count = bisect.bisect_left(history["date"], cutoff) if cutoff is not None else 0
+    old_sum = sum(prices[:old_count])
+    new_sum = sum(prices[old_count:])
+    return {
+        "count": count,
+        "mean": mean_price,
+        "variance": m2 / (count - 1) if count > 1 else 0.0,
+        "active_count": active_count,
+        "active_mean": active_sum / active_count if active_count else None,
+        "old_mean": old_sum / old_count if old_count else None,
+        "new_mean": new_sum / (count - old_count) if count > old_count else None,
+    }
+
+# Saturation share (%) thresholds, exclusive, and the congestion level of each
+# band: very low, low, normal, saturated, very saturated
+SATURATION_THRESHOLDS = (1, 2, 5, 10)
+SATURATION_LEVELS = (10, 30, 50, 70, 90)
+# Listing count thresholds (inclusive) and the confidence adjustment of each band
+DATA_COUNT_THRESHOLDS = (10, 21, 51, 101)
+DATA_COUNT_ADJUSTMENTS = (-0.2, 0.0, 0.1, 0.15, 0.2)
+
+def _saturation_level(model_count: int, total_active: int) -> float:
+    """Market saturation level (0-100) from the model's share of active listings"""
+    if total_active == 0:
+        return 50  # Neutral
+    
+    # Calculate saturation percentage
+    saturation_pct = (model_count / total_active) * 100
+    
+    # Normalize to congestion level (0-100)
+    return SATURATION_LEVELS[bisect.bisect_left(SATURATION_THRESHOLDS, saturation_pct)]
 
 class MarketPulsePredictor:
     def __init__(self):
         try:
-            self.anthropic_client = anthropic.Anthropic(
-                api_key=os.getenv("ANTHROPIC_API_KEY")
-            ) if os.getenv("ANTHROPIC_API_KEY") else None
+            # Shared client: pooled connections, per-attempt timeout and retries
+            self.anthropic_client = get_anthropic_client()
         except Exception as e:
             print(f"Warning: Anthropic client initialization failed in market_pulse_predictor: {e}")
             self.anthropic_client = None
@@ -39,6 +150,22 @@ class MarketPulsePredictor:
             }
         }
         
+        # Best/worst months per car type, fixed for the tables above
+        self._seasonal_meta = {}
+        for car_type, multipliers in self.seasonal_multipliers.items():
+            best_month = max(multipliers, key=multipliers.get)
+            worst_month = min(multipliers, key=multipliers.get)
+            self._seasonal_meta[car_type] = {
+                "best_selling_month": best_month,
+                "best_month_boost": multipliers[best_month],
+                "worst_selling_month": worst_month,
+                "worst_month_penalty": multipliers[worst_month],
+                "seasonal_volatility": multipliers[best_month] - multipliers[worst_month],
+            }
+        
+        # (make_model, trend bucket) -> (expires_at, insights)
+        self._ai_cache = {}
+        
         # Market trend indicators
         self.trend_keywords = {
             "rising": ["recherché", "rare", "collection", "apprécié", "valorise", "monte"],
@@ -57,25 +184,75 @@ class MarketPulsePredictor:
         """Analyze current market pulse for a specific make/model"""
         
         # Get historical data
-        historical_data = self._get_historical_data(make_model, db)
+        history = self._get_historical_data(make_model, db)
+        market_saturation = self._calculate_market_saturation(make_model, db)
+        return self._analyze_history(make_model, history, market_saturation)
+
+    def analyze_many(self, make_models: list, db: Session, days: int = 90, max_workers: int = 8) -> dict:
+        """analyze_market_pulse for several make/models with two queries in total.
+
+        One query fetches the recent cars of every model, routed to per-model
+        histories in Python; one counts the active listings of each model.
+        The per-model analyses (mostly the Claude call) then run on up to
+        `max_workers` threads; they don't touch the session. Returns
+        {make_model: pulse}.
+        """
+        make_models = list(dict.fromkeys(make_models))
+        if not make_models:
+            return {}
+        
+        rows = db.execute(select(
+            Car.first_seen, Car.price, Car.mileage, Car.year, Car.seller_type, Car.is_active,
+            Car.department, Car.make, Car.model, Car.title_lower
+        ).where(
+            Car.price.isnot(None),
+            Car.first_seen >= datetime.utcnow() - timedelta(days=days),
+            or_(*(and_(*make_model_filters(make_model)) for make_model in make_models))
+        ).order_by(Car.first_seen.asc()).execution_options(yield_per=HISTORY_CHUNK_SIZE))
+        
+        matchers = {make_model: make_model_matcher(make_model) for make_model in make_models}
+        histories = {make_model: {column: [] for column in HISTORY_COLUMNS} for make_model in make_models}
+        for row in rows:
+            values = row[:len(HISTORY_COLUMNS)]
+            for make_model, matches in matchers.items():
+                if matches(row.make, row.model, row.title_lower):
+                    for column, value in zip(histories[make_model].values(), values):
+                        column.append(value)
+        
+        total_active, *model_counts = db.query(
+            func.count(),
+            *(func.count(case((and_(*make_model_filters(make_model)), 1))) for make_model in make_models)
+        ).filter(Car.is_active == True).one()
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(make_models))) as pool:
+            pulses = pool.map(
+                lambda make_model, model_count: self._analyze_history(
+                    make_model, histories[make_model], _saturation_level(model_count, total_active)
+                ),
+                make_models, model_counts
+            )
+            return dict(zip(make_models, pulses))
+
+    def _analyze_history(self, make_model: str, history: dict, market_saturation: float) -> dict:
+        """Market pulse from a model's history (see _get_historical_data) and saturation"""
         
-        if not historical_data or len(historical_data) < 5:
+        if len(history["price"]) < 5:
             return {"error": "Insufficient historical data"}
         
+        # Counts, means and variance for all the steps below, in one pass
+        summary = _summarize_prices(history, cutoff=datetime.utcnow() - timedelta(days=RECENT_PRICE_DAYS))
+        
         # Analyze current trends
-        trend_analysis = self._analyze_current_trends(historical_data)
+        trend_analysis = self._analyze_current_trends(history, summary)
         
         # Calculate price predictions
-        price_predictions = self._predict_future_prices(historical_data, make_model)
+        price_predictions = self._predict_future_prices(summary, make_model)
         
         # Assess seasonal factors
         seasonal_factors = self._calculate_seasonal_factors(make_model)
         
-        # Calculate market saturation
-        market_saturation = self._calculate_market_saturation(make_model, db)
-        
         # Calculate demand score
-        demand_score = self._calculate_demand_score(historical_data, market_saturation, seasonal_factors)
+        demand_score = self._calculate_demand_score(summary, market_saturation, seasonal_factors)
         
         # Generate insights with AI
         ai_insights = self._generate_ai_insights(make_model, trend_analysis, price_predictions)
@@ -92,115 +269,119 @@ class MarketPulsePredictor:
             "volatility_index": trend_analysis["volatility"],
             "ai_insights": ai_insights,
             "recommendation": self._generate_market_recommendation(trend_analysis, demand_score, market_saturation),
-            "confidence_level": self._calculate_prediction_confidence(historical_data, trend_analysis)
+            "confidence_level": self._calculate_prediction_confidence(summary, trend_analysis)
         }
         
         return market_pulse
 
-    def _get_historical_data(self, make_model: str, db: Session, days: int = 90) -> list:
-        """Get historical pricing data for make/model"""
-        
-        # Search for cars matching make/model
-        search_terms = make_model.lower().split()
-        
-        query = db.query(Car).filter(
+    def _get_historical_data(self, make_model: str, db: Session, days: int = 90) -> dict:
+        """Get historical pricing data for make/model, oldest first.
+
+        Returned column-wise ({"price": [...], "is_active": [...], ...}, see
+        HISTORY_COLUMNS) so each step reads the one list it needs.
+        """
+        
+        # Search for cars matching make/model; only the needed columns, as
+        # plain rows (no Car objects)
+        stmt = select(
+            Car.first_seen, Car.price, Car.mileage, Car.year,
+            Car.seller_type, Car.is_active, Car.department
+        ).where(
             Car.price.isnot(None),
-            Car.first_seen >= datetime.utcnow() - timedelta(days=days)
-        )
-        
-        # Add make/model filters
-        for term in search_terms:
-            query = query.filter(Car.title.ilike(f"%{term}%"))
-        
-        cars = query.order_by(Car.first_seen.asc()).all()
-        
-        # Group by time periods
-        historical_data = []
-        for car in cars:
-            historical_data.append({
-                "date": car.first_seen,
-                "price": car.price,
-                "mileage": car.mileage,
-                "year": car.year,
-                "seller_type": car.seller_type,
-                "is_active": car.is_active,
-                "department": car.department
-            })
-        
-        return historical_data
+            Car.first_seen >= datetime.utcnow() - timedelta(days=days),
+            *make_model_filters(make_model)
+        ).order_by(Car.first_seen.asc())
+        
+        # Streamed (server-side cursor on Postgres) and transposed chunk by
+        # chunk, so the full row list never exists alongside the columns
+        history = {column: [] for column in HISTORY_COLUMNS}
+        result = db.execute(stmt.execution_options(yield_per=HISTORY_CHUNK_SIZE))
+        for chunk in result.partitions():
+            for column, values in zip(history.values(), zip(*chunk)):
+                column.extend(values)
+        return history
 
-    def _analyze_current_trends(self, historical_data: list) -> dict:
+    def _analyze_current_trends(self, history: dict, summary: dict) -> dict:
         """Analyze current market trends"""
         
-        # Sort by date
-        sorted_data = sorted(historical_data, key=lambda x: x["date"])
+        prices = history["price"]  # by date already
+        n = len(prices)
         
-        # Calculate price trend over time
-        prices = [item["price"] for item in sorted_data]
-        dates = [item["date"] for item in sorted_data]
-        
-        if len(prices) < 5:
+        if n < 5:
             return {"trend_direction": "insufficient_data", "trend_strength": 0}
         
-        # Calculate trend using linear regression (simplified)
-        recent_prices = prices[-30:] if len(prices) > 30 else prices
-        older_prices = prices[:len(prices)//2] if len(prices) > 10 else prices[:len(prices)//2]
-        
-        if not older_prices or not recent_prices:
+        avg_price = summary["mean"]
+        if avg_price <= 0:
             return {"trend_direction": "stable", "trend_strength": 0}
         
-        recent_avg = mean(recent_prices)
-        older_avg = mean(older_prices) if older_prices else recent_avg
+        # Least-squares trend of price over listing order: the slope is the
+        # change per listing, so slope * n is the change across the window.
+        # Positions are 0..n-1, so their sums are closed-form and a single
+        # pass for sum(i * price) is all the fit needs.
+        # The same pass keeps an exponentially weighted average of the price,
+        # whose change over the last MOMENTUM_WINDOW listings is the
+        # short-term momentum (noise-robust, unlike the raw last prices)
+        sum_ip = 0
+        ewma = prices[0]
+        ewma_history = deque(maxlen=MOMENTUM_WINDOW)
+        for i, price in enumerate(prices):
+            sum_ip += i * price
+            ewma += EWMA_ALPHA * (price - ewma)
+            ewma_history.append(ewma)
+        momentum_pct = (
+            (ewma - ewma_history[0]) / ewma_history[0] * 100
+            if n >= MOMENTUM_WINDOW and ewma_history[0] > 0 else None
+        )
         
-        price_change_pct = (recent_avg - older_avg) / older_avg * 100 if older_avg > 0 else 0
+        sxx = n * (n * n - 1) / 12
+        sxy = sum_ip - (n - 1) / 2 * avg_price * n
+        syy = summary["variance"] * (n - 1)
+        slope = sxy / sxx
+        price_change_pct = slope * n / avg_price * 100
+        r_squared = sxy * sxy / (sxx * syy) if syy > 0 else 0.0  # 0 when all prices are equal
         
-        # Determine trend direction
+        # Determine trend direction; strength is how well the line fits
         if price_change_pct > 5:
             trend_direction = "rising"
-            trend_strength = min(100, abs(price_change_pct) * 2)
+            trend_strength = round(r_squared * 100)
         elif price_change_pct < -5:
             trend_direction = "falling" 
-            trend_strength = min(100, abs(price_change_pct) * 2)
+            trend_strength = round(r_squared * 100)
         else:
             trend_direction = "stable"
             trend_strength = max(0, 50 - abs(price_change_pct) * 10)
         
         # Calculate market velocity (how quickly cars sell)
-        active_count = sum(1 for item in sorted_data if item["is_active"])
-        total_count = len(sorted_data)
-        market_velocity = (total_count - active_count) / total_count * 100 if total_count > 0 else 0
+        market_velocity = (n - summary["active_count"]) / n * 100
         
         # Calculate volatility
-        volatility = stdev(prices) / mean(prices) * 100 if len(prices) > 1 and mean(prices) > 0 else 0
+        volatility = summary["variance"] ** 0.5 / avg_price * 100
         
         return {
             "trend_direction": trend_direction,
             "trend_strength": trend_strength,
             "price_change_percentage": price_change_pct,
+            "r_squared": r_squared,
+            "momentum_percentage": momentum_pct,
             "market_velocity": market_velocity,
             "volatility": volatility,
-            "sample_size": len(historical_data)
+            "sample_size": n
         }
 
-    def _predict_future_prices(self, historical_data: list, make_model: str) -> dict:
-        """Predict future price movements"""
-        
-        current_prices = [item["price"] for item in historical_data if item["is_active"]]
-        all_prices = [item["price"] for item in historical_data]
+    def _predict_future_prices(self, summary: dict, make_model: str) -> dict:
+        """Predict future price movements (from the _summarize_prices summary)"""
         
-        if not current_prices:
-            current_avg = mean(all_prices) if all_prices else 0
+        if summary["active_mean"] is None:
+            current_avg = summary["mean"]
         else:
-            current_avg = mean(current_prices)
+            current_avg = summary["active_mean"]
         
         # Calculate depreciation rate
-        if len(historical_data) > 10:
-            old_data = [item for item in historical_data if item["date"] < datetime.utcnow() - timedelta(days=60)]
-            new_data = [item for item in historical_data if item["date"] >= datetime.utcnow() - timedelta(days=60)]
+        if summary["count"] > 10:
+            old_avg = summary["old_mean"]
+            new_avg = summary["new_mean"]
             
-            if old_data and new_data:
-                old_avg = mean([item["price"] for item in old_data])
-                new_avg = mean([item["price"] for item in new_data])
+            if old_avg is not None and new_avg is not None:
                 monthly_change_rate = (new_avg - old_avg) / old_avg * 100 / 2 if old_avg > 0 else 0  # Per month
             else:
                 monthly_change_rate = -1.5  # Default depreciation
@@ -209,7 +390,7 @@ class MarketPulsePredictor:
         
         # Apply seasonal factors
         current_month = datetime.now().month
-        car_type = self._classify_car_type(make_model)
+        car_type = _classify_car_type(make_model)
         seasonal_multiplier = self.seasonal_multipliers.get(car_type, self.seasonal_multipliers["berline"])
         
         predictions = {}
@@ -247,88 +428,42 @@ class MarketPulsePredictor:
         
         return predictions
 
-    def _classify_car_type(self, make_model: str) -> str:
-        """Classify car type for seasonal analysis"""
-        make_model_lower = make_model.lower()
-        
-        if any(word in make_model_lower for word in ["cabriolet", "convertible", "cabrio", "roadster"]):
-            return "cabriolet"
-        elif any(word in make_model_lower for word in ["4x4", "suv", "crossover", "x-drive", "quattro", "4matic"]):
-            return "4x4"
-        elif any(word in make_model_lower for word in ["utilitaire", "van", "fourgon", "pickup"]):
-            return "utilitaire"
-        else:
-            return "berline"
-
     def _calculate_seasonal_factors(self, make_model: str) -> dict:
         """Calculate seasonal factors affecting the model"""
-        car_type = self._classify_car_type(make_model)
+        car_type = _classify_car_type(make_model)
         current_month = datetime.now().month
         
-        multipliers = self.seasonal_multipliers.get(car_type, self.seasonal_multipliers["berline"])
+        multipliers = self.seasonal_multipliers[car_type]
         current_factor = multipliers.get(current_month, 1.0)
         
-        # Find best and worst months
-        best_month = max(multipliers, key=multipliers.get)
-        worst_month = min(multipliers, key=multipliers.get)
-        
         return {
             "car_type": car_type,
             "current_month_factor": current_factor,
-            "best_selling_month": best_month,
-            "best_month_boost": multipliers[best_month],
-            "worst_selling_month": worst_month,
-            "worst_month_penalty": multipliers[worst_month],
-            "seasonal_volatility": max(multipliers.values()) - min(multipliers.values()),
+            **self._seasonal_meta[car_type],
             "monthly_factors": multipliers
         }
 
     def _calculate_market_saturation(self, make_model: str, db: Session) -> float:
         """Calculate market saturation level (0-100)"""
         
-        # Get current active listings for this model
-        search_terms = make_model.lower().split()
-        query = db.query(Car).filter(Car.is_active == True)
-        
-        for term in search_terms:
-            query = query.filter(Car.title.ilike(f"%{term}%"))
-        
-        model_count = query.count()
-        
-        # Get total active car listings
-        total_active = db.query(Car).filter(Car.is_active == True).count()
-        
-        if total_active == 0:
-            return 50  # Neutral
-        
-        # Calculate saturation percentage
-        saturation_pct = (model_count / total_active) * 100
-        
-        # Normalize to congestion level (0-100)
-        if saturation_pct > 10:
-            saturation_level = 90  # Very saturated
-        elif saturation_pct > 5:
-            saturation_level = 70  # Saturated
-        elif saturation_pct > 2:
-            saturation_level = 50  # Normal
-        elif saturation_pct > 1:
-            saturation_level = 30  # Low saturation
-        else:
-            saturation_level = 10  # Very low saturation
+        # Active listings for this model and in total, in one scan
+        model_count, total_active = db.query(
+            func.count(case((and_(*make_model_filters(make_model)), 1))),
+            func.count()
+        ).filter(Car.is_active == True).one()
         
-        return saturation_level
+        return _saturation_level(model_count, total_active)
 
-    def _calculate_demand_score(self, historical_data: list, market_saturation: float, seasonal_factors: dict) -> int:
+    def _calculate_demand_score(self, summary: dict, market_saturation: float, seasonal_factors: dict) -> int:
         """Calculate overall demand score (0-100)"""
         
         base_score = 50
         
-        # Market velocity factor
-        active_count = sum(1 for item in historical_data if item["is_active"])
-        total_count = len(historical_data)
+        total_count = summary["count"]
         
+        # Market velocity factor
         if total_count > 0:
-            sell_through_rate = (total_count - active_count) / total_count
+            sell_through_rate = (total_count - summary["active_count"]) / total_count
             velocity_bonus = sell_through_rate * 30  # Up to 30 points
             base_score += velocity_bonus
         
@@ -341,9 +476,8 @@ class MarketPulsePredictor:
         base_score += seasonal_bonus
         
         # Price stability bonus
-        prices = [item["price"] for item in historical_data]
-        if len(prices) > 1:
-            price_stability = 100 - (stdev(prices) / mean(prices) * 100)
+        if total_count > 1:
+            price_stability = 100 - (summary["variance"] ** 0.5 / summary["mean"] * 100)
             stability_bonus = max(0, price_stability - 80) * 0.5  # Bonus for low volatility
             base_score += stability_bonus
         
@@ -355,6 +489,15 @@ class MarketPulsePredictor:
         if not self.anthropic_client:
             return {"error": "AI analysis not available"}
         
+        # Same model with a similar trend: reuse the recent answer
+        key = (
+            make_model, trend_analysis["trend_direction"],
+            round(trend_analysis.get("price_change_percentage", 0)), round(trend_analysis.get("volatility", 0))
+        )
+        cached = self._ai_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
         try:
             prompt = f"""
             Analysez les conditions du marché automobile français pour {make_model}:
@@ -369,24 +512,24 @@ class MarketPulsePredictor:
             - 6 mois: {price_predictions.get("6_month", {}).get("price", 0)}€ ({price_predictions.get("6_month", {}).get("change_percentage", 0):.1f}%)
             - 12 mois: {price_predictions.get("12_month", {}).get("price", 0)}€ ({price_predictions.get("12_month", {}).get("change_percentage", 0):.1f}%)
             
-            Fournissez une analyse en JSON avec:
-            1. market_health: santé du marché (excellent/bon/moyen/faible)
-            2. key_factors: 3 facteurs clés influençant le marché
-            3. risks: risques potentiels
-            4. opportunities: opportunités d'achat/vente
-            5. timing_advice: conseils de timing
-            6. market_outlook: perspectives (6 mois)
-            
-            Répondez uniquement en JSON français.
+            Donnez en français, brièvement: la santé du marché, 3 facteurs clés,
+            les risques, les opportunités d'achat/vente, des conseils de timing et
+            les perspectives à 6 mois.
             """
             
             message = self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=800,
+                model=INSIGHTS_MODEL,
+                max_tokens=INSIGHTS_MAX_TOKENS,
+                tools=[INSIGHTS_TOOL],
+                tool_choice={"type": "tool", "name": INSIGHTS_TOOL["name"]},
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            return json.loads(message.content[0].text)
+            insights = next(block.input for block in message.content if block.type == "tool_use")
+            if len(self._ai_cache) >= AI_INSIGHTS_CACHE_SIZE:
+                self._ai_cache.clear()
+            self._ai_cache[key] = (time.monotonic() + AI_INSIGHTS_TTL, insights)
+            return insights
             
         except Exception as e:
             return {"error": f"AI analysis failed: {str(e)}"}
@@ -430,21 +573,13 @@ class MarketPulsePredictor:
         
         return recommendations
 
-    def _calculate_prediction_confidence(self, historical_data: list, trend_analysis: dict) -> float:
+    def _calculate_prediction_confidence(self, summary: dict, trend_analysis: dict) -> float:
         """Calculate confidence in predictions (0-1)"""
         
         confidence = 0.5  # Base confidence
         
         # Data quantity factor
-        data_count = len(historical_data)
-        if data_count > 100:
-            confidence += 0.2
-        elif data_count > 50:
-            confidence += 0.15
-        elif data_count > 20:
-            confidence += 0.1
-        elif data_count < 10:
-            confidence -= 0.2
+        confidence += DATA_COUNT_ADJUSTMENTS[bisect.bisect_right(DATA_COUNT_THRESHOLDS, summary["count"])]
         
         # Trend strength factor
         trend_strength = trend_analysis.get("trend_strength", 0)
@@ -470,38 +605,25 @@ class MarketPulsePredictor:
     def save_market_pulse(self, make_model: str, pulse_data: dict, db: Session) -> str:
         """Save market pulse analysis to database"""
         
-        # Check if recent analysis exists
-        existing = db.query(MarketPulse).filter(
-            MarketPulse.make_model == make_model,
-            MarketPulse.created_at > datetime.utcnow() - timedelta(hours=6)
-        ).first()
-        
-        if existing:
-            # Update existing record
-            existing.current_trend = pulse_data["current_trend"]
-            existing.price_prediction = pulse_data["price_prediction"]
-            existing.seasonal_factors = pulse_data["seasonal_factors"]
-            existing.market_saturation = pulse_data["market_saturation"]
-            existing.demand_score = pulse_data["demand_score"]
-            existing.valid_until = datetime.utcnow() + timedelta(hours=24)
-            db.commit()
-            return existing.id
-        else:
-            # Create new record
-            market_pulse = MarketPulse(
-                id=str(uuid.uuid4()),
-                make_model=make_model,
-                current_trend=pulse_data["current_trend"],
-                price_prediction=pulse_data["price_prediction"],
-                seasonal_factors=pulse_data["seasonal_factors"],
-                market_saturation=pulse_data["market_saturation"],
-                demand_score=pulse_data["demand_score"],
-                valid_until=datetime.utcnow() + timedelta(hours=24)
-            )
-            
-            db.add(market_pulse)
-            db.commit()
-            return market_pulse.id
+        # One row per make/model: a re-analysis replaces it in place (the id is kept)
+        now = datetime.utcnow()
+        stmt = upsert_statement(db.get_bind().dialect.name, MarketPulse, {
+            "id": str(uuid.uuid4()),
+            "make_model": make_model,
+            "current_trend": pulse_data["current_trend"],
+            "price_prediction": pulse_data["price_prediction"],
+            "seasonal_factors": pulse_data["seasonal_factors"],
+            "market_saturation": pulse_data["market_saturation"],
+            "demand_score": pulse_data["demand_score"],
+            "created_at": now,
+            "valid_until": now + timedelta(hours=24)
+        }, index_elements=["make_model"], update_columns=[
+            "current_trend", "price_prediction", "seasonal_factors", "market_saturation",
+            "demand_score", "created_at", "valid_until"
+        ])
+        pulse_id = db.execute(stmt.returning(MarketPulse.id)).scalar_one()
+        db.commit()
+        return pulse_id
 
     def get_market_insights(self, make_model: str, db: Session) -> dict:
         """Get saved market insights for a make/model"""
@@ -528,20 +650,25 @@ class MarketPulsePredictor:
     def get_trending_models(self, db: Session, limit: int = 20) -> list:
         """Get currently trending car models"""
         
-        # Get recent market pulse data
-        pulses = db.query(MarketPulse).filter(
-            MarketPulse.valid_until > datetime.utcnow(),
-            MarketPulse.current_trend == "rising"
-        ).order_by(MarketPulse.demand_score.desc()).limit(limit).all()
+        # Get recent market pulse data (plain rows of the served columns, no ORM objects)
+        rows = db.execute(
+            select(
+                MarketPulse.make_model, MarketPulse.current_trend, MarketPulse.demand_score,
+                MarketPulse.market_saturation, MarketPulse.price_prediction
+            ).where(
+                MarketPulse.valid_until > datetime.utcnow(),
+                MarketPulse.current_trend == "rising"
+            ).order_by(MarketPulse.demand_score.desc()).limit(limit)
+        ).all()
         
         trending = []
-        for pulse in pulses:
+        for row in rows:
             trending.append({
-                "make_model": pulse.make_model,
-                "trend": pulse.current_trend,
-                "demand_score": pulse.demand_score,
-                "market_saturation": pulse.market_saturation,
-                "price_change_3m": pulse.price_prediction.get("3_month", {}).get("change_percentage", 0) if pulse.price_prediction else 0
+                "make_model": row.make_model,
+                "trend": row.current_trend,
+                "demand_score": row.demand_score,
+                "market_saturation": row.market_saturation,
+                "price_change_3m": row.price_prediction.get("3_month", {}).get("change_percentage", 0) if row.price_prediction else 0
             })
         
         return trending
@@ -555,9 +682,8 @@ if __name__ == "__main__":
     # Test with popular French models
     test_models = ["Renault Clio", "Peugeot 208", "Citroën C3"]
     
-    for model in test_models:
+    for model, pulse in predictor.analyze_many(test_models, db).items():
         print(f"\nAnalyzing market pulse for: {model}")
-        pulse = predictor.analyze_market_pulse(model, db)
         
         if "error" not in pulse:
             print(f"Current trend: {pulse['current_trend']}")
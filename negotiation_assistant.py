@@ -1,18 +1,43 @@
+import bisect
 import re
-import json
+from collections import defaultdict
 from datetime import datetime, timedelta
-import anthropic
-import os
-from sqlalchemy.orm import Session
-from enhanced_database import Car, NegotiationStrategy, NegotiationOutcome, GemScore, ParsedListing
+from sqlalchemy.orm import Session, defer, selectinload
+from enhanced_database import Car, NegotiationStrategy, NegotiationOutcome
 import uuid
+from ai_client import get_anthropic_client, parse_json_response
+
+# Static instructions go in the system prompt; the user message only
+# carries the car's strategy.
+REFINE_SYSTEM_PROMPT = """Vous analysez une stratégie de négociation pour une voiture française et proposez des améliorations culturellement appropriées.
+
+Améliorez la stratégie en tenant compte:
+1. Des spécificités culturelles françaises
+2. De la psychologie du vendeur détectée
+3. Des meilleures pratiques de négociation automobile
+
+Répondez en JSON avec:
+- improved_approach: approche améliorée
+- cultural_insights: insights culturels spécifiques
+- risk_mitigation: stratégies de réduction des risques
+- success_factors: facteurs clés de succès"""
+
+# Share of the price open to negotiation by market position (typical 5-15% in France)
+NEGOTIATION_ROOM_RATES = {"above_market": 0.15, "below_market": 0.05}
+BASE_NEGOTIATION_RATE = 0.10
+
+# Success probability adjustments, added to a 60% base
+URGENCY_PROBABILITY = {"high": 0.2, "low": -0.1}
+MARKET_POSITION_PROBABILITY = {"above_market": 0.15, "below_market": -0.1}
+SELLER_TYPE_PROBABILITY = {"particulier": 0.1}
+# Better listings = less negotiation room
+LISTING_QUALITY_PROBABILITY = {"high": -0.05}
 
 class NegotiationAssistantPro:
     def __init__(self):
         try:
-            self.anthropic_client = anthropic.Anthropic(
-                api_key=os.getenv("ANTHROPIC_API_KEY")
-            ) if os.getenv("ANTHROPIC_API_KEY") else None
+            # Shared client: pooled connections, per-attempt timeout and retries
+            self.anthropic_client = get_anthropic_client()
         except Exception as e:
             print(f"Warning: Anthropic client initialization failed in negotiation_assistant: {e}")
             self.anthropic_client = None
@@ -36,6 +61,35 @@ class NegotiationAssistantPro:
                 "adoré", "choyé", "bébé"
             ]
         }
+        self.urgency_patterns = {
+            "high": ["urgent", "vite", "rapide", "immédiat", "fin mois", "départ"],
+            "medium": ["négociable", "étudié", "discutable", "souple"]
+        }
+        self.flexibility_patterns = {
+            "flexible": ["négociable", "discutable", "débattre", "étudié", "souple"],
+            "firm": ["ferme", "fixe", "non négociable", "prix serré"]
+        }
+        # Topics to avoid raising with the seller -> advice
+        self.sensitive_topics = {
+            "accident": "Ne pas insister sur l'historique d'accident",
+            "réparation": "Éviter de mentionner les réparations nécessaires d'emblée",
+            "urgent": "Ne pas exploiter ouvertement l'urgence du vendeur",
+            "décès": "Faire preuve de tact concernant les circonstances personnelles"
+        }
+
+        # Every pattern above in one regex, so a listing is scanned once. The
+        # lookahead finds overlapping hits ("négociable" in "non négociable");
+        # no pattern is a prefix of another, so none hides behind a longer one.
+        all_patterns = {
+            pattern
+            for pattern_groups in (self.seller_psychology_patterns, self.urgency_patterns, self.flexibility_patterns)
+            for patterns in pattern_groups.values()
+            for pattern in patterns
+        }
+        all_patterns.update(self.sensitive_topics)
+        self._pattern_scanner = re.compile(
+            "(?=(" + "|".join(re.escape(pattern) for pattern in sorted(all_patterns, key=len, reverse=True)) + "))"
+        )
         
         # French cultural negotiation approaches
         self.cultural_approaches = {
@@ -68,18 +122,24 @@ class NegotiationAssistantPro:
             "win_win": "Recherche d'accord équitable pour les deux parties"
         }
 
-    def generate_negotiation_strategy(self, car: Car, db: Session) -> dict:
-        """Generate comprehensive negotiation strategy for a specific car"""
+    def generate_negotiation_strategy(self, car: Car, db: Session, market_pool: dict = None) -> dict:
+        """Generate comprehensive negotiation strategy for a specific car.
+
+        `market_pool` (from _load_market_pool) replaces the similar-cars query.
+        """
+        
+        # One scan of the listing text serves the psychology and red flag checks
+        found = self._scan_patterns(f"{car.title} {car.description or ''}".lower())
         
         # Analyze seller psychology
-        seller_profile = self._analyze_seller_psychology(car)
+        seller_profile = self._analyze_seller_psychology(car, found)
         
         # Get market context
-        market_context = self._get_market_context(car, db)
+        market_context = self._get_market_context(car, db, market_pool)
         
         # Get additional insights from other AI features
-        gem_analysis = db.query(GemScore).filter(GemScore.car_id == car.id).first()
-        parsed_listing = db.query(ParsedListing).filter(ParsedListing.car_id == car.id).first()
+        gem_analysis = car.gem
+        parsed_listing = car.parsed
         
         # Generate price strategy
         price_strategy = self._calculate_price_strategy(car, market_context, gem_analysis)
@@ -103,7 +163,7 @@ class NegotiationAssistantPro:
             "conversation_scripts": scripts,
             "success_probability": success_probability,
             "timing_recommendations": self._get_timing_recommendations(car, seller_profile),
-            "red_flags_to_avoid": self._identify_negotiation_red_flags(car, parsed_listing),
+            "red_flags_to_avoid": self._identify_negotiation_red_flags(car, parsed_listing, found),
             "leverage_points": self._identify_leverage_points(car, gem_analysis, parsed_listing),
             "fallback_strategies": self._create_fallback_strategies(price_strategy)
         }
@@ -114,33 +174,23 @@ class NegotiationAssistantPro:
         
         return strategy
 
-    def _analyze_seller_psychology(self, car: Car) -> dict:
-        """Analyze seller psychology from listing"""
-        text = f"{car.title} {car.description}".lower()
-        
+    def _analyze_seller_psychology(self, car: Car, found: set) -> dict:
+        """Analyze seller psychology from the patterns found in the listing"""
         psychology_scores = {}
         detected_patterns = []
         
         for psych_type, patterns in self.seller_psychology_patterns.items():
-            score = 0
-            found_patterns = []
-            
-            for pattern in patterns:
-                if pattern in text:
-                    score += 1
-                    found_patterns.append(pattern)
-            
-            psychology_scores[psych_type] = score
-            if found_patterns:
-                detected_patterns.extend(found_patterns)
+            found_patterns = [pattern for pattern in patterns if pattern in found]
+            psychology_scores[psych_type] = len(found_patterns)
+            detected_patterns.extend(found_patterns)
         
         # Determine primary psychology
         primary_psychology = max(psychology_scores, key=psychology_scores.get)
         confidence = psychology_scores[primary_psychology] / len(self.seller_psychology_patterns[primary_psychology])
         
         # Additional analysis
-        urgency_level = self._assess_urgency_level(text)
-        price_flexibility = self._assess_price_flexibility(car, text)
+        urgency_level = self._assess_urgency_level(found)
+        price_flexibility = self._assess_price_flexibility(car, found)
         
         return {
             "primary_type": primary_psychology,
@@ -153,13 +203,14 @@ class NegotiationAssistantPro:
             "listing_quality": self._assess_listing_quality(car)
         }
 
-    def _assess_urgency_level(self, text: str) -> str:
-        """Assess seller urgency level"""
-        high_urgency = ["urgent", "vite", "rapide", "immédiat", "fin mois", "départ"]
-        medium_urgency = ["négociable", "étudié", "discutable", "souple"]
-        
-        high_count = sum(1 for word in high_urgency if word in text)
-        medium_count = sum(1 for word in medium_urgency if word in text)
+    def _scan_patterns(self, text: str) -> set:
+        """Patterns (psychology, urgency, flexibility, sensitive topics) appearing in the text"""
+        return {match.group(1) for match in self._pattern_scanner.finditer(text)}
+
+    def _assess_urgency_level(self, found: set) -> str:
+        """Assess seller urgency level from the patterns found in the listing"""
+        high_count = sum(1 for word in self.urgency_patterns["high"] if word in found)
+        medium_count = sum(1 for word in self.urgency_patterns["medium"] if word in found)
         
         if high_count > 0:
             return "high"
@@ -168,20 +219,18 @@ class NegotiationAssistantPro:
         else:
             return "low"
 
-    def _assess_price_flexibility(self, car: Car, text: str) -> float:
-        """Assess price flexibility (0-1)"""
+    def _assess_price_flexibility(self, car: Car, found: set) -> float:
+        """Assess price flexibility (0-1) from the patterns found in the listing"""
         flexibility_score = 0.5  # Base
         
         # Positive flexibility indicators
-        flexible_indicators = ["négociable", "discutable", "débattre", "étudié", "souple"]
-        for indicator in flexible_indicators:
-            if indicator in text:
+        for indicator in self.flexibility_patterns["flexible"]:
+            if indicator in found:
                 flexibility_score += 0.1
         
         # Negative flexibility indicators
-        firm_indicators = ["ferme", "fixe", "non négociable", "prix serré"]
-        for indicator in firm_indicators:
-            if indicator in text:
+        for indicator in self.flexibility_patterns["firm"]:
+            if indicator in found:
                 flexibility_score -= 0.2
         
         # Professional sellers typically less flexible
@@ -199,8 +248,8 @@ class NegotiationAssistantPro:
         elif car.description and len(car.description) > 100:
             score += 1
         
-        if car.images:
-            image_count = len(json.loads(car.images))
+        image_count = car.image_count
+        if image_count:
             if image_count >= 8:
                 score += 2
             elif image_count >= 5:
@@ -216,39 +265,84 @@ class NegotiationAssistantPro:
         else:
             return "low"
 
-    def _get_market_context(self, car: Car, db: Session) -> dict:
+    def generate_many(self, car_ids: list, db: Session) -> dict:
+        """generate_negotiation_strategy for several cars without per-car queries.
+
+        The cars load with their gem scores and parsed listings (two IN
+        queries), similar cars come from one query of the active market.
+        Returns {car_id: strategy}.
+        """
+        if not car_ids:
+            return {}
+        # Strategies read image_count, never the image URLs
+        cars = db.query(Car).options(
+            defer(Car.images), selectinload(Car.gem), selectinload(Car.parsed)
+        ).filter(Car.id.in_(car_ids)).all()
+        market_pool = self._load_market_pool(db)
+        return {car.id: self.generate_negotiation_strategy(car, db, market_pool) for car in cars}
+
+    def _load_market_pool(self, db: Session) -> dict:
+        """Active priced cars as {year: [(id, mileage, price)]}, for _similar_prices"""
+        market_pool = defaultdict(list)
+        rows = db.query(Car.id, Car.year, Car.mileage, Car.price).filter(
+            Car.price.isnot(None),
+            Car.is_active == True
+        )
+        for car_id, year, mileage, price in rows:
+            market_pool[year].append((car_id, mileage, price))
+        return market_pool
+
+    def _similar_prices(self, car: Car, market_pool: dict, limit: int = 15) -> list:
+        """Prices of up to `limit` cars within 2 years and 30000 km, from a preloaded pool"""
+        years = range(car.year - 2, car.year + 3) if car.year else list(market_pool)
+        prices = []
+        for year in years:
+            for car_id, mileage, price in market_pool.get(year, ()):
+                if car.mileage and (mileage is None or abs(mileage - car.mileage) > 30000):
+                    continue
+                if car_id != car.id:
+                    prices.append(price)
+                    if len(prices) == limit:
+                        return prices
+        return prices
+
+    def _get_market_context(self, car: Car, db: Session, market_pool: dict = None) -> dict:
         """Get market context for negotiation"""
         if not car.price:
             return {"error": "No price available"}
         
         # Get similar cars
-        similar_cars = db.query(Car).filter(
-            Car.year.between(car.year - 2, car.year + 2) if car.year else True,
-            Car.mileage.between(car.mileage - 30000, car.mileage + 30000) if car.mileage else True,
-            Car.price.isnot(None),
-            Car.is_active == True,
-            Car.id != car.id
-        ).limit(15).all()
-        
-        if len(similar_cars) < 3:
+        if market_pool is not None:
+            prices = self._similar_prices(car, market_pool)
+        else:
+            prices = [price for (price,) in db.query(Car.price).filter(
+                Car.year.between(car.year - 2, car.year + 2) if car.year else True,
+                Car.mileage.between(car.mileage - 30000, car.mileage + 30000) if car.mileage else True,
+                Car.price.isnot(None),
+                Car.is_active == True,
+                Car.id != car.id
+            ).limit(15)]
+        
+        if len(prices) < 3:
             return {"insufficient_data": True}
         
-        prices = [c.price for c in similar_cars]
+        # One sort gives the range and the car's rank
+        prices.sort()
         avg_price = sum(prices) / len(prices)
-        min_price = min(prices)
-        max_price = max(prices)
+        min_price = prices[0]
+        max_price = prices[-1]
         
         # Calculate market position
-        percentile = sum(1 for p in prices if p <= car.price) / len(prices)
+        percentile = bisect.bisect_right(prices, car.price) / len(prices)
         
         return {
-            "similar_cars_count": len(similar_cars),
+            "similar_cars_count": len(prices),
             "average_market_price": int(avg_price),
             "price_range": {"min": min_price, "max": max_price},
             "car_price_percentile": percentile,
             "market_position": "above_market" if percentile > 0.7 else "below_market" if percentile < 0.3 else "market_average",
             "negotiation_room": max(0, car.price - min_price),
-            "market_context_strength": "strong" if len(similar_cars) > 10 else "moderate"
+            "market_context_strength": "strong" if len(prices) > 10 else "moderate"
         }
 
     def _calculate_price_strategy(self, car: Car, market_context: dict, gem_analysis) -> dict:
@@ -256,16 +350,10 @@ class NegotiationAssistantPro:
         if not car.price or "error" in market_context:
             return {"error": "Insufficient data for price strategy"}
         
-        # Base negotiation range (typical 5-15% in France)
-        base_negotiation = car.price * 0.10  # 10% base
-        
-        # Adjust based on market position
-        if market_context.get("market_position") == "above_market":
-            negotiation_room = car.price * 0.15  # 15% if overpriced
-        elif market_context.get("market_position") == "below_market":
-            negotiation_room = car.price * 0.05  # 5% if underpriced
-        else:
-            negotiation_room = base_negotiation
+        # Negotiation range by market position: 15% if overpriced, 5% if underpriced, else 10%
+        negotiation_room = car.price * NEGOTIATION_ROOM_RATES.get(
+            market_context.get("market_position"), BASE_NEGOTIATION_RATE
+        )
         
         # Adjust based on gem analysis
         if gem_analysis and gem_analysis.gem_score > 75:
@@ -336,29 +424,11 @@ class NegotiationAssistantPro:
     def _calculate_success_probability(self, seller_profile: dict, market_context: dict, price_strategy: dict, car: Car) -> float:
         """Calculate probability of successful negotiation"""
         base_probability = 0.6  # 60% base in French market
-        
-        # Seller psychology factors
-        if seller_profile["urgency_level"] == "high":
-            base_probability += 0.2
-        elif seller_profile["urgency_level"] == "low":
-            base_probability -= 0.1
-        
-        # Price flexibility
+        base_probability += URGENCY_PROBABILITY.get(seller_profile["urgency_level"], 0.0)
         base_probability += seller_profile["price_flexibility"] * 0.2
-        
-        # Market position
-        if market_context.get("market_position") == "above_market":
-            base_probability += 0.15
-        elif market_context.get("market_position") == "below_market":
-            base_probability -= 0.1
-        
-        # Seller type
-        if car.seller_type == "particulier":
-            base_probability += 0.1
-        
-        # Listing quality (better listings = less negotiation room)
-        if seller_profile["listing_quality"] == "high":
-            base_probability -= 0.05
+        base_probability += MARKET_POSITION_PROBABILITY.get(market_context.get("market_position"), 0.0)
+        base_probability += SELLER_TYPE_PROBABILITY.get(car.seller_type, 0.0)
+        base_probability += LISTING_QUALITY_PROBABILITY.get(seller_profile["listing_quality"], 0.0)
         
         return max(0.1, min(0.95, base_probability))
 
@@ -396,8 +466,8 @@ class NegotiationAssistantPro:
         
         return recommendations
 
-    def _identify_negotiation_red_flags(self, car: Car, parsed_listing) -> list:
-        """Identify what to avoid mentioning in negotiation"""
+    def _identify_negotiation_red_flags(self, car: Car, parsed_listing, found: set) -> list:
+        """Identify what to avoid mentioning in negotiation (found: patterns in the listing)"""
         red_flags = []
         
         # If we have parsed listing data, use it
@@ -407,17 +477,8 @@ class NegotiationAssistantPro:
             ])
         
         # General red flags
-        text = f"{car.title} {car.description}".lower() if car.description else car.title.lower()
-        
-        sensitive_topics = [
-            ("accident", "Ne pas insister sur l'historique d'accident"),
-            ("réparation", "Éviter de mentionner les réparations nécessaires d'emblée"),
-            ("urgent", "Ne pas exploiter ouvertement l'urgence du vendeur"),
-            ("décès", "Faire preuve de tact concernant les circonstances personnelles")
-        ]
-        
-        for topic, advice in sensitive_topics:
-            if topic in text:
+        for topic, advice in self.sensitive_topics.items():
+            if topic in found:
                 red_flags.append(advice)
         
         return red_flags
@@ -439,8 +500,8 @@ class NegotiationAssistantPro:
                 leverage_points.append("Description peu détaillée ou crédible")
         
         # Image-based leverage
-        if car.images:
-            image_count = len(json.loads(car.images))
+        image_count = car.image_count
+        if image_count:
             if image_count < 5:
                 leverage_points.append("Peu de photos disponibles")
         
@@ -478,37 +539,23 @@ class NegotiationAssistantPro:
     def _refine_strategy_with_ai(self, car: Car, strategy: dict) -> dict:
         """Refine strategy using Claude AI"""
         try:
-            prompt = f"""
-            Analysez cette stratégie de négociation pour une voiture française et proposez des améliorations culturellement appropriées:
+            prompt = f"""Voiture: {car.title}
+Prix: {car.price}€
+Type vendeur: {car.seller_type}
 
-            Voiture: {car.title}
-            Prix: {car.price}€
-            Type vendeur: {car.seller_type}
-            
-            Stratégie actuelle:
-            - Psychologie vendeur: {strategy['seller_psychology']['primary_type']}
-            - Probabilité succès: {strategy['success_probability']:.0%}
-            - Approche culturelle: {strategy['cultural_approach']}
-            
-            Améliorez la stratégie en tenant compte:
-            1. Des spécificités culturelles françaises
-            2. De la psychologie du vendeur détectée
-            3. Des meilleures pratiques de négociation automobile
-            
-            Répondez en JSON avec:
-            - improved_approach: approche améliorée
-            - cultural_insights: insights culturels spécifiques
-            - risk_mitigation: stratégies de réduction des risques
-            - success_factors: facteurs clés de succès
-            """
+Stratégie actuelle:
+- Psychologie vendeur: {strategy['seller_psychology']['primary_type']}
+- Probabilité succès: {strategy['success_probability']:.0%}
+- Approche culturelle: {strategy['cultural_approach']}"""
             
             message = self.anthropic_client.messages.create(
                 model="claude-3-sonnet-20240229",
                 max_tokens=800,
+                system=REFINE_SYSTEM_PROMPT,
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            ai_improvements = json.loads(message.content[0].text)
+            ai_improvements = parse_json_response(message.content[0].text)
             strategy["ai_improvements"] = ai_improvements
             
         except Exception as e:
@@ -516,10 +563,10 @@ class NegotiationAssistantPro:
         
         return strategy
 
-    def save_strategy(self, car: Car, strategy: dict, db: Session) -> str:
-        """Save negotiation strategy to database"""
+    def build_strategy_record(self, car: Car, strategy: dict):
+        """NegotiationStrategy row for a generated strategy (not added to a session)"""
         
-        negotiation_strategy = NegotiationStrategy(
+        return NegotiationStrategy(
             id=str(uuid.uuid4()),
             car_id=car.id,
             strategy_data=strategy,
@@ -529,7 +576,10 @@ class NegotiationAssistantPro:
             success_probability=strategy["success_probability"],
             cultural_approach=strategy["cultural_approach"]
         )
-        
+
+    def save_strategy(self, car: Car, strategy: dict, db: Session) -> str:
+        """Save negotiation strategy to database"""
+        negotiation_strategy = self.build_strategy_record(car, strategy)
         db.add(negotiation_strategy)
         db.commit()
         
@@ -576,7 +626,7 @@ class NegotiationAssistantPro:
         """Get saved negotiation strategy and insights"""
         strategy = db.query(NegotiationStrategy).filter(
             NegotiationStrategy.car_id == car_id
-        ).first()
+        ).order_by(NegotiationStrategy.created_at.desc()).first()
         
         if not strategy:
             return {"message": "No negotiation strategy found"}
@@ -2,12 +2,16 @@ import json
 import requests
 from datetime import datetime, timedelta
 import base64
+from concurrent.futures import ThreadPoolExecutor
 import anthropic
 import os
 from sqlalchemy.orm import Session
 from enhanced_database import Car, PhotoAnalysis
+from ai_client import parse_json_response
 import uuid
 
+MAX_PHOTOS = 8  # cost control
+
 class AIPhotoAnalyzer:
     def __init__(self):
         try:
@@ -45,7 +49,7 @@ class AIPhotoAnalyzer:
         if not car.images:
             return {"error": "No images available"}
         
-        images = json.loads(car.images)
+        images = car.images
         if not images:
             return {"error": "No images in listing"}
         
@@ -55,9 +59,18 @@ class AIPhotoAnalyzer:
         detected_features = []
         honesty_issues = []
         
-        for i, image_url in enumerate(images[:8]):  # Limit to 8 photos for cost control
+        # Each photo is a download plus a Claude call: fetch them concurrently,
+        # results come back in photo order
+        photos = images[:MAX_PHOTOS]
+        with ThreadPoolExecutor(max_workers=len(photos)) as pool:
+            futures = [
+                pool.submit(self._analyze_single_photo, image_url, i + 1, car.title)
+                for i, image_url in enumerate(photos)
+            ]
+        
+        for i, future in enumerate(futures):
             try:
-                photo_analysis = self._analyze_single_photo(image_url, i + 1, car.title)
+                photo_analysis = future.result()
                 analysis_results.append(photo_analysis)
                 
                 # Aggregate condition score
@@ -159,7 +172,7 @@ class AIPhotoAnalyzer:
             )
             
             analysis_text = message.content[0].text
-            analysis = json.loads(analysis_text)
+            analysis = parse_json_response(analysis_text)
             analysis["photo_index"] = photo_index
             analysis["image_url"] = image_url
             
@@ -330,8 +343,12 @@ class AIPhotoAnalyzer:
         """Get saved photo analysis insights for a car"""
         analyses = db.query(PhotoAnalysis).filter(
             PhotoAnalysis.car_id == car_id
-        ).all()
+        ).order_by(PhotoAnalysis.analyzed_at).all()
         
+        return self.summarize_photo_analyses(analyses)
+
+    def summarize_photo_analyses(self, analyses: list) -> dict:
+        """Aggregate a car's PhotoAnalysis rows (oldest first), e.g. an eager-loaded Car.photos"""
         if not analyses:
             return {"message": "No photo analysis available"}
         
@@ -0,0 +1,61 @@
+import asyncio
+import os
+from functools import lru_cache
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+# Response cache for the read-mostly, non user-specific GET endpoints.
+# Redis when REDIS_URL is set (shared by every worker), in-process otherwise.
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_PREFIX = "auto"
+
+def init_response_cache():
+    if REDIS_URL:
+        from fastapi_cache.backends.redis import RedisBackend
+        from redis import asyncio as aioredis
+        backend = RedisBackend(aioredis.from_url(REDIS_URL))
+    else:
+        backend = InMemoryBackend()
+    FastAPICache.init(backend, prefix=CACHE_PREFIX)
+
+def request_key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    """Cache key from the route path and query string.
+
+    The default builder hashes the call kwargs, which include the per-request
+    DB session, so it would never produce a hit.
+    """
+    if request is None:
+        return f"{namespace}:{func.__module__}.{func.__name__}"
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.items()))
+    return f"{namespace}:{request.url.path}?{query}"
+
+async def invalidate(namespace):
+    """Drop every cached response of a namespace"""
+    await FastAPICache.clear(namespace=namespace)
+
+@lru_cache(maxsize=1)
+def sync_redis():
+    from redis import Redis
+    return Redis.from_url(REDIS_URL)
+
+def invalidate_from_job(key_prefix):
+    """Drop cached responses whose key starts with `key_prefix`, from sync job code.
+
+    Jobs run in a thread (BackgroundTasks) or in the arq worker process, where
+    the app's async cache client isn't usable. With Redis the keys are deleted
+    directly; without Redis the jobs run in the API process, next to the
+    in-memory backend.
+    """
+    prefix = f"{CACHE_PREFIX}:{key_prefix}"
+    if REDIS_URL:
+        client = sync_redis()
+        for key in client.scan_iter(match=prefix + "*"):
+            client.delete(key)
+    else:
+        asyncio.run(FastAPICache.get_backend().clear(namespace=prefix))
+
+def invalidate_car_insights(car_id, *namespaces):
+    """Drop one car's cached responses in the given per-car namespaces"""
+    for namespace in namespaces:
+        invalidate_from_job(f"{namespace}:/api/cars/{car_id}/")
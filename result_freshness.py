@@ -0,0 +1,44 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from enhanced_database import (
+    GemScore, PhotoAnalysis, ParsedListing, NegotiationStrategy, VehicleHistory,
+    MarketPulse, SocialSentiment, CarComparison, MaintenancePrediction, InvestmentScore
+)
+
+# A recent result is returned instead of paying for the AI analysis again.
+# TTLs are in hours and can be overridden per feature, e.g. MARKET_PULSE_TTL_HOURS=2
+
+def _ttl(feature: str, default_hours: float) -> timedelta:
+    return timedelta(hours=float(os.getenv(f"{feature.upper()}_TTL_HOURS", default_hours)))
+
+# feature -> (key column, timestamp column, ttl)
+RESULT_FRESHNESS = {
+    "gem": (GemScore.car_id, GemScore.created_at, _ttl("gem", 24)),
+    "photos": (PhotoAnalysis.car_id, PhotoAnalysis.analyzed_at, _ttl("photos", 24 * 7)),
+    "description": (ParsedListing.car_id, ParsedListing.parsed_at, _ttl("description", 24 * 7)),
+    "negotiation": (NegotiationStrategy.car_id, NegotiationStrategy.created_at, _ttl("negotiation", 24)),
+    "vehicle_history": (VehicleHistory.car_id, VehicleHistory.created_at, _ttl("vehicle_history", 24 * 7)),
+    "market_pulse": (MarketPulse.make_model, MarketPulse.created_at, _ttl("market_pulse", 1)),
+    "sentiment": (SocialSentiment.make_model, SocialSentiment.analyzed_at, _ttl("sentiment", 24)),
+    "comparison": (CarComparison.base_car_id, CarComparison.generated_at, _ttl("comparison", 24)),
+    "maintenance": (MaintenancePrediction.car_id, MaintenancePrediction.calculated_at, _ttl("maintenance", 24)),
+    "investment": (InvestmentScore.car_id, InvestmentScore.calculated_at, _ttl("investment", 24)),
+}
+
+# Per-car results full_ai_analysis always writes (photos, VIN history and
+# comparison depend on the listing having images, a VIN or comparables)
+FULL_ANALYSIS_FEATURES = ("gem", "description", "maintenance", "negotiation", "investment")
+
+def fresh_result_stmt(feature: str, key: str):
+    """SELECT 1 ... WHERE key = :key AND ts > now - ttl LIMIT 1"""
+    key_column, ts_column, ttl = RESULT_FRESHNESS[feature]
+    return select(1).where(key_column == key, ts_column > datetime.utcnow() - ttl).limit(1)
+
+def has_fresh_result(db: Session, feature: str, key: str) -> bool:
+    return db.execute(fresh_result_stmt(feature, key)).first() is not None
+
+async def has_fresh_result_async(db: AsyncSession, feature: str, key: str) -> bool:
+    return (await db.execute(fresh_result_stmt(feature, key))).first() is not None
@@ -1,4 +1,3 @@
-import json
 import uuid
 from datetime import datetime, timedelta
 from database import SessionLocal, Car, create_tables
@@ -240,7 +239,7 @@ def create_sample_cars():
                     mileage=car_data["mileage"],
                     fuel_type=car_data["fuel_type"],
                     description=car_data["description"],
-                    images=json.dumps(images),
+                    images=images,
                     url=f"https://www.leboncoin.fr/voitures/{car_id}.htm",
                     seller_type=car_data["seller_type"],
                     department=car_data["department"],
@@ -0,0 +1,38 @@
+import fcntl
+import os
+
+from sqlalchemy import text
+
+from enhanced_database import engine
+
+# Every uvicorn worker runs the startup hook, but the periodic scraper must
+# run in one process only. The first process to take this lock starts the
+# scheduler and holds the lock until it exits. Postgres: a session-level
+# advisory lock, which covers several containers. SQLite (a single host):
+# an exclusive lock on a file.
+SCHEDULER_LOCK_KEY = 724_601  # any constant shared by every process
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", "/tmp/automotive-scheduler.lock")
+
+_held = None  # connection or file keeping the lock for the process lifetime
+
+def acquire_scheduler_lock() -> bool:
+    """True when this process won the lock and should run the scheduler"""
+    global _held
+    if engine.dialect.name == "postgresql":
+        conn = engine.connect()
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SCHEDULER_LOCK_KEY}).scalar()
+        conn.commit()  # the lock outlives the transaction; don't sit idle in one
+        if not acquired:
+            conn.close()
+            return False
+        _held = conn
+        return True
+
+    lock_file = open(SCHEDULER_LOCK_PATH, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _held = lock_file
+    return True
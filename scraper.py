@@ -1,5 +1,4 @@
 import requests
-import json
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -101,7 +100,7 @@ class LeBonCoinScraper:
                 "mileage": int(attributes.get("mileage", 0)) if attributes.get("mileage") else None,
                 "fuel_type": attributes.get("fuel", ""),
                 "description": ad.get("body", ""),
-                "images": json.dumps(images),
+                "images": images,
                 "url": ad.get("url", ""),
                 "seller_type": ad.get("owner", {}).get("type", ""),
                 "department": self.department,
@@ -218,10 +217,10 @@ def create_sample_data():
             "mileage": 65000,
             "fuel_type": "diesel",
             "description": "Véhicule en excellent état, entretien suivi en concession Renault. Non fumeur, toujours garé au garage. Révision faite à 60000 km. Climatisation, GPS, Bluetooth. Contrôle technique OK jusqu'en 2025.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample1.jpg",
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample2.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/sample1",
             "seller_type": "particulier",
             "department": "69",
@@ -237,10 +236,10 @@ def create_sample_data():
             "mileage": 42000,
             "fuel_type": "essence",
             "description": "Première main, carnet d'entretien complet. Garantie constructeur jusqu'en 2024. Jantes alliage, régulateur de vitesse, caméra de recul. Parfait état.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample3.jpg",
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample4.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/sample2",
             "seller_type": "professionnel",
             "department": "69",
@@ -256,10 +255,10 @@ def create_sample_data():
             "mileage": 89000,
             "fuel_type": "diesel",
             "description": "BMW Série 3 en très bon état. Pack M Sport complet, cuir, navigation professional, xDrive (4 roues motrices). Entretien BMW, jamais accidenté. Urgent déménagement.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample5.jpg",
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample6.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/sample3",
             "seller_type": "particulier",
             "department": "69",
@@ -275,9 +274,9 @@ def create_sample_data():
             "mileage": 78000,
             "fuel_type": "essence",
             "description": "Citroën C3 récente, climatisation automatique, écran tactile 7 pouces, radar de recul. Entretien Citroën suivi, factures disponibles.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample7.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/sample4",
             "seller_type": "professionnel",
             "department": "69",
@@ -293,10 +292,10 @@ def create_sample_data():
             "mileage": 95000,
             "fuel_type": "diesel",
             "description": "Golf 7 diesel économique, très fiable. Boîte manuelle 5 vitesses, climatisation, ordinateur de bord. Pneus récents, distribution faite.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample8.jpg",
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample9.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/sample5",
             "seller_type": "particulier",
             "department": "69",
@@ -312,10 +311,10 @@ def create_sample_data():
             "mileage": 56000,
             "fuel_type": "diesel",
             "description": "Mercedes Classe A récente, Business Edition avec GPS, LED, caméra de recul. Garantie Mercedes jusqu'en 2025. État impeccable, première main.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample10.jpg",
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/sample11.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/sample6",
             "seller_type": "professionnel", 
             "department": "69",
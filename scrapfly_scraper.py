@@ -236,7 +236,7 @@ class ScrapflyLeboncoinScraper:
                 "mileage": mileage,
                 "fuel_type": fuel_type,
                 "description": description,
-                "images": json.dumps(images),
+                "images": images,
                 "url": url,
                 "seller_type": seller_type,
                 "department": department,
@@ -284,14 +284,15 @@ class ScrapflyLeboncoinScraper:
             logger.error(f"Error scraping page {page}: {e}")
             return []
     
-    def search_cars(self) -> List[Dict]:
+    def search_cars(self, max_cars: Optional[int] = None) -> List[Dict]:
         """Search for cars across multiple pages"""
+        max_cars = max_cars or self.max_cars
         all_cars = []
         page = 1
         max_pages = 10  # Limit to prevent infinite loops
         consecutive_empty_pages = 0
         
-        while len(all_cars) < self.max_cars and page <= max_pages:
+        while len(all_cars) < max_cars and page <= max_pages:
             logger.info(f"Scraping page {page} (found {len(all_cars)} cars so far)")
             
             page_cars = self.scrape_search_page(page)
@@ -311,8 +312,8 @@ class ScrapflyLeboncoinScraper:
             time.sleep(2)
             
             # Stop if we have enough cars
-            if len(all_cars) >= self.max_cars:
-                all_cars = all_cars[:self.max_cars]
+            if len(all_cars) >= max_cars:
+                all_cars = all_cars[:max_cars]
                 break
         
         logger.info(f"Total cars found: {len(all_cars)}")
@@ -367,12 +368,12 @@ class ScrapflyLeboncoinScraper:
         finally:
             db.close()
     
-    def run(self):
-        """Run the enhanced scraper"""
+    def run(self, max_cars: Optional[int] = None):
+        """Run the enhanced scraper (max_cars overrides the instance default for this run)"""
         logger.info(f"🚗 Starting Scrapfly-enhanced scraper for department {self.department}")
         
         try:
-            cars = self.search_cars()
+            cars = self.search_cars(max_cars)
             
             if cars:
                 self.save_to_database(cars)
@@ -419,10 +420,10 @@ def create_test_data():
             "mileage": 35000,
             "fuel_type": "essence",
             "description": "Clio V en parfait état, première main, carnet d'entretien suivi. Climatisation, Bluetooth, régulateur de vitesse. Contrôle technique OK.",
-            "images": json.dumps([
+            "images": [
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/test1.jpg",
                 "https://images.leboncoin.fr/api/v1/lbcpb1/images/test2.jpg"
-            ]),
+            ],
             "url": "https://www.leboncoin.fr/test1",
             "seller_type": "particulier",
             "department": "69",
@@ -1,14 +1,13 @@
-import json
 import re
 from datetime import datetime, timedelta
-from statistics import mean, median
 from collections import Counter
 import math
 import anthropic
 import os
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import and_, or_
-from enhanced_database import Car, CarComparison, GemScore, ParsedListing
+from enhanced_database import Car, CarComparison
+from ai_client import parse_json_response
 import uuid
 
 class SmartComparisonEngine:
@@ -89,8 +88,9 @@ class SmartComparisonEngine:
         else:
             min_price = max_price = None
         
-        # Build query
-        query = db.query(Car).filter(
+        # Build query; gem score and parsed listing come with each candidate,
+        # the similarity and ranking code reads both for every car
+        query = db.query(Car).options(joinedload(Car.gem), joinedload(Car.parsed)).filter(
             Car.is_active == True,
             Car.id != base_car.id
         )
@@ -114,7 +114,7 @@ class SmartComparisonEngine:
         if base_keywords:
             conditions = []
             for keyword in base_keywords[:3]:  # Use top 3 keywords
-                conditions.append(Car.title.ilike(f"%{keyword}%"))
+                conditions.append(Car.title_lower.like(f"%{keyword}%"))  # keywords are lowercase
             
             if conditions:
                 query = query.filter(or_(*conditions))
@@ -273,8 +273,8 @@ class SmartComparisonEngine:
     def _calculate_condition_similarity(self, car1: Car, car2: Car, db: Session) -> float:
         """Calculate condition similarity based on parsed listings"""
         
-        parsed1 = db.query(ParsedListing).filter(ParsedListing.car_id == car1.id).first()
-        parsed2 = db.query(ParsedListing).filter(ParsedListing.car_id == car2.id).first()
+        parsed1 = car1.parsed
+        parsed2 = car2.parsed
         
         if not parsed1 or not parsed2:
             return 0.5  # Neutral if no data
@@ -343,8 +343,8 @@ class SmartComparisonEngine:
                 comparison["price_advantage"] = "base_better"
         
         # Get gem scores if available
-        base_gem = db.query(GemScore).filter(GemScore.car_id == base_car.id).first()
-        candidate_gem = db.query(GemScore).filter(GemScore.car_id == candidate_car.id).first()
+        base_gem = base_car.gem
+        candidate_gem = candidate_car.gem
         
         if base_gem and candidate_gem:
             gem_diff = candidate_gem.gem_score - base_gem.gem_score
@@ -496,7 +496,7 @@ class SmartComparisonEngine:
 
     def _get_condition_score(self, car: Car, db: Session) -> float:
         """Get condition score from parsed listing"""
-        parsed = db.query(ParsedListing).filter(ParsedListing.car_id == car.id).first()
+        parsed = car.parsed
         
         if not parsed:
             return 0.6  # Neutral default
@@ -516,7 +516,7 @@ class SmartComparisonEngine:
         all_cars_data = []
         
         # Include base car
-        base_gem = db.query(GemScore).filter(GemScore.car_id == base_car.id).first()
+        base_gem = base_car.gem
         all_cars_data.append({
             "car": base_car,
             "gem_score": base_gem.gem_score if base_gem else 50,
@@ -527,7 +527,7 @@ class SmartComparisonEngine:
         # Include similar cars
         for item in similar_cars:
             car = item["car"]
-            gem = db.query(GemScore).filter(GemScore.car_id == car.id).first()
+            gem = car.gem
             all_cars_data.append({
                 "car": car,
                 "gem_score": gem.gem_score if gem else 50,
@@ -634,7 +634,7 @@ class SmartComparisonEngine:
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            return json.loads(message.content[0].text)
+            return parse_json_response(message.content[0].text)
             
         except Exception as e:
             return {"error": f"AI insights failed: {str(e)}"}
@@ -677,12 +677,12 @@ class SmartComparisonEngine:
         
         return recommendation
 
-    def save_comparison(self, base_car: Car, comparison_data: dict, db: Session) -> str:
-        """Save comparison report to database"""
+    def build_comparison_record(self, base_car: Car, comparison_data: dict):
+        """CarComparison row for a generated report (not added to a session)"""
         
         similar_car_ids = [car["id"] for car in comparison_data["similar_cars"]]
         
-        comparison = CarComparison(
+        return CarComparison(
             id=str(uuid.uuid4()),
             base_car_id=base_car.id,
             similar_cars=similar_car_ids,
@@ -690,7 +690,10 @@ class SmartComparisonEngine:
             value_ranking=comparison_data["value_ranking"],
             recommendation_reason=comparison_data["recommendation"]["overall_advice"]
         )
-        
+
+    def save_comparison(self, base_car: Car, comparison_data: dict, db: Session) -> str:
+        """Save comparison report to database"""
+        comparison = self.build_comparison_record(base_car, comparison_data)
         db.add(comparison)
         db.commit()
         
@@ -701,7 +704,7 @@ class SmartComparisonEngine:
         
         comparison = db.query(CarComparison).filter(
             CarComparison.base_car_id == car_id
-        ).first()
+        ).order_by(CarComparison.generated_at.desc()).first()
         
         if not comparison:
             return {"message": "No comparison available"}
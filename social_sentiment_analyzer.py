@@ -1,12 +1,12 @@
 import re
-import json
 import requests
 from datetime import datetime, timedelta
-from statistics import mean
+from statistics import fmean
 import anthropic
 import os
 from sqlalchemy.orm import Session
 from enhanced_database import Car, SocialSentiment
+from ai_client import parse_json_response
 import uuid
 
 class SocialSentimentAnalyzer:
@@ -175,7 +175,7 @@ class SocialSentimentAnalyzer:
         return {
             "total_posts": len(posts),
             "posts": posts,
-            "average_sentiment": mean([p["sentiment"] for p in posts]) if posts else 0,
+            "average_sentiment": fmean(p["sentiment"] for p in posts) if posts else 0,
             "engagement_level": "high" if len(posts) > 80 else "medium" if len(posts) > 40 else "low"
         }
 
@@ -207,8 +207,8 @@ class SocialSentimentAnalyzer:
         
         return {
             "professional_reviews": reviews,
-            "average_score": mean([r["score"] for r in reviews]),
-            "average_sentiment": mean([r["normalized_sentiment"] for r in reviews]),
+            "average_score": fmean(r["score"] for r in reviews),
+            "average_sentiment": fmean(r["normalized_sentiment"] for r in reviews),
             "review_count": len(reviews)
         }
 
@@ -337,7 +337,7 @@ class SocialSentimentAnalyzer:
                 messages=[{"role": "user", "content": prompt}]
             )
             
-            return {"ai_insights": json.loads(message.content[0].text)}
+            return {"ai_insights": parse_json_response(message.content[0].text)}
             
         except Exception as e:
             return {"ai_error": f"AI enhancement failed: {str(e)}"}
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy.orm import defer, joinedload
+from enhanced_database import SessionLocal, Car, GemScore, ParsedListing, MaintenancePrediction, upsert
+from car_models import car_make_model
+from response_cache import invalidate_car_insights
+from result_freshness import has_fresh_result
+from dashboard_summary import refresh_dashboard_summary, invalidate_dashboard_summaries
+from analyzers import (
+    get_gem_detector, get_photo_analyzer, get_description_parser, get_negotiation_assistant,
+    get_vin_decoder, get_market_predictor, get_sentiment_analyzer, get_comparison_engine,
+    get_maintenance_prophet, get_investment_scorer
+)
+
+logger = logging.getLogger(__name__)
+
+# Long-running AI jobs. Each job takes plain ids, opens its own session and
+# loads the car itself, so it can run either in the API process
+# (BackgroundTasks) or in the separate arq worker (worker.py).
+
+def _load_car(db, car_id, *options):
+    car = db.query(Car).options(*options).filter(Car.id == car_id).first()
+    if not car:
+        logger.info("Car %s no longer exists, skipping job", car_id, extra={"car_id": car_id})
+    return car
+
+def analyze_photos(car_id: str):
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if car:
+            get_photo_analyzer().analyze_and_save(car, db)
+    finally:
+        db.close()
+
+def parse_description(car_id: str):
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if car:
+            get_description_parser().parse_and_save(car, db)
+            refresh_dashboard_summary(car, db)
+    finally:
+        db.close()
+
+def analyze_all_active_cars():
+    db = SessionLocal()
+    try:
+        # Run gem detection
+        asyncio.run(get_gem_detector().analyze_all_active_cars(db))
+
+        # Run description parsing for cars without parsed data
+        cars_to_parse = db.query(Car).filter(
+            Car.is_active == True,
+            ~Car.id.in_(db.query(ParsedListing.car_id))
+        ).limit(50).all()
+
+        # Claude calls run concurrently (bounded), results are saved in one commit
+        try:
+            asyncio.run(get_description_parser().parse_and_save_many(cars_to_parse, db, max_concurrency=10))
+        except Exception:
+            db.rollback()
+            logger.exception("Error parsing descriptions")
+
+        # Same for maintenance predictions
+        cars_to_predict = db.query(Car).filter(
+            Car.is_active == True,
+            ~Car.id.in_(db.query(MaintenancePrediction.car_id))
+        ).limit(50).all()
+        try:
+            asyncio.run(get_maintenance_prophet().predict_and_save_many(cars_to_predict, db, max_concurrency=8))
+        except Exception:
+            db.rollback()
+            logger.exception("Error predicting maintenance costs")
+
+        # Gem scores changed across the board; summaries rebuild on next dashboard read
+        invalidate_dashboard_summaries(db)
+    finally:
+        db.close()
+
+def generate_negotiation_strategy(car_id: str):
+    db = SessionLocal()
+    try:
+        # The strategy reads image_count, never the image URLs
+        car = _load_car(db, car_id, defer(Car.images))
+        if car:
+            strategy = get_negotiation_assistant().generate_negotiation_strategy(car, db)
+            strategy_id = get_negotiation_assistant().save_strategy(car, strategy, db)
+            logger.info("Generated negotiation strategy %s for car %s", strategy_id, car_id, extra={"car_id": car_id})
+    finally:
+        db.close()
+
+def build_vehicle_history(car_id: str):
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if car:
+            get_vin_decoder().build_vehicle_history(car, db)
+            logger.info("Built vehicle history for car %s", car_id, extra={"car_id": car_id})
+    except Exception:
+        logger.exception("Error building history for car %s", car_id, extra={"car_id": car_id})
+    finally:
+        db.close()
+
+def analyze_market_pulse(make_model: str):
+    db = SessionLocal()
+    try:
+        pulse = get_market_predictor().analyze_market_pulse(make_model, db)
+        if "error" not in pulse:
+            pulse_id = get_market_predictor().save_market_pulse(make_model, pulse, db)
+            invalidate_dashboard_summaries(db, make_model)
+            logger.info("Analyzed market pulse for %s, saved as %s", make_model, pulse_id)
+    except Exception:
+        logger.exception("Error analyzing market pulse for %s", make_model)
+    finally:
+        db.close()
+
+def analyze_social_sentiment(make_model: str):
+    db = SessionLocal()
+    try:
+        get_sentiment_analyzer().analyze_social_sentiment(make_model, db)
+        invalidate_dashboard_summaries(db, make_model)
+        logger.info("Analyzed social sentiment for %s", make_model)
+    except Exception:
+        logger.exception("Error analyzing sentiment for %s", make_model)
+    finally:
+        db.close()
+
+def generate_comparison(car_id: str):
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if car:
+            comparison = get_comparison_engine().generate_comparison_report(car, db)
+            if "error" not in comparison:
+                comparison_id = get_comparison_engine().save_comparison(car, comparison, db)
+                invalidate_car_insights(car_id, "comparison_insights")
+                logger.info("Generated comparison %s for car %s", comparison_id, car_id, extra={"car_id": car_id})
+    except Exception:
+        logger.exception("Error generating comparison for car %s", car_id, extra={"car_id": car_id})
+    finally:
+        db.close()
+
+def predict_maintenance(car_id: str):
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if car:
+            prediction = get_maintenance_prophet().predict_maintenance_costs(car, db)
+            prediction_id = get_maintenance_prophet().save_maintenance_prediction(car, prediction, db)
+            invalidate_car_insights(car_id, "maintenance_insights")
+            logger.info("Generated maintenance prediction %s for car %s", prediction_id, car_id, extra={"car_id": car_id})
+    except Exception:
+        logger.exception("Error predicting maintenance for car %s", car_id, extra={"car_id": car_id})
+    finally:
+        db.close()
+
+def calculate_investment_grade(car_id: str):
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if car:
+            investment_analysis = get_investment_scorer().calculate_investment_grade(car, db)
+            score_id = get_investment_scorer().save_investment_score(car, investment_analysis, db)
+            invalidate_car_insights(car_id, "investment_insights")
+            logger.info("Generated investment score %s for car %s", score_id, car_id, extra={"car_id": car_id})
+    except Exception:
+        logger.exception("Error calculating investment grade for car %s", car_id, extra={"car_id": car_id})
+    finally:
+        db.close()
+
+# Full analysis steps. Each one runs with its own session (sessions are not
+# thread-safe). Steps with a plain insert return their unsaved rows, which
+# full_ai_analysis adds in one batch per stage; the others write themselves.
+
+def _gem_step(car, db):
+    gem_analysis = get_gem_detector().calculate_gem_score(car, db)
+    # Upsert: a re-run (or a retry) replaces the car's previous score
+    upsert(db, GemScore, {
+        "car_id": car.id,
+        "gem_score": gem_analysis["gem_score"],
+        "reasons": gem_analysis["reasons"],
+        "profit_potential": gem_analysis["profit_potential"],
+        "risk_factors": gem_analysis["risk_factors"],
+        "market_position": gem_analysis["market_position"],
+        "confidence_level": gem_analysis["confidence_level"],
+        "created_at": datetime.utcnow()
+    }, index_elements=["car_id"])
+
+def _description_step(car, db):
+    get_description_parser().parse_and_save(car, db)
+
+def _photo_step(car, db):
+    if car.images:
+        get_photo_analyzer().analyze_and_save(car, db)
+
+def _vin_step(car, db):
+    get_vin_decoder().build_vehicle_history(car, db)
+
+def _market_step(car, db):
+    make_model = car_make_model(car)
+    market_pulse = get_market_predictor().analyze_market_pulse(make_model, db)
+    if "error" not in market_pulse:
+        get_market_predictor().save_market_pulse(make_model, market_pulse, db)
+
+def _sentiment_step(car, db):
+    get_sentiment_analyzer().analyze_social_sentiment(car_make_model(car), db)
+
+def _maintenance_step(car, db):
+    maintenance_prediction = get_maintenance_prophet().predict_maintenance_costs(car, db)
+    return [get_maintenance_prophet().build_prediction_record(car, maintenance_prediction)]
+
+def _negotiation_step(car, db):
+    strategy = get_negotiation_assistant().generate_negotiation_strategy(car, db)
+    return [get_negotiation_assistant().build_strategy_record(car, strategy)]
+
+def _comparison_step(car, db):
+    comparison = get_comparison_engine().generate_comparison_report(car, db)
+    if "error" not in comparison:
+        return [get_comparison_engine().build_comparison_record(car, comparison)]
+
+def _investment_step(car, db):
+    investment_analysis = get_investment_scorer().calculate_investment_grade(car, db)
+    return [get_investment_scorer().build_investment_record(car, investment_analysis)]
+
+# Steps within a stage are independent and run concurrently. The second stage
+# reads what the first one wrote (gem score, parsed description, market pulse
+# and sentiment).
+FULL_ANALYSIS_STAGES = (
+    (_gem_step, _description_step, _photo_step, _vin_step, _market_step, _sentiment_step, _maintenance_step),
+    (_negotiation_step, _comparison_step, _investment_step),
+)
+
+# Result each step writes, checked so a re-run skips steps with a recent result
+STEP_FEATURES = {
+    _gem_step: "gem", _description_step: "description", _photo_step: "photos",
+    _vin_step: "vehicle_history", _market_step: "market_pulse", _sentiment_step: "sentiment",
+    _maintenance_step: "maintenance", _negotiation_step: "negotiation",
+    _comparison_step: "comparison", _investment_step: "investment",
+}
+MAKE_MODEL_FEATURES = ("market_pulse", "sentiment")
+
+def _run_step(step, car_id, force=False):
+    db = SessionLocal()
+    try:
+        # Analyzers read the car's gem score and parsed listing: load them with it
+        car = db.get(Car, car_id, options=[joinedload(Car.gem), joinedload(Car.parsed)])
+        if car is None:  # deleted while the analysis runs
+            logger.info("Car %s no longer exists, skipping %s", car_id, step.__name__, extra={"car_id": car_id})
+            return []
+        feature = STEP_FEATURES[step]
+        key = car_make_model(car) if feature in MAKE_MODEL_FEATURES else car_id
+        if not force and has_fresh_result(db, feature, key):
+            return []
+        pending = step(car, db) or []
+        db.commit()
+        return pending
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def full_ai_analysis(car_id: str, force: bool = False):
+    """Run all AI analyses, each stage's steps in parallel"""
+    db = SessionLocal()
+    try:
+        car = _load_car(db, car_id)
+        if not car:
+            return
+        logger.info("Starting full AI analysis for car %s", car_id, extra={"car_id": car_id})
+
+        # The steps mostly wait on Claude and the database, so threads overlap them well
+        with ThreadPoolExecutor(max_workers=len(FULL_ANALYSIS_STAGES[0])) as pool:
+            for stage in FULL_ANALYSIS_STAGES:
+                futures = [pool.submit(_run_step, step, car_id, force) for step in stage]
+                errors = [future.exception() for future in futures]
+                failed = [error for error in errors if error is not None]
+                if failed:
+                    raise failed[0]
+
+                # One flush and one commit for the stage's new rows
+                pending = [row for future in futures for row in future.result()]
+                db.add_all(pending)
+                db.commit()
+
+        refresh_dashboard_summary(car, db)
+        invalidate_car_insights(car_id, "comparison_insights", "maintenance_insights", "investment_insights")
+        logger.info("Completed full AI analysis for car %s", car_id, extra={"car_id": car_id})
+
+    except Exception:
+        logger.exception("Error in full AI analysis for car %s", car_id, extra={"car_id": car_id})
+        db.rollback()
+        raise  # the arq worker retries it with backoff
+    finally:
+        db.close()
+
+JOBS = {
+    job.__name__: job for job in (
+        analyze_photos, parse_description, analyze_all_active_cars, generate_negotiation_strategy,
+        build_vehicle_history, analyze_market_pulse, analyze_social_sentiment, generate_comparison,
+        predict_maintenance, calculate_investment_grade, full_ai_analysis
+    )
+}
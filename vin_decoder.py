@@ -769,7 +769,7 @@ class VINDecoderHistoryBuilder:
         """Get VIN insights for a specific car"""
         vehicle_history = db.query(VehicleHistory).filter(
             VehicleHistory.car_id == car_id
-        ).first()
+        ).order_by(VehicleHistory.created_at.desc()).first()
         
         if not vehicle_history:
             return {"message": "No VIN analysis available"}
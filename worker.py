@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import os
+
+from arq.connections import RedisSettings
+from arq.worker import Retry, func
+
+from log_config import setup_logging
+from tasks import JOBS
+
+logger = logging.getLogger(__name__)
+
+# Durable worker for the long AI jobs queued by the API when REDIS_URL is set.
+# Run it as its own process:  arq worker.WorkerSettings
+
+MAX_TRIES = int(os.getenv("WORKER_MAX_TRIES", "4"))  # first attempt + 3 retries
+RETRY_BASE_DELAY = 30  # seconds, doubled on every retry
+# The API enqueues these under a fixed per-car job id. arq refuses an id
+# whose result is still stored, so they keep none: a re-run right after
+# one completes must be queued.
+NO_RESULT_JOBS = {"full_ai_analysis"}
+
+def _in_thread(job):
+    """arq jobs are coroutines taking ctx; the analyzers are blocking, so run them in a thread.
+
+    A job that raises is retried with exponential backoff until MAX_TRIES.
+    """
+    async def run(ctx, *args):
+        try:
+            return await asyncio.to_thread(job, *args)
+        except Exception as e:
+            if ctx["job_try"] >= MAX_TRIES:
+                raise
+            delay = RETRY_BASE_DELAY * 2 ** (ctx["job_try"] - 1)
+            logger.warning("Job %s%s failed (%s), retry in %ss", job.__name__, args, e, delay)
+            raise Retry(defer=delay)
+    return run
+
+async def startup(ctx):
+    ctx["log_listener"] = setup_logging()
+
+async def shutdown(ctx):
+    ctx["log_listener"].stop()
+
+class WorkerSettings:
+    functions = [
+        func(_in_thread(job), name=name, keep_result=0 if name in NO_RESULT_JOBS else None)
+        for name, job in JOBS.items()
+    ]
+    redis_settings = RedisSettings.from_dsn(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    max_jobs = int(os.getenv("WORKER_CONCURRENCY", "4"))
+    max_tries = MAX_TRIES
+    job_timeout = int(os.getenv("WORKER_JOB_TIMEOUT", "900"))  # full analysis makes ~10 Claude calls
+    on_startup = startup
+    on_shutdown = shutdown